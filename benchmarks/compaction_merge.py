@@ -0,0 +1,96 @@
+"""Merge throughput of the compaction k-way merge as the number of input files grows.
+
+    python benchmarks/compaction_merge.py [--records 40000] [--files 2,4,8,16,32,64]
+
+The same total number of records is spread over k overlapping SSTables (as after many
+L0 flushes). Each run reads every block once with the block cache bypassed, and merges
+with the heap merge used by compaction and with the previous linear-scan merge.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.sst.compact as sst_compact
+import src.dsa.sst.read as sst_read
+import src.dsa.sst.utility as sst_u
+import src.dsa.sst.write as sst_write
+
+
+def write_files(root: str, file_count: int, total_records: int, key_space: int):
+    writer = sst_write.SortedTableWriter(root)
+    per_file = total_records // file_count
+    file_ids = []
+    for n in range(file_count):
+        keys = sorted(set(f"{random.randrange(key_space):07d}#device-{random.randrange(8)}" for _ in range(per_file)))
+        lsn = f"{n:026d}"
+        records = [(key, {"data": {"temperature": 21.5, "scale": "C", "humidity": 40.0}, "lsn": lsn}) for key in keys]
+        _, file_id = writer.write(0, 10, records)
+        file_ids.append(file_id)
+    # newest file first, as L0 is searched
+    return sorted(file_ids, reverse=True)
+
+
+def open_cursors(reader, folder, file_ids):
+    return [
+        reader.make_cursor(folder, file_id, priority, fill_cache=False) for priority, file_id in enumerate(file_ids)
+    ]
+
+
+def linear_merge(reader, cursors):
+    # the merge compaction used before the heap: scan every cursor for the minimum per record
+    cursors = list(cursors)
+    last_key = None
+    while cursors:
+        min_idx = min(range(len(cursors)), key=lambda i: (cursors[i].current[0], cursors[i].priority))
+        entry = cursors[min_idx].current
+        if entry[0] != last_key:
+            yield entry
+            last_key = entry[0]
+        if not reader.advance_cursor(cursors[min_idx]):
+            cursors.pop(min_idx)
+
+
+def timed(merge, reader, folder, file_ids):
+    cursors = open_cursors(reader, folder, file_ids)
+    start = time.perf_counter()
+    produced = sum(1 for _ in merge(reader, cursors))
+    return produced, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=40000, help="total records across all input files")
+    parser.add_argument("--files", default="2,4,8,16,32,64", help="comma-separated input file counts")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"{'files':>6} {'in':>8} {'out':>8} {'heap rec/s':>12} {'linear rec/s':>13} {'speedup':>8}")
+    for file_count in (int(n) for n in args.files.split(",")):
+        root = tempfile.mkdtemp(prefix="lsm-merge-bench-")
+        try:
+            file_ids = write_files(root, file_count, args.records, args.records)
+            folder = sst_u.level_dir(root, 0)
+            reader = sst_read.SortedTableReader(root)
+
+            records_in = sum(sum(b["record_count"] for b in reader.read_index(folder, fid)) for fid in file_ids)
+            out, heap_secs = timed(sst_compact.merge_cursors, reader, folder, file_ids)
+            _, linear_secs = timed(linear_merge, reader, folder, file_ids)
+            print(
+                f"{file_count:>6} {records_in:>8} {out:>8} {records_in / heap_secs:>12,.0f}"
+                f" {records_in / linear_secs:>13,.0f} {linear_secs / heap_secs:>7.2f}x"
+            )
+            reader.clear_caches()
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
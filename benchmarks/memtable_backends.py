@@ -0,0 +1,78 @@
+"""Insert rate, lookup latency and memory per entry of each memtable backend.
+
+    python benchmarks/memtable_backends.py [--entries 1000,5000,20000] [--skip-levels 3]
+
+Each backend is filled with the same sensor readings in random key order, then every key is
+looked up once in another random order. Bytes per entry are measured with tracemalloc (everything
+the fill allocated and still holds) next to the backend's own `approximate_bytes()` estimate.
+`--skip-levels` is the skip list's starting max_level; it grows with the entries.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.memtable.backends as mt_backends
+
+
+def readings(count: int):
+    keys = [f"customer-{n % 97:03d}#room-{n:07d}" for n in range(count)]
+    random.Random(7).shuffle(keys)
+    # a fresh dict and lsn per reading, the way the controller builds them
+    return [
+        (key, {"temperature": f"{60 + n % 30}.5", "scale": "F", "humidity": str(20 + n % 70)}, f"{n:026d}")
+        for n, key in enumerate(keys)
+    ]
+
+
+def fill(backend: str, entries, skip_levels: int):
+    memtable = mt_backends.for_name(backend, skip_levels=skip_levels)
+    for key, value, lsn in entries:
+        memtable.insert(key, value, lsn)
+    return memtable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", default="1000,5000,20000")
+    parser.add_argument("--skip-levels", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'backend':>13} {'entries':>8} {'inserts/s':>11} {'lookup (us)':>12}"
+        f" {'overhead/entry':>15} {'estimate/entry':>15}"
+    )
+    for count in (int(n) for n in args.entries.split(",")):
+        entries = readings(count)
+        probes = [key for key, _, _ in entries]
+        random.Random(11).shuffle(probes)
+        for backend in mt_backends.MEMTABLE_BACKENDS:
+            start = time.perf_counter()
+            memtable = fill(backend, entries, args.skip_levels)
+            insert_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for key in probes:
+                memtable.search(key)
+            lookup_time = time.perf_counter() - start
+
+            # the readings are allocated up front, so only the backend's own structure is traced
+            tracemalloc.start()
+            traced = fill(backend, entries, args.skip_levels)
+            held, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert traced.entry_count() == count
+
+            print(
+                f"{backend:>13} {count:>8} {count / insert_time:>11,.0f} {lookup_time / count * 1e6:>12.2f}"
+                f" {held / count:>15.0f} {memtable.approximate_bytes() / count:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Time of one large L0-to-L1 compaction, serial vs. split into subcompactions on worker processes.
+
+    python benchmarks/parallel_compaction.py [--records 200000] [--workers 1,2,4]
+
+L1 holds `--records` keys in non-overlapping files; an L0 file with half as many random keys
+is merged into every L1 file it overlaps. With N workers the merge is cut into N key ranges,
+each merged and written by its own process. A warm-up compaction starts the process pool first,
+so the timings leave out process start-up. The outputs are compared record by record.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.sst.compact as sst_compact
+import src.dsa.sst.read as sst_read
+import src.dsa.sst.utility as sst_u
+import src.dsa.sst.write as sst_write
+
+BLOCK_SIZE = 50
+
+
+def value(n: int):
+    return {"data": {"temperature": 21.5, "scale": "C", "humidity": 40.0}, "lsn": f"{n:026d}"}
+
+
+def write_levels(root: str, config: sst_u.SortedTableConfiguration, records: int, seed: int):
+    rng = random.Random(seed)
+    writer = sst_write.SortedTableWriter(root, config)
+    key_space = records * 50
+    l1_keys = sorted({f"{rng.randrange(key_space):08d}#device-1" for _ in range(records)})
+    for i in range(0, len(l1_keys), 10000):
+        writer.write(1, BLOCK_SIZE, [(key, value(1)) for key in l1_keys[i : i + 10000]])
+    # two L0 files: the first warms up the process pool, the second is timed
+    for n in (2, 3):
+        l0_keys = sorted({f"{rng.randrange(key_space):08d}#device-1" for _ in range(records // 2)})
+        writer.write(0, BLOCK_SIZE, [(key, value(n)) for key in l0_keys])
+
+
+def compact(records: int, workers: int):
+    root = tempfile.mkdtemp(prefix="parallel-compaction-")
+    try:
+        levels = {1: sst_u.SortedLevelConfiguration(block_size=BLOCK_SIZE, blocks_per_file=200)}
+        config = sst_u.SortedTableConfiguration(levels=levels, max_level=3)
+        write_levels(root, config, records, seed=1)
+
+        reader = sst_read.SortedTableReader(root)
+        compactor = sst_compact.SortedTableCompactor(
+            root, config, reader, max_subcompactions=workers, min_subcompaction_bytes=64 * 1024
+        )
+        compactor.compact_file(0, compactor.oldest_file_id(0))
+        started = time.perf_counter()
+        _, file_ids = compactor.compact_file(0, compactor.oldest_file_id(0))
+        elapsed = time.perf_counter() - started
+        compactor.close()
+
+        folder = sst_u.level_dir(root, 1)
+        ordered = sorted(file_ids, key=lambda fid: reader.get_key_range(folder, fid)[0])
+        output = [
+            (r["key"], r["value"]["lsn"]) for fid in ordered for r in reader.scan_file(folder, fid, fill_cache=False)
+        ]
+        return elapsed, output, len(file_ids)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}")
+    print(f"{'workers':>7} {'seconds':>8} {'records/s':>10} {'files':>6} {'speed-up':>8} {'same output':>11}")
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(",")):
+        elapsed, output, files = compact(args.records, workers)
+        if baseline is None:
+            baseline = (elapsed, output)
+        speedup = baseline[0] / elapsed
+        same = output == baseline[1]
+        print(f"{workers:>7} {elapsed:>8.2f} {len(output) / elapsed:>10,.0f} {files:>6} {speedup:>7.2f}x {same!s:>11}")
+
+
+if __name__ == "__main__":
+    main()
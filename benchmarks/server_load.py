@@ -0,0 +1,114 @@
+"""Load test of the asyncio network front-end: pipelined requests from a pooled async client.
+
+    python benchmarks/server_load.py [--concurrency 1,16,128] [--seconds 2] [--pool 4] [--keys 5000]
+
+The server runs on its own event loop thread on localhost with a fresh data directory. For each
+concurrency level that many coroutines issue put, get and mixed (half each) requests through one
+`LSMClient` for `--seconds`; `writes/group` is how many puts the server coalesced into each
+WriteBatch.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.demo.client import LSMClient
+from src.demo.controller import LSMController
+from src.demo.server import LSMServer
+from src.demo.versions import LogSequenceIssuer
+
+
+def start_server(ctrl: LSMController):
+    # the server gets its own loop, so the clients' coroutines do not share its CPU time slices
+    loop = asyncio.new_event_loop()
+    server = LSMServer(ctrl, port=0)
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    return server, loop, thread
+
+
+async def workload(client: LSMClient, concurrency: int, seconds: float, keys: int, put_share: float):
+    deadline = time.perf_counter() + seconds
+    done = [0, 0]
+
+    async def worker(n):
+        rng = random.Random(n)
+        while time.perf_counter() < deadline:
+            key = f"0000001#device-{rng.randrange(keys)}"
+            if rng.random() < put_share:
+                await client.put(key, {"temperature": "72.5F", "humidity": "40"})
+                done[0] += 1
+            else:
+                await client.get(key)
+                done[1] += 1
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return done[0] / seconds, done[1] / seconds
+
+
+async def run_all(port: int, args):
+    async with LSMClient(port=port, pool_size=args.pool) as client:
+        for n in range(0, args.keys, 500):
+            await asyncio.gather(
+                *(
+                    client.put(f"0000001#device-{k}", {"temperature": "70F", "humidity": "40"})
+                    for k in range(n, n + 500)
+                )
+            )
+
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            for name, put_share in (("put", 1.0), ("get", 0.0), ("mixed", 0.5)):
+                before = await client.server_stats()
+                puts, gets = await workload(client, concurrency, args.seconds, args.keys, put_share)
+                after = await client.server_stats()
+                groups = after["write_groups"] - before["write_groups"]
+                per_group = (after["writes"] - before["writes"]) / groups if groups else 0
+                print(f"{name:>6} {concurrency:>11} {puts:>10,.0f} {gets:>10,.0f} {per_group:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,16,128")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--pool", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=5000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="server-load-")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(LogSequenceIssuer(), data_path=root, wal_sync_mode="none")
+        server, loop, thread = start_server(ctrl)
+
+        print(f"{'load':>6} {'concurrency':>11} {'puts/s':>10} {'gets/s':>10} {'writes/group':>12}")
+        asyncio.run(run_all(server.port, args))
+
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        ctrl.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
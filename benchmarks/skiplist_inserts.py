@@ -0,0 +1,65 @@
+"""Skip-list insert rate for random, nearly sorted and sorted keys at several memtable sizes.
+
+    python benchmarks/skiplist_inserts.py [--entries 1000,10000,50000] [--start-levels 3]
+
+Sorted keys are what a gateway replaying a customer's devices sends; nearly sorted swaps a
+tenth of the neighbours. Every list starts at `--start-levels` (the old fixed height) and grows
+with its entries; `levels` is the height it ended at. Lookups probe every key in random order.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.dsa.memtable.skip_list import SkipList
+
+VALUE = {"temperature": "72.5", "scale": "F", "humidity": "40"}
+
+
+def key_orders(count: int) -> dict:
+    keys = [f"customer-{n // 50:05d}#device-{n % 50:03d}" for n in range(count)]
+    rng = random.Random(5)
+    nearly = list(keys)
+    for _ in range(count // 10):
+        i = rng.randrange(count - 1)
+        nearly[i], nearly[i + 1] = nearly[i + 1], nearly[i]
+    shuffled = list(keys)
+    rng.shuffle(shuffled)
+    return {"random": shuffled, "nearly sorted": nearly, "sorted": keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", default="1000,10000,50000")
+    parser.add_argument("--start-levels", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'order':>14} {'inserts/s':>11} {'lookup (us)':>12} {'levels':>7}")
+    for count in (int(n) for n in args.entries.split(",")):
+        for order, keys in key_orders(count).items():
+            skip_list = SkipList(max_level=args.start_levels)
+            lsns = [f"{n:026d}" for n in range(count)]
+            start = time.perf_counter()
+            for key, lsn in zip(keys, lsns):
+                skip_list.insert(key, VALUE, lsn)
+            insert_time = time.perf_counter() - start
+
+            probes = random.Random(9).sample(keys, len(keys))
+            start = time.perf_counter()
+            for key in probes:
+                skip_list.search(key)
+            lookup_time = time.perf_counter() - start
+
+            assert skip_list.count() == count
+            print(
+                f"{count:>8} {order:>14} {count / insert_time:>11,.0f} {lookup_time / count * 1e6:>12.2f}"
+                f" {skip_list.max_level + 1:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
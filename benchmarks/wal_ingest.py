@@ -0,0 +1,99 @@
+"""WAL ingest throughput for each sync mode, with one and several concurrent writers.
+
+    python benchmarks/wal_ingest.py [--records 20000] [--threads 1,4,16]
+
+Every mode appends the same sensor records through WriteAheadLog: `none` leaves flushing to
+the OS, `batch` fsyncs every group commit, `interval` fsyncs from a background thread every
+100 ms. Writers share one log, so with several threads appends queued behind a running write
+are committed together - `records/commit` shows how much group commit batched. The previous
+open/append/close JSON-lines writer is timed as a baseline.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.lsm.wal as lsm_w
+
+VALUE = {"temperature": "72.5", "scale": "F", "humidity": "40"}
+
+
+def records(count: int, offset: int):
+    return [(f"{(offset + n) % 5000:07d}#device-{n % 8}", VALUE, f"{offset + n:026d}") for n in range(count)]
+
+
+def run_threads(thread_count: int, total: int, append) -> float:
+    per_thread = total // thread_count
+    batches = [records(per_thread, t * per_thread) for t in range(thread_count)]
+
+    def write(batch):
+        for key, value, lsn in batch:
+            append(key, value, lsn)
+
+    threads = [threading.Thread(target=write, args=(batch,)) for batch in batches]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def bench_wal(root: str, sync_mode: str, thread_count: int, total: int):
+    wal = lsm_w.WriteAheadLog(root, sync_mode=sync_mode)
+    elapsed = run_threads(thread_count, total, wal.append)
+    wal.close()
+    stats = dict(wal.stats)
+    replayed = sum(len(run) for run in wal.records())
+    wal.delete()
+    assert replayed == (total // thread_count) * thread_count, f"replayed {replayed} records"
+    return elapsed, stats
+
+
+def bench_jsonl(root: str, thread_count: int, total: int) -> float:
+    # the previous writer: open, write one JSON line and close per record, no fsync
+    path = os.path.join(root, "wal.jsonl")
+    lock = threading.Lock()
+
+    def append(key, value, lsn):
+        with lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "value": {"data": value, "lsn": lsn}}) + "\n")
+
+    elapsed = run_threads(thread_count, total, append)
+    os.remove(path)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--threads", default="1,4,16")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="wal-ingest-")
+    try:
+        print(f"{'writer':>16} {'threads':>7} {'records/s':>11} {'records/commit':>14} {'fsyncs':>7}")
+        for thread_count in (int(t) for t in args.threads.split(",")):
+            elapsed = bench_jsonl(root, thread_count, args.records)
+            print(f"{'jsonl open/close':>16} {thread_count:>7} {args.records / elapsed:>11,.0f} {1:>14} {0:>7}")
+            for mode in lsm_w.SYNC_MODES:
+                elapsed, stats = bench_wal(root, mode, thread_count, args.records)
+                per_commit = stats["records"] / max(stats["commits"], 1)
+                print(
+                    f"{mode:>16} {thread_count:>7} {stats['records'] / elapsed:>11,.0f}"
+                    f" {per_commit:>14.1f} {stats['syncs']:>7}"
+                )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
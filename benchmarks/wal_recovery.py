@@ -0,0 +1,88 @@
+"""WAL replay time after a crash with a full memtable.
+
+    python benchmarks/wal_recovery.py [--records 10000,100000] [--keys 5000]
+
+Writes the records into one WAL segment, then replays it into an empty memtable twice: the
+streaming recovery (chunked decode, newest value per key, one sorted bulk load) and the previous
+line-by-line replay of a JSON-lines log (json.loads, build_value and a skip-list insert per record).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.lsm.memtable as lsm_t
+import src.lsm.wal as lsm_w
+
+VALUE = {"temperature": "72.5", "scale": "F", "humidity": "40"}
+
+
+def write_logs(root: str, count: int, key_space: int) -> str:
+    wal = lsm_w.WriteAheadLog(root, sync_mode=lsm_w.SYNC_NONE)
+    jsonl_path = os.path.join(root, "wal.jsonl")
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for n in range(count):
+            key = f"{(n * 7919) % key_space:07d}#device-{n % 8}"
+            lsn = f"{n:026d}"
+            wal.append(key, VALUE, lsn)
+            f.write(json.dumps({"key": key, "value": {"data": VALUE, "lsn": lsn}}) + "\n")
+    wal.close()
+    return jsonl_path
+
+
+def replay_segments(root: str) -> int:
+    memtable = lsm_t.LSMTreeMemtable(max_memtable_count=10**9, data_root_path=root)
+    latest = {}
+    for run in lsm_w.WriteAheadLog(root).records():
+        for key, data, lsn in run:
+            found = latest.get(key)
+            if found is None or found[1] <= lsn:
+                latest[key] = (data, lsn)
+    memtable.load_sorted((key, *latest[key]) for key in sorted(latest))
+    return memtable.get_current().count()
+
+
+def replay_jsonl(root: str, path: str) -> int:
+    memtable = lsm_t.LSMTreeMemtable(max_memtable_count=10**9, data_root_path=root)
+    mt = memtable.get_current()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            value = mt.build_value(record["value"])
+            mt.insert(record["key"], value.data, value.lsn)
+    return mt.count()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", default="10000,100000")
+    parser.add_argument("--keys", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'records':>9} {'jsonl (s)':>10} {'segments (s)':>13} {'speedup':>8}")
+    for count in (int(r) for r in args.records.split(",")):
+        root = tempfile.mkdtemp(prefix="wal-recovery-")
+        try:
+            jsonl_path = write_logs(root, count, args.keys)
+            old, old_keys = timed(replay_jsonl, root, jsonl_path)
+            new, new_keys = timed(replay_segments, root)
+            assert old_keys == new_keys, f"{old_keys} != {new_keys} keys restored"
+            print(f"{count:>9} {old:>10.3f} {new:>13.3f} {old / new:>7.1f}x")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
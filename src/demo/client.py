@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import src.dsa.sst.utility as sst_u
+import src.demo.protocol as proto
+
+
+class _Connection:
+    # one pipelined connection: any number of requests in flight, matched to responses by id
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._error: Optional[BaseException] = None
+        self._receiver = asyncio.create_task(self._receive())
+
+    @property
+    def inflight(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def closed(self) -> bool:
+        return self._error is not None
+
+    async def request(self, payload: List[Any]) -> Any:
+        if self._error is not None:
+            raise ConnectionError(f"connection is closed: {self._error}")
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        try:
+            self._writer.write(proto.encode_frame(request_id, payload))
+            await self._writer.drain()
+        except BaseException:
+            self._waiting.pop(request_id, None)
+            raise
+
+        status, result = await future
+        if status != proto.STATUS_OK:
+            raise proto.ServerError(result)
+        return result
+
+    async def close(self):
+        self._receiver.cancel()
+        await asyncio.gather(self._receiver, return_exceptions=True)
+        self._writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self._writer.wait_closed()
+
+    async def _receive(self):
+        try:
+            while True:
+                frame = await proto.read_frame(self._reader)
+                if frame is None:
+                    raise ConnectionError("server closed the connection")
+                request_id, response = frame
+                future = self._waiting.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except BaseException as exc:
+            self._error = exc
+            # every request still waiting fails with the connection
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"connection lost: {exc!r}"))
+            self._waiting.clear()
+            if not isinstance(exc, Exception):
+                raise
+
+
+class LSMClient:
+    """Async client for `LSMServer` with a pool of pipelined connections.
+
+    Each request goes to the open connection with the fewest requests in flight, so many
+    coroutines can share a small pool - e.g. a load test with thousands of concurrent requests.
+    Use `async with LSMClient(port=...) as client:` or call `connect()` and `close()`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 7070, pool_size: int = 4):
+        self._host = host
+        self._port = port
+        self._pool_size = pool_size
+        self._pool: List[_Connection] = []
+        self._connecting = asyncio.Lock()
+
+    async def __aenter__(self) -> "LSMClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # ------------------------------------------------------------------
+    # Public interface
+    # ------------------------------------------------------------------
+
+    async def connect(self):
+        # (re)opens connections until the pool is full; closed ones are dropped
+        async with self._connecting:
+            self._pool = [conn for conn in self._pool if not conn.closed]
+            while len(self._pool) < self._pool_size:
+                reader, writer = await asyncio.open_connection(self._host, self._port)
+                self._pool.append(_Connection(reader, writer))
+
+    async def close(self):
+        pool, self._pool = self._pool, []
+        await asyncio.gather(*(conn.close() for conn in pool), return_exceptions=True)
+
+    async def get(self, key: str) -> Any:
+        # the key's data, or None when it is absent or deleted
+        return await self._request(proto.OP_GET, key)
+
+    async def multi_get(self, keys: List[str]) -> List[Any]:
+        return await self._request(proto.OP_MULTI_GET, list(keys))
+
+    async def put(self, key: str, data: Any) -> None:
+        await self._request(proto.OP_PUT, key, data)
+
+    async def delete(self, key: str) -> None:
+        await self._request(proto.OP_DELETE, key)
+
+    async def scan(
+        self, start: str = None, end: str = None, limit: int = None, reverse: bool = False
+    ) -> List[Tuple[str, Any]]:
+        rows = await self._request(proto.OP_SCAN, start, end, limit, reverse)
+        return [(key, data) for key, data in rows]
+
+    async def prefix_scan(self, prefix: str, limit: int = None, reverse: bool = False) -> List[Tuple[str, Any]]:
+        return await self.scan(prefix or None, sst_u.prefix_end(prefix), limit, reverse)
+
+    async def server_stats(self) -> dict:
+        return await self._request(proto.OP_STATS)
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    async def _request(self, op: str, *args) -> Any:
+        if not self._pool or any(conn.closed for conn in self._pool):
+            await self.connect()
+        conn = min(self._pool, key=lambda c: c.inflight)
+        return await conn.request([op, *args])
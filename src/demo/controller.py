@@ -1,59 +1,191 @@
-import json
-import os
 from typing import List
 
+import src.lsm.batch as lsm_b
 import src.lsm.memtable as lsm_t
 import src.lsm.search as lsm_s
 import src.lsm.compact as lsm_c
+import src.lsm.scheduler as lsm_sched
 import src.lsm.wal as lsm_w
+import src.lsm.write_queue as lsm_wq
 
+import src.dsa.sst.manifest as sst_manifest
+import src.dsa.sst.read as sst_read
 import src.dsa.sst.utility as sst_u
 import src.demo.utility as util
 from src.demo.versions import LogSequenceIssuer
 
 
 class LSMController:
-    def __init__(self, lsn_issuer: LogSequenceIssuer, data_path: str = None):
+    def __init__(
+        self,
+        lsn_issuer: LogSequenceIssuer,
+        data_path: str = None,
+        use_mmap: bool = False,
+        background_compaction: bool = True,
+        background_flush: bool = True,
+        wal_sync_mode: str = lsm_w.SYNC_INTERVAL,
+        memtable_backend: str = "skiplist",
+        max_subcompactions: int = 1,
+    ):
         self._data_path = data_path or util.data_root_path()
 
-        self._mt = lsm_t.LSMTreeMemtable(max_memtable_count=100, data_root_path=self._data_path)
-        self._compactor = lsm_c.LSMTreeCompator(data_root_path=self._data_path)
-        self._wal = lsm_w.WriteAheadLog(self._data_path)
+        # the MANIFEST is the source of live files; one reader shared by flush, compaction and
+        # search so its caches and the current version stay coherent
+        self._manifest = sst_manifest.SortedTableManifest(self._data_path)
+        self._reader = sst_read.SortedTableReader(self._data_path, manifest=self._manifest, use_mmap=use_mmap)
+        self._manifest.recover(self._reader)
+
+        # leveled L0..L3: L1 holds 64 KiB of data files, each deeper level 10x more; SSTables are
+        # fsynced before they are installed unless the WAL is left unsynced too
+        self._sst_config = sst_u.SortedTableConfiguration(
+            levels={}, max_level=3, sync_files=wal_sync_mode != lsm_w.SYNC_NONE
+        )
+        # flushes at 1 MiB of memtable memory or 100 entries, whichever comes first
+        self._mt = lsm_t.LSMTreeMemtable(
+            max_memtable_count=100,
+            max_memtable_bytes=1024 * 1024,
+            data_root_path=self._data_path,
+            reader=self._reader,
+            sst_config=self._sst_config,
+            memtable_backend=memtable_backend,
+        )
+        # merges of 2 MiB and more are split into key ranges run on up to max_subcompactions processes
+        self._compactor = lsm_c.LSMTreeCompator(
+            data_root_path=self._data_path,
+            reader=self._reader,
+            config=self._sst_config,
+            max_subcompactions=max_subcompactions,
+        )
+        # one open log; concurrent appends share a write (and fsync, per wal_sync_mode)
+        # segments below the MANIFEST's log number are already in L0 files and are never replayed
+        self._wal = lsm_w.WriteAheadLog(
+            self._data_path, sync_mode=wal_sync_mode, min_log_number=self._manifest.current().log_number
+        )
         self._lsns = lsn_issuer
+        # every write goes through one queue: one group at a time makes room, takes an LSN range,
+        # commits to the WAL and applies to the memtable, so concurrent writers never interleave
+        self._writes = lsm_wq.WriteQueue(self._apply_writes)
+        self._compactor.remove_orphan_files()
 
-        last_ids = {1: self._compactor.newest_file_id(1)}
         self._sst = lsm_s.LSMTreeSearch(
             memtable=self._mt.get_current(),
             data_root_path=self._data_path,
-            max_sst_levels=1,
-            last_file_ids=last_ids,
+            max_sst_levels=self._sst_config.max_level,
+            reader=self._reader,
+            memtables=self._mt,
         )
 
-    def save(self, customer_id: str, sensor_input: str):
-        # if insert causes a L0 flush
-        flushed_id = self._mt.flush_if_full()
-        if flushed_id is not None:
-            # supply new memtable for writes
-            self._sst.update_memtable(self._mt.get_current())
-            # and consider this new L0 id
-            self._sst.update_last_id(0, flushed_id)
-            # WAL has been persisted to L0; reset it
-            self._wal.delete()
+        # compacts any level over its target on a worker thread; saves and searches never wait for it
+        self._scheduler = lsm_sched.CompactionScheduler(self._compactor)
+        if background_compaction:
+            self._scheduler.start()
+
+        # full memtables are frozen and written to L0 by a flush thread, off the write path
+        self._background_flush = background_flush
+        if background_flush:
+            self._mt.start_flush_worker(self._flushed)
 
-        # save the new
+    def save(self, customer_id: str, sensor_input: str):
+        # room is made by the write queue's leader, never here: a freeze outside the queue could
+        # split a group's WAL records from its memtable apply
         key_value = self._mt.sensor_value(customer_id, sensor_input)
         if key_value is not None:
-            lsn = self._lsns.next_sequence()
-            self._wal.append(key_value[0], key_value[1], lsn)
-            self._mt.get_current().insert(key_value[0], key_value[1], lsn)
+            self._writes.submit(lsm_b.WriteBatch().put(*key_value))
             print(f"inserted: {key_value[0]}")
 
+    def write(self, batch: lsm_b.WriteBatch):
+        # all of the batch or none of it: one WAL record, one LSN range, applied to one memtable
+        if len(batch) == 0:
+            return []
+        return self._writes.submit(batch)
+
+    def _apply_writes(self, batches: List[lsm_b.WriteBatch]) -> List[List[str]]:
+        # the write queue's leader: everything queued since the last group, applied as one
+        self._make_room()
+
+        lsns = self._lsns.next_sequences(sum(len(batch) for batch in batches))
+        groups, offset = [], 0
+        for batch in batches:
+            groups.append(batch.with_sequences(lsns[offset : offset + len(batch)]))
+            offset += len(batch)
+        self._wal.append_group(groups)
+
+        # readers that overlap the apply read again, so they see all of a group or none of it
+        with self._mt.applying() as current:
+            for entries in groups:
+                if len(entries) > 1:
+                    current.apply_sorted(entries)
+                elif entries[0][1] == sst_u.tombstone():
+                    current.delete(entries[0][0], entries[0][2])
+                else:
+                    current.insert(*entries[0])
+            self._mt.set_last_sequence(lsns[-1])
+        return [[key for key, _, _ in entries] for entries in groups]
+
+    def save_batch(self, customer_id: str, sensor_inputs: List[str]):
+        # e.g. a gateway uploading many readings; a reading that fails validation rejects the batch
+        batch = lsm_b.WriteBatch()
+        for sensor_input in sensor_inputs:
+            key_value = self._mt.sensor_value(customer_id, sensor_input)
+            if key_value is None:
+                print("batch rejected")
+                return []
+            batch.put(*key_value)
+        keys = self.write(batch)
+        print(f"inserted {len(keys)} keys in one batch")
+        return keys
+
+    def _make_room(self):
+        # if insert causes a L0 flush
+        if self._background_flush:
+            if self._mt.is_full():
+                # writes continue in a fresh memtable and WAL; the frozen pair waits for the flush thread
+                self._mt.freeze(self._wal.rotate())
+        elif self._mt.is_full():
+            # the flush thread's steps, inline: the frozen memtable's L0 file and the log number past
+            # its segments go into one MANIFEST edit, then the segments are retired
+            wal_segments = self._wal.rotate()
+            flushed_id = self._mt.flush_if_full(wal_segments)
+            # supply new memtable for writes; the new L0 file is already in the MANIFEST version
+            self._sst.update_memtable(self._mt.get_current())
+            self._flushed(flushed_id, wal_segments)
+
     def level_counts(self, memtable_only: bool = False):
-        results = [{"lsm_level": "MT", "key_count": self._mt.get_current().count()}]
+        current = self._mt.get_current()
+        results = [{"lsm_level": "MT", "key_count": current.count(), "memory_bytes": current.approximate_bytes()}]
+        flush_status = self._mt.flush_status()
+        if flush_status["immutable_memtables"]:
+            results.append(
+                {
+                    "lsm_level": "IMM",
+                    "key_count": flush_status["immutable_keys"],
+                    "memory_bytes": flush_status["immutable_bytes"],
+                }
+            )
         if not memtable_only:
             results.extend(self._sst.level_counts())
         for r in results:
-            print(f"{r['lsm_level']} keys = {r['key_count']}")
+            memory = f" ({r['memory_bytes'] / 1024:.1f} KiB)" if "memory_bytes" in r else ""
+            print(f"{r['lsm_level']} keys = {r['key_count']}{memory}")
+        return results
+
+    def stats(self):
+        results = {
+            "filter": self._sst.filter_stats(),
+            "block_cache": self._sst.block_cache_stats(),
+            "table_cache": self._sst.table_cache_stats(),
+            "subcompactions": self._compactor.subcompaction_stats(),
+        }
+        sections = (
+            ("Bloom filter checks:", "filter"),
+            ("Block cache:", "block_cache"),
+            ("Table cache:", "table_cache"),
+            ("Parallel compaction:", "subcompactions"),
+        )
+        for title, section in sections:
+            print(title)
+            for name, value in results[section].items():
+                print(f"  {name} = {value}")
         return results
 
     def memtable_keys(self):
@@ -71,18 +203,65 @@ class LSMController:
             print("exiting truncate")
             return
 
-        util.delete_data_files(self._data_path)
-        self._mt.init_memtable()
-        self._sst.update_memtable(self._mt.get_current())
+        # no write may start, frozen memtables are flushed first, and no compaction may run while its
+        # files are deleted
+        with self._writes.exclusive():
+            self._mt.wait_for_flushes()
+            with self._scheduler.exclusive():
+                # close cached file handles (and the WAL) before their files are deleted
+                self._reader.clear_caches()
+                self._wal.delete()
+                util.delete_data_files(self._data_path)
+                self._manifest.reset()
+                self._mt.init_memtable()
+                self._sst.update_memtable(self._mt.get_current())
 
         self.level_counts()
-        self._wal.delete()
 
     def compact(self):
-        last_id = self._compactor.compact_level_zero(self._sst.get_last_id(1))
-        self._sst.update_last_id(1, last_id)
+        with self._scheduler.exclusive():
+            self._compactor.compact_level_zero()
+            # then push any level over its size target down a level
+            for level, file_id in self._compactor.compact_levels():
+                print(f"compacted L{level} file {file_id} into L{level + 1}")
         self.level_counts()
 
+    def compaction_status(self):
+        status = self._scheduler.status()
+        print(f"Background compaction: {status['state']}")
+        print(f"  running = {status['running']}")
+        print(f"  queued = {status['queued']}")
+        print(f"  completed = {status['completed']}, failed = {status['failed']}")
+        if status["last_error"]:
+            print(f"  last error = {status['last_error']}")
+        return status
+
+    def pause_compaction(self):
+        self._scheduler.pause()
+        print("background compaction paused")
+
+    def resume_compaction(self):
+        self._scheduler.resume()
+        print("background compaction resumed")
+
+    def wait_for_flushes(self):
+        self._mt.wait_for_flushes()
+
+    def close(self):
+        # flush frozen memtables and let an in-flight compaction finish before the process exits;
+        # memtables that would not flush stay in the WAL, which is still closed cleanly
+        try:
+            self._mt.stop_flush_worker()
+        finally:
+            self._scheduler.shutdown(wait=True)
+            self._compactor.close()
+            self._wal.close()
+
+    def _flushed(self, file_id: str, wal_segments: List[int]):
+        # after each flush: the L0 file and log number are in the MANIFEST, so the segments can go
+        self._wal.retire(wal_segments)
+        self._scheduler.notify()
+
     def save_input(self):
         customer_id = input("enter customer-id: ")
         customer_id = (customer_id or "").strip().lower()
@@ -119,10 +298,40 @@ class LSMController:
         key = self._parse_or_input_key(parts).strip()
         return self.search(key)
 
-    def search(self, key):
-        not_found = "__not_found_"
-        result, source = self._sst.search(key)
+    def search(self, key, snapshot=None):
+        result, source = self._sst.search(key, snapshot)
+        return self._report(result, source)
+
+    def get_snapshot(self):
+        # e.g. an export job: its reads see the data as of now while writes carry on
+        return self._sst.get_snapshot()
+
+    def release_snapshot(self, snapshot):
+        self._sst.release_snapshot(snapshot)
+
+    def multi_get_input(self, parts: List[str]):
+        raw = parts[1:] if len(parts) > 1 else input("enter keys separated by spaces: ").split()
+        return self.multi_get([key.strip() for key in raw if key.strip()])
+
+    def multi_get(self, keys: List[str], snapshot=None):
+        # one sorted pass over memtables and SSTables instead of a search per key
+        results = []
+        for key, (result, source) in zip(keys, self._sst.multi_get(keys, snapshot)):
+            print(f"{key}: ", end="")
+            results.append(self._report(result, source))
+        return results
+
+    def lookup(self, keys: List[str], snapshot=None):
+        # multi_get without the console report, e.g. for the network server: each key's data, or
+        # None when it is absent or deleted
+        return [None if result is None else result.data for result, _ in self._sst.multi_get(keys, snapshot)]
 
+    def range_scan(self, start: str = None, end: str = None, limit: int = None, reverse: bool = False, snapshot=None):
+        # scan without the console report: (key, data) for live keys with start <= key < end
+        return [(key, value.data) for key, value in self._sst.scan(start, end, limit, reverse, snapshot)]
+
+    def _report(self, result, source):
+        not_found = "__not_found_"
         if result is None:
             print(not_found)
             return result, source
@@ -142,36 +351,42 @@ class LSMController:
         print(f"{result.data} ({src})")
         return result.data, source
 
+    def scan_input(self, parts: List[str]):
+        prefix = parts[1] if len(parts) > 1 else input("enter key prefix (e.g. customer#): ")
+        limit = util.try_to_int(parts[2]) if len(parts) > 2 else None
+        return self.scan(prefix.strip(), limit)
+
+    def scan(self, prefix: str, limit: int = None, reverse: bool = False, snapshot=None):
+        results = []
+        for key, value in self._sst.prefix_scan(prefix, limit, reverse, snapshot):
+            print(f"{key}: {value.data}")
+            results.append((key, value.data))
+        print(f"{len(results)} keys")
+        return results
+
     def delete_input(self, parts: List[str]):
         deleted_key = self.delete(self._parse_or_input_key(parts))
         print(f"deleted {deleted_key}")
 
     def delete(self, key):
-        lsn = self._lsns.next_sequence()
-        self._wal.append(key, sst_u.tombstone(), lsn)
-        self._mt.get_current().delete(key, lsn)
+        # tombstones fill the memtable too
+        self._writes.submit(lsm_b.WriteBatch().delete(key))
         return key
 
     def restore_memtable_wal(self):
-        if not os.path.exists(self._wal.path):
+        # unflushed segments are decoded a chunk at a time; the newest value of each key is kept
+        latest = {}
+        for run in self._wal.records():
+            for key, data, lsn in run:
+                found = latest.get(key)
+                if found is None or found[1] <= lsn:
+                    latest[key] = (data, lsn)
+        if not latest:
             return
 
-        restored = 0
-        mt = self._mt.get_current()
-        with open(self._wal.path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                record = json.loads(line)
-                key, raw_value = record["key"], record["value"]
-                value = self._mt.get_current().build_value(raw_value)
-                if value.is_tombstoned():
-                    mt.delete(key, value.lsn)
-                else:
-                    mt.insert(key, value.data, value.lsn)
-                restored += 1
-        print(f"restored {mt.count()} memtable keys from WAL")
+        # one sorted run, bulk-loaded without a skip-list descent per record
+        self._mt.load_sorted((key, *latest[key]) for key in sorted(latest))
+        print(f"restored {self._mt.get_current().count()} memtable keys from WAL")
 
     def help(self):
         print("Available commands:")
@@ -179,10 +394,20 @@ class LSMController:
             "  load [count] [customers]  - Bulk demo load. Prompts for number of entries and customers if not provided."
         )
         print("  search [key]              - Search for a key (format: customer#room-device). Prompts if not provided.")
+        print("  mget [key ...]            - Look up several keys at once in one sorted pass over every level.")
+        print(
+            "  scan [prefix] [limit]     - List live keys starting with prefix, merged across memtable and SST levels."
+        )
         print("  delete [key]              - Delete a key from the memtable. Prompts if not provided.")
         print("  input                     - Manually enter a customer-id and sensor data (room-device,temp,humidity).")
         print("  truncate                  - Clear all data files and reset the memtable (prompts for confirmation).")
-        print("  compact                   - Compact L0 SST files into L1.")
+        print(
+            "  compact                   - Compact the oldest L0 SST file into L1, then any level over its size target."
+        )
+        print("  compaction                - Show background compaction state, running and queued jobs.")
+        print("  pause-compaction          - Stop starting background compaction jobs (a running job finishes).")
+        print("  resume-compaction         - Resume background compaction.")
         print("  count                     - Show the number of entries in the memtable and each SST level.")
         print("  memtable                  - List all keys currently in the memtable.")
+        print("  stats                     - Show bloom filter, block cache, file handle and subcompaction statistics.")
         print("  exit                      - Exit the demo.")
@@ -5,9 +5,26 @@ from src.demo.controller import LSMController
 lsns = LogSequenceIssuer()
 ctrl = LSMController(lsns)
 
-args_cmd = {"load": ctrl.load_input, "search": ctrl.search_input, "delete": ctrl.delete_input}
-single_cmd = {"input": ctrl.save_input, "truncate": ctrl.truncate_input, "compact": ctrl.compact}
-show_cmd = {"count": ctrl.level_counts, "memtable": ctrl.memtable_keys}
+args_cmd = {
+    "load": ctrl.load_input,
+    "search": ctrl.search_input,
+    "mget": ctrl.multi_get_input,
+    "scan": ctrl.scan_input,
+    "delete": ctrl.delete_input,
+}
+single_cmd = {
+    "input": ctrl.save_input,
+    "truncate": ctrl.truncate_input,
+    "compact": ctrl.compact,
+    "pause-compaction": ctrl.pause_compaction,
+    "resume-compaction": ctrl.resume_compaction,
+}
+show_cmd = {
+    "count": ctrl.level_counts,
+    "memtable": ctrl.memtable_keys,
+    "stats": ctrl.stats,
+    "compaction": ctrl.compaction_status,
+}
 
 ctrl.restore_memtable_wal()
 
@@ -17,6 +34,7 @@ while True:
     cmds = " ".join(raw.split()).split(" ")
 
     if cmds[0] == "exit":
+        ctrl.close()
         break
 
     if cmds[0] == "help":
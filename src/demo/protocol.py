@@ -0,0 +1,59 @@
+import asyncio
+import json
+import struct
+from typing import Any, Optional, Tuple
+
+# <u32 payload length><u32 request id> followed by the JSON payload - the WAL's framing with the
+# CRC swapped for the id that pairs a response with its request, so a connection can pipeline
+_FRAME = struct.Struct("<II")
+MAX_PAYLOAD_BYTES = 16 * 1024 * 1024
+
+# requests are [op, *args]; responses are [status, result]
+OP_GET = "get"  # [key] -> data or None
+OP_MULTI_GET = "mget"  # [keys] -> [data or None, ...]
+OP_PUT = "put"  # [key, data] -> None
+OP_DELETE = "delete"  # [key] -> None
+OP_SCAN = "scan"  # [start, end, limit, reverse] -> [[key, data], ...]
+OP_STATS = "stats"  # [] -> server counters
+OPS = (OP_GET, OP_MULTI_GET, OP_PUT, OP_DELETE, OP_SCAN, OP_STATS)
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+class ServerError(RuntimeError):
+    # an error response: the request reached the server and failed there
+    pass
+
+
+def encode_frame(request_id: int, payload: Any) -> bytes:
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    if len(body) > MAX_PAYLOAD_BYTES:
+        raise ProtocolError(f"payload of {len(body)} bytes exceeds {MAX_PAYLOAD_BYTES}")
+    return _FRAME.pack(len(body), request_id) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Tuple[int, Any]]:
+    # (request id, payload), or None when the peer closed the connection between frames
+    try:
+        header = await reader.readexactly(_FRAME.size)
+    except asyncio.IncompleteReadError as exc:
+        if exc.partial:
+            raise ProtocolError("connection closed inside a frame header") from exc
+        return None
+
+    length, request_id = _FRAME.unpack(header)
+    if length > MAX_PAYLOAD_BYTES:
+        raise ProtocolError(f"frame of {length} bytes exceeds {MAX_PAYLOAD_BYTES}")
+    try:
+        body = await reader.readexactly(length)
+    except asyncio.IncompleteReadError as exc:
+        raise ProtocolError("connection closed inside a frame") from exc
+    try:
+        return request_id, json.loads(body)
+    except ValueError as exc:
+        raise ProtocolError(f"request {request_id} is not valid JSON") from exc
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import contextlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import src.dsa.sst.utility as sst_u
+import src.demo.protocol as proto
+import src.lsm.batch as lsm_b
+from src.demo.controller import LSMController
+from src.demo.versions import LogSequenceIssuer
+
+
+class LSMServer:
+    """asyncio TCP front-end for an LSMController, speaking the frames of `protocol.py`.
+
+    Each connection pipelines: requests are read as they arrive and answered as they complete,
+    tagged with their request id, up to `max_inflight` at a time. Reads run on a bounded thread
+    pool so the event loop never waits on an SSTable block. Puts and deletes arriving while a
+    write is in flight are coalesced into the next WriteBatch - one WAL record and one memtable
+    pass for the whole group.
+    """
+
+    def __init__(
+        self,
+        controller: LSMController,
+        host: str = "127.0.0.1",
+        port: int = 7070,
+        read_workers: int = 4,
+        max_inflight: int = 128,
+        max_write_batch: int = 256,
+    ):
+        self._ctrl = controller
+        self._host = host
+        self._port = port
+        self._max_inflight = max_inflight
+        self._max_write_batch = max_write_batch
+
+        # at most two reads queued per worker; further reads wait on the event loop, not in the pool
+        self._reads = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="lsm-read")
+        self._read_slots = asyncio.Semaphore(read_workers * 2)
+        # one writer thread: the controller's write queue serializes groups anyway
+        self._writes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lsm-write")
+        self._pending_writes: List[Tuple[str, Any, asyncio.Future]] = []
+        self._writer_task: Optional[asyncio.Task] = None
+
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.stats = {"connections": 0, "requests": 0, "errors": 0, "writes": 0, "write_groups": 0}
+
+    # ------------------------------------------------------------------
+    # Public interface
+    # ------------------------------------------------------------------
+
+    async def start(self) -> int:
+        # returns the bound port - pass port=0 to pick a free one
+        self._server = await asyncio.start_server(self._serve, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+        return self._port
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # closing the sockets ends each connection's read loop; its pending responses still finish
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._writer_task is not None:
+            await asyncio.gather(self._writer_task, return_exceptions=True)
+        self._reads.shutdown(wait=True)
+        self._writes.shutdown(wait=True)
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[asyncio.current_task()] = writer
+        self.stats["connections"] += 1
+        inflight = asyncio.Semaphore(self._max_inflight)
+        responses: Set[asyncio.Task] = set()
+        try:
+            while True:
+                frame = await proto.read_frame(reader)
+                if frame is None:
+                    break
+                # stop reading when max_inflight requests are unanswered - the client's sends back up
+                await inflight.acquire()
+                task = asyncio.create_task(self._respond(writer, inflight, *frame))
+                responses.add(task)
+                task.add_done_callback(responses.discard)
+        except (proto.ProtocolError, ConnectionError):
+            pass
+        finally:
+            await asyncio.gather(*responses, return_exceptions=True)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+            self._connections.pop(asyncio.current_task(), None)
+
+    async def _respond(self, writer: asyncio.StreamWriter, inflight: asyncio.Semaphore, request_id: int, request):
+        self.stats["requests"] += 1
+        try:
+            response = [proto.STATUS_OK, await self._dispatch(request)]
+        except Exception as exc:
+            self.stats["errors"] += 1
+            response = [proto.STATUS_ERROR, f"{type(exc).__name__}: {exc}"]
+        finally:
+            inflight.release()
+
+        if writer.is_closing():
+            return
+        writer.write(proto.encode_frame(request_id, response))
+        with contextlib.suppress(ConnectionError):
+            await writer.drain()
+
+    async def _dispatch(self, request):
+        if not isinstance(request, list) or not request:
+            raise ValueError("a request is [op, *args]")
+        op, args = request[0], request[1:]
+
+        if op == proto.OP_GET:
+            (key,) = args
+            return (await self._read(self._ctrl.lookup, [_as_key(key)]))[0]
+        if op == proto.OP_MULTI_GET:
+            (keys,) = args
+            return await self._read(self._ctrl.lookup, [_as_key(key) for key in keys])
+        if op == proto.OP_SCAN:
+            start, end, limit, reverse = args
+            rows = await self._read(self._ctrl.range_scan, start, end, limit, bool(reverse))
+            return [[key, data] for key, data in rows]
+        if op == proto.OP_PUT:
+            key, data = args
+            if data is None or data == sst_u.tombstone():
+                raise ValueError("put needs a value; use delete to remove a key")
+            return await self._write(_as_key(key), data)
+        if op == proto.OP_DELETE:
+            (key,) = args
+            return await self._write(_as_key(key), sst_u.tombstone())
+        if op == proto.OP_STATS:
+            return dict(self.stats)
+        raise ValueError(f"unknown op {op!r}, expected one of {proto.OPS}")
+
+    async def _read(self, fn, *args):
+        async with self._read_slots:
+            return await asyncio.get_running_loop().run_in_executor(self._reads, fn, *args)
+
+    async def _write(self, key: str, data: Any):
+        future = asyncio.get_running_loop().create_future()
+        self._pending_writes.append((key, data, future))
+        if self._writer_task is None:
+            # started on the next loop iteration, so puts of the same iteration already share its first group
+            self._writer_task = asyncio.create_task(self._write_groups())
+        await future
+
+    async def _write_groups(self):
+        # one group in flight at a time; puts and deletes that arrive meanwhile form the next one
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending_writes:
+                group = self._pending_writes[: self._max_write_batch]
+                del self._pending_writes[: self._max_write_batch]
+
+                # a key written twice in one group keeps its last write, as if applied in arrival order
+                batch = lsm_b.WriteBatch()
+                for key, data, _ in group:
+                    if data == sst_u.tombstone():
+                        batch.delete(key)
+                    else:
+                        batch.put(key, data)
+
+                try:
+                    await loop.run_in_executor(self._writes, self._ctrl.write, batch)
+                    error = None
+                except Exception as exc:
+                    error = exc
+                self.stats["writes"] += len(group)
+                self.stats["write_groups"] += 1
+                for _, _, future in group:
+                    if future.done():
+                        continue
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+        finally:
+            self._writer_task = None
+
+
+def _as_key(key) -> str:
+    if not isinstance(key, str) or not key:
+        raise ValueError(f"keys are non-empty strings, got {key!r}")
+    return key
+
+
+async def _run(args):
+    # the controller reports recovery on stdout; the server keeps it quiet
+    with contextlib.redirect_stdout(io.StringIO()):
+        ctrl = LSMController(LogSequenceIssuer(), data_path=args.data_path, wal_sync_mode=args.wal_sync_mode)
+        ctrl.restore_memtable_wal()
+    server = LSMServer(ctrl, args.host, args.port, read_workers=args.read_workers)
+    port = await server.start()
+    print(f"LSM server listening on {args.host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+        ctrl.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the LSM store over TCP (python -m src.demo.server)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    parser.add_argument("--data-path", default=None)
+    parser.add_argument("--read-workers", type=int, default=4)
+    parser.add_argument("--wal-sync-mode", default="interval")
+    args = parser.parse_args()
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
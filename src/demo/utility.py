@@ -72,11 +72,11 @@ def data_root_path():
 
 
 def delete_data_files(parent_directory):
-    extension = ".jsonl"
+    extensions = (".jsonl", ".sst", ".filter", ".log")
 
     for dirname, _, files in os.walk(parent_directory):
         for file in files:
-            if file.lower().endswith(extension.lower()):
+            if file.lower().endswith(extensions):
                 file_path = os.path.join(dirname, file)
                 try:
                     os.remove(file_path)
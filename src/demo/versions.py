@@ -1,10 +1,24 @@
+import threading
 import ulid
 from datetime import datetime
 
 
 class LogSequenceIssuer:
+    def __init__(self):
+        # ULIDs minted in the same millisecond have random low bits; each new one is kept above the
+        # last, so a snapshot's sequence orders after every write issued before it
+        self._lock = threading.Lock()
+        self._last = 0
+
     def next_sequence(self):
-        return f"{ulid.ULID()}"
+        return self.next_sequences(1)[0]
+
+    def next_sequences(self, count: int):
+        # a contiguous range: consecutive values of one ULID, so they sort together and in order
+        with self._lock:
+            first = max(int(ulid.ULID()), self._last + 1)
+            self._last = first + count - 1
+        return [f"{ulid.ULID.from_int(first + n)}" for n in range(count)]
 
     def sequence_datetime(self, lsn: str):
         dt: datetime = ulid.ULID.from_str(lsn).datetime
@@ -0,0 +1,74 @@
+from typing import Any, Iterable, Iterator, List, Optional, Protocol, Tuple
+
+from src.dsa.memtable.skip_list import RecordWriteCallback, RetainCallback, SkipList, SkipListNode
+from src.dsa.memtable.sorted_array import SortedArrayMemtable
+
+
+class MemtableEntry(Protocol):
+    # one step of Memtable.scan
+    key: str
+
+    def current_value(self) -> SkipListNode.SkipListValue: ...
+
+    def is_tombstoned(self) -> bool: ...
+
+
+class Memtable(Protocol):
+    """What LSMTreeMemtable and LSMTreeSearch need from an in-memory sorted table.
+
+    Values come back as `SkipListValue`s (`data`, `lsn`) whatever the backend stores; deletes are
+    tombstones that count towards `entry_count` but not `count`, and a write older than the
+    stored lsn is skipped. An overwritten value is kept for `value_at` when the backend's
+    `retain(old_lsn, new_lsn)` callback asks for it, until `prune_history` finds it no longer does.
+    """
+
+    name: str
+    block_size: int
+
+    def insert(self, key: str, value: Any, lsn: str) -> None: ...
+
+    def delete(self, key: str, lsn: str) -> None: ...
+
+    def search(self, key: str) -> Optional[SkipListNode.SkipListValue]: ...
+
+    def value_at(self, key: str, sequence: str) -> Optional[SkipListNode.SkipListValue]: ...
+
+    def prune_history(self) -> None: ...
+
+    def search_sorted(self, keys: List[str]) -> List[Optional[SkipListNode.SkipListValue]]: ...
+
+    def apply_sorted(self, entries: Iterable[Tuple[str, Any, str]]) -> None: ...
+
+    def bulk_load(self, entries: Iterable[Tuple[str, Any, str]]) -> None: ...
+
+    def count(self) -> int: ...
+
+    def entry_count(self) -> int: ...
+
+    def approximate_bytes(self) -> int: ...
+
+    def flush_to_level_zero(self, write_records: RecordWriteCallback) -> tuple[str, str]: ...
+
+    def ordered_keys(self) -> Iterator[str]: ...
+
+    def scan(
+        self, start: Optional[str] = None, end: Optional[str] = None, reverse: bool = False
+    ) -> Iterator[MemtableEntry]: ...
+
+    def build_value(self, value: dict) -> SkipListNode.SkipListValue: ...
+
+
+_BACKENDS = {backend.name: backend for backend in (SkipList, SortedArrayMemtable)}
+
+MEMTABLE_BACKENDS = tuple(_BACKENDS)
+
+
+def for_name(
+    name: str, block_size: int = 10, skip_levels: int = 3, retain: Optional[RetainCallback] = None
+) -> Memtable:
+    # a fresh, empty memtable of the named backend
+    if name not in _BACKENDS:
+        raise ValueError(f"unknown memtable backend {name!r}, expected one of {MEMTABLE_BACKENDS}")
+    if name == SkipList.name:
+        return SkipList(max_level=skip_levels, block_size=block_size, retain=retain)
+    return _BACKENDS[name](block_size=block_size, retain=retain)
@@ -1,10 +1,27 @@
 import random
-from typing import List, Optional, Callable, Tuple, Iterable, Any
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import src.dsa.sst.utility as sst_u
 
 
-RecordWriteCallback = Callable[[int, int, Iterable[dict]], Tuple[str, str]]
+RecordWriteCallback = Callable[[int, int, Iterable[Tuple[str, dict]]], Tuple[str, str]]
+# retain(old_lsn, new_lsn): keep the value being overwritten, a snapshot still reads it
+RetainCallback = Callable[[str, str], bool]
+
+
+def approximate_size(value: Any) -> int:
+    # shallow sizes of the value and everything it holds - close enough to budget memory by
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(approximate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def height_for(capacity: int) -> int:
+    # with p=0.5 about log2(n) levels keep a search at O(log n); 3 is the smallest height used
+    return max(3, (max(capacity, 1) - 1).bit_length())
 
 
 class SkipListNode:
@@ -24,6 +41,20 @@ class SkipListNode:
 
         self.forward: List[Optional["SkipListNode"]] = [None] * (level + 1)
 
+    def approximate_bytes(self) -> int:
+        # node, its value object, both __dict__s, the forward list, key, data and lsn
+        value = self._value
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.__dict__)
+            + sys.getsizeof(value)
+            + sys.getsizeof(value.__dict__)
+            + sys.getsizeof(self.forward)
+            + sys.getsizeof(self.key)
+            + approximate_size(value.data)
+            + sys.getsizeof(value.lsn)
+        )
+
     def current_value(self):
         return self._value
 
@@ -37,51 +68,38 @@ class SkipListNode:
         if self._value.lsn > lsn:
             return  # stale write, skip — newer value already applied
 
-        self._value.data = data
-        self._value.lsn = lsn
+        # a fresh value object: a reader holding the previous one never sees half of an update
+        value = self.SkipListValue()
+        value.data = data
+        value.lsn = lsn
+        self._value = value
 
 
 class SkipList:
-    def __init__(self, max_level: int = 3, block_size: int = 10):
+    name = "skiplist"
+
+    def __init__(self, max_level: int = 3, block_size: int = 10, retain: Optional[RetainCallback] = None):
         # root node before all real keys
         self._head = SkipListNode(None, max_level)
         self._level = 0  # highest level currently in use
         self._size = 0  # count of live (non-tombstoned) entries
+        self._entries = 0  # every node, tombstones included
+        self._bytes = 0  # approximate memory held by the nodes
         self.block_size = block_size
+        # the starting height - it grows by one level whenever the entries outgrow 2^(max_level + 1)
         self.max_level = max_level
+        # predecessors of the last written key per level: an ascending write starts from them
+        self._finger: List[SkipListNode] = [self._head] * (max_level + 1)
+        # overwritten (data, lsn) per key, newest first - only those retain() asked to keep
+        self._retain = retain
+        self._history: Dict[str, List[Tuple[Any, str]]] = {}
 
     # ------------------------------------------------------------------
     # Public interface
     # ------------------------------------------------------------------
 
     def insert(self, key: str, value: Any, lsn: str) -> None:
-        update = self._find_update_nodes(key)
-
-        candidate = update[0].forward[0]
-        if candidate is not None and candidate.key == key:
-            # revive the tombstone
-            if candidate.is_tombstoned():
-                self._size += 1
-
-            candidate.apply_value(value, lsn)
-            return
-
-        new_level = self._random_level()
-
-        # levels lazily extend to MAX_LEVEL
-        if new_level > self._level:
-            for i in range(self._level + 1, new_level + 1):
-                update[i] = self._head
-            self._level = new_level
-
-        node = SkipListNode(key, new_level)
-        node.apply_value(value, lsn)
-        for i in range(new_level + 1):
-            # akin to inserting into ordered linked list
-            node.forward[i] = update[i].forward[i]
-            update[i].forward[i] = node
-
-        self._size += 1
+        self._insert_at(self._find_update_nodes(key), key, value, lsn)
 
     def search(self, key):
         node = self._head
@@ -95,35 +113,109 @@ class SkipList:
             return candidate.current_value()
         return None
 
-    def delete(self, key: str, lsn: str) -> Tuple[str, SkipListNode.SkipListValue]:
-        update = self._find_update_nodes(key)
-
-        candidate = update[0].forward[0]
-        if candidate is not None and candidate.key == key:
-            # key exists - decrement size only if it was a live entry
-            if not candidate.is_tombstoned():
-                self._size -= 1
+    def search_sorted(self, keys: List[str]) -> List[Optional[SkipListNode.SkipListValue]]:
+        # search() for ascending keys in one ordered walk: each descent resumes from the previous
+        # key's predecessors, so keys close together cost a few steps each
+        results = []
+        # one height for the whole walk: a write running alongside may raise the list's meanwhile
+        top = self._level
+        fingers = [self._head] * (top + 1)
+        for key in keys:
+            node = self._head
+            for i in range(top, -1, -1):
+                if fingers[i] is not self._head and (node is self._head or fingers[i].key > node.key):
+                    node = fingers[i]
+                while node.forward[i] is not None and node.forward[i].key < key:
+                    node = node.forward[i]
+                fingers[i] = node
+            candidate = node.forward[0]
+            results.append(candidate.current_value() if candidate is not None and candidate.key == key else None)
+        return results
+
+    def value_at(self, key: str, sequence: str) -> Optional[SkipListNode.SkipListValue]:
+        # the newest value written at or before sequence, from the retained history if overwritten since
+        current = self.search(key)
+        if current is None or current.lsn <= sequence:
+            return current
+        for data, lsn in self._history.get(key, ()):
+            if lsn <= sequence:
+                return self.build_value({"data": data, "lsn": lsn})
+        return None
 
-            candidate.apply_value(sst_u.tombstone(), lsn)
+    def prune_history(self) -> None:
+        # drop retained values no live snapshot reads any more, e.g. once the oldest is released.
+        # A key's list is replaced, never trimmed in place, so a lock-free value_at reads either one
+        if self._retain is None:
             return
+        for key, history in list(self._history.items()):
+            newer = self.search(key).lsn
+            kept = []
+            for data, lsn in history:
+                if self._retain(lsn, newer):
+                    kept.append((data, lsn))
+                else:
+                    self._bytes -= approximate_size(data) + sys.getsizeof(lsn)
+                newer = lsn
+            if not kept:
+                del self._history[key]
+            elif len(kept) < len(history):
+                self._history[key] = kept
 
-        # key not present - insert a tombstone node so the delete propagates to SSTables
-        new_level = self._random_level()
-        if new_level > self._level:
-            for i in range(self._level + 1, new_level + 1):
-                update[i] = self._head
-            self._level = new_level
-
-        node = SkipListNode(key, new_level)
-        node.apply_value(sst_u.tombstone(), lsn)
-
-        for i in range(new_level + 1):
-            node.forward[i] = update[i].forward[i]
-            update[i].forward[i] = node
+    def delete(self, key: str, lsn: str) -> Tuple[str, SkipListNode.SkipListValue]:
+        self._delete_at(self._find_update_nodes(key), key, lsn)
+
+    def apply_sorted(self, entries: Iterable[Tuple[str, Any, str]]) -> None:
+        # (key, data, lsn) in ascending key order, deletes carrying the tombstone. The predecessors
+        # found for one key are still left of the next, so each descent resumes from them instead
+        # of the head - neighbouring keys cost a few steps rather than a full search
+        update = [self._head] * (self.max_level + 1)
+        for key, data, lsn in entries:
+            node = self._head
+            for i in range(self._level, -1, -1):
+                start = update[i]
+                if start is not self._head and start.key < key and (node is self._head or start.key > node.key):
+                    node = start
+                while node.forward[i] is not None and node.forward[i].key < key:
+                    node = node.forward[i]
+                update[i] = node
+            if data == sst_u.tombstone():
+                self._delete_at(update, key, lsn)
+            else:
+                self._insert_at(update, key, data, lsn)
+
+    def bulk_load(self, entries: Iterable[Tuple[str, Any, str]]) -> None:
+        # build an empty list from (key, data, lsn) in strictly ascending key order in one pass:
+        # every node is appended after the last node of each of its levels, no search descents
+        if self._head.forward[0] is not None:
+            raise ValueError("bulk_load needs an empty skip list")
+
+        tails = [self._head] * (self.max_level + 1)
+        for key, data, lsn in entries:
+            self._grow_height()
+            while len(tails) <= self.max_level:
+                tails.append(self._head)
+            level = self._random_level()
+            node = SkipListNode(key, level)
+            node.apply_value(data, lsn)
+            for i in range(level + 1):
+                tails[i].forward[i] = node
+                tails[i] = node
+            self._level = max(self._level, level)
+            if not node.is_tombstoned():
+                self._size += 1
+            self._entries += 1
+            self._bytes += node.approximate_bytes()
 
     def count(self) -> int:
         return self._size
 
+    def entry_count(self) -> int:
+        # live entries and tombstones - what the memtable actually holds
+        return self._entries
+
+    def approximate_bytes(self) -> int:
+        return self._bytes
+
     def flush_to_level_zero(self, write_records: RecordWriteCallback) -> tuple[str, str]:
         # walk level-0 linked list and stream records into a new SSTable
         node = self._head.forward[0]
@@ -131,7 +223,7 @@ class SkipList:
         def _records():
             n = node
             while n is not None:
-                yield {"key": n.key, "value": n.current_value().__dict__}
+                yield n.key, n.current_value().__dict__
                 n = n.forward[0]
 
         return write_records(0, self.block_size, _records())
@@ -144,6 +236,21 @@ class SkipList:
                 yield node.key
             node = node.forward[0]
 
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None, reverse: bool = False):
+        # walk nodes with start <= key < end (either bound may be None), tombstones included
+        if not reverse:
+            node = self._last_node_before(start).forward[0] if start is not None else self._head.forward[0]
+            while node is not None and (end is None or node.key < end):
+                yield node
+                node = node.forward[0]
+            return
+
+        # the level-0 chain is singly linked - step back with one predecessor search per node
+        node = self._last_node_before(end)
+        while node is not self._head and (start is None or node.key >= start):
+            yield node
+            node = self._last_node_before(node.key)
+
     def build_value(self, value: dict):
         result = SkipListNode.SkipListValue()
         result.data = value["data"]
@@ -158,16 +265,115 @@ class SkipList:
     # Internal helpers
     # ------------------------------------------------------------------
 
+    def _insert_at(self, update: List[SkipListNode], key: str, value: Any, lsn: str) -> None:
+        candidate = update[0].forward[0]
+        if candidate is not None and candidate.key == key:
+            self._replace_value(candidate, value, lsn)
+            self._finger = self._through(update, candidate)
+            return
+
+        node = self._link_node(update, key, value, lsn)
+
+        self._size += 1
+        self._entries += 1
+        self._bytes += node.approximate_bytes()
+
+    def _delete_at(self, update: List[SkipListNode], key: str, lsn: str) -> None:
+        candidate = update[0].forward[0]
+        if candidate is not None and candidate.key == key:
+            self._replace_value(candidate, sst_u.tombstone(), lsn)
+            self._finger = self._through(update, candidate)
+            return
+
+        # key not present - insert a tombstone node so the delete propagates to SSTables
+        node = self._link_node(update, key, sst_u.tombstone(), lsn)
+
+        # tombstones are not live entries but take memory all the same
+        self._entries += 1
+        self._bytes += node.approximate_bytes()
+
+    def _replace_value(self, node: SkipListNode, data: Any, lsn: str) -> None:
+        current = node.current_value()
+        if current.lsn > lsn:
+            return  # stale write, skip - it must not move the live count either
+        if self._retain is not None and current.lsn < lsn and self._retain(current.lsn, lsn):
+            self._history.setdefault(node.key, []).insert(0, (current.data, current.lsn))
+            self._bytes += approximate_size(current.data) + sys.getsizeof(current.lsn)
+        # a delete of a live entry leaves one less; a write over a tombstone revives it
+        self._size += current.is_tombstoned() - (data == sst_u.tombstone())
+        before = approximate_size(current.data)
+        node.apply_value(data, lsn)
+        self._bytes += approximate_size(node.current_value().data) - before
+
+    def _link_node(self, update: List[SkipListNode], key: str, data: Any, lsn: str) -> SkipListNode:
+        # a new node after update[i] on each of its levels; update then holds the nodes <= key,
+        # which become the finger for the next write
+        self._grow_height()
+        new_level = self._random_level()
+
+        # levels lazily extend to max_level
+        while len(update) <= new_level:
+            update.append(self._head)
+        if new_level > self._level:
+            for i in range(self._level + 1, new_level + 1):
+                update[i] = self._head
+            self._level = new_level
+
+        node = SkipListNode(key, new_level)
+        node.apply_value(data, lsn)
+        for i in range(new_level + 1):
+            # akin to inserting into ordered linked list
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            update[i] = node
+        self._finger = update
+        return node
+
+    def _through(self, update: List[SkipListNode], node: SkipListNode) -> List[SkipListNode]:
+        # update[i] precedes node on each of its levels - step onto it there
+        for i in range(min(len(node.forward), len(update))):
+            update[i] = node
+        return update
+
+    def _grow_height(self) -> None:
+        # keep about log2(n) levels as the list fills, whatever height it started with
+        if self._entries < 1 << (self.max_level + 1):
+            return
+        self.max_level += 1
+        self._head.forward.append(None)
+
     def _find_update_nodes(self, key) -> List[Optional[SkipListNode]]:
         # update[i] = rightmost node at level i whose key < key (or head sentinel)
-        update = [None] * (self.max_level + 1)
+        finger = self._finger
+        last = finger[0]
+        if last is not self._head and last.key < key:
+            following = last.forward[0]
+            if following is None or following.key >= key:
+                # nothing lies between the last written key and this one, on any level: the
+                # last write's predecessors are this key's too - an append skips the descent
+                return finger + [self._head] * (self.max_level + 1 - len(finger))
+
+        # otherwise descend, starting each level from the finger when it is further right
+        update = [self._head] * (self.max_level + 1)
         node = self._head
         for i in range(self._level, -1, -1):
+            if i < len(finger):
+                start = finger[i]
+                if start is not self._head and start.key < key and (node is self._head or start.key > node.key):
+                    node = start
             while node.forward[i] is not None and node.forward[i].key < key:
                 node = node.forward[i]
             update[i] = node
         return update
 
+    def _last_node_before(self, key: Optional[str]) -> SkipListNode:
+        # rightmost node whose key < key (the last node when key is None), or the head sentinel
+        node = self._head
+        for i in range(self._level, -1, -1):
+            while node.forward[i] is not None and (key is None or node.forward[i].key < key):
+                node = node.forward[i]
+        return node
+
     def _random_level(self) -> int:
         level = 0
         # only half of items will advance from level n to n+1
@@ -0,0 +1,286 @@
+import sys
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import src.dsa.sst.utility as sst_u
+from src.dsa.memtable.skip_list import RecordWriteCallback, RetainCallback, SkipListNode, approximate_size
+
+# a list slot per array: the key, data and lsn references of one entry
+_SLOT_BYTES = 3 * 8
+
+
+class SortedArrayEntry:
+    # what scan() yields - built per step, the arrays themselves hold no per-entry objects
+    __slots__ = ("key", "data", "lsn")
+
+    def __init__(self, key: str, data: Any, lsn: str):
+        self.key = key
+        self.data = data
+        self.lsn = lsn
+
+    def current_value(self) -> SkipListNode.SkipListValue:
+        return _make_value(self.data, self.lsn)
+
+    def is_tombstoned(self) -> bool:
+        return self.data == sst_u.tombstone()
+
+
+class SortedArrayMemtable:
+    """Memtable backend of three parallel lists - keys, data and lsns - kept sorted with bisect.
+
+    An entry costs its key, data and lsn objects plus three list slots; there is no node, value
+    object or forward list. Keys greater than every stored key are appended in place. Other new
+    keys wait in a small append buffer (a dict, so lookups stay O(1)) that is spliced into the
+    arrays in one pass once `buffer_limit` keys are waiting.
+
+    Reads may run alongside a write without a lock (LSMTreeMemtable.read_consistent retries one
+    that overlapped it). They take `_keys` first and writers change it last - appends go to the
+    data and lsn lists first, a merge swaps `_keys` in last - so an index found in `_keys` is
+    always in range of the other two lists.
+    """
+
+    name = "sorted_array"
+
+    def __init__(self, block_size: int = 10, buffer_limit: int = 256, retain: Optional[RetainCallback] = None):
+        self._keys: List[str] = []
+        self._data: List[Any] = []
+        self._lsns: List[str] = []
+        # new keys not in the arrays yet -> (data, lsn); never a key the arrays already hold
+        self._buffer: Dict[str, Tuple[Any, str]] = {}
+        self._buffer_limit = buffer_limit
+        # overwritten (data, lsn) per key, newest first - only those retain() asked to keep
+        self._retain = retain
+        self._history: Dict[str, List[Tuple[Any, str]]] = {}
+        self._size = 0  # count of live (non-tombstoned) entries
+        self._bytes = 0  # approximate memory held by the entries
+        self.block_size = block_size
+
+    # ------------------------------------------------------------------
+    # Public interface
+    # ------------------------------------------------------------------
+
+    def insert(self, key: str, value: Any, lsn: str) -> None:
+        self._put(key, value, lsn)
+
+    def delete(self, key: str, lsn: str) -> None:
+        # an absent key still gets a tombstone, so the delete propagates to SSTables
+        self._put(key, sst_u.tombstone(), lsn)
+
+    def search(self, key: str) -> Optional[SkipListNode.SkipListValue]:
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return _make_value(self._data[i], self._lsns[i])
+        found = self._buffer.get(key)
+        return _make_value(*found) if found is not None else None
+
+    def value_at(self, key: str, sequence: str) -> Optional[SkipListNode.SkipListValue]:
+        # the newest value written at or before sequence, from the retained history if overwritten since
+        current = self.search(key)
+        if current is None or current.lsn <= sequence:
+            return current
+        for data, lsn in self._history.get(key, ()):
+            if lsn <= sequence:
+                return _make_value(data, lsn)
+        return None
+
+    def prune_history(self) -> None:
+        # drop retained values no live snapshot reads any more, e.g. once the oldest is released.
+        # A key's list is replaced, never trimmed in place, so a lock-free value_at reads either one
+        if self._retain is None:
+            return
+        for key, history in list(self._history.items()):
+            newer = self.search(key).lsn
+            kept = []
+            for data, lsn in history:
+                if self._retain(lsn, newer):
+                    kept.append((data, lsn))
+                else:
+                    self._bytes -= approximate_size(data) + sys.getsizeof(lsn)
+                newer = lsn
+            if not kept:
+                del self._history[key]
+            elif len(kept) < len(history):
+                self._history[key] = kept
+
+    def search_sorted(self, keys: List[str]) -> List[Optional[SkipListNode.SkipListValue]]:
+        # ascending keys: each bisect starts at the previous key's position
+        stored, data, lsns, buffer = self._keys, self._data, self._lsns, self._buffer
+        results = []
+        lo = 0
+        for key in keys:
+            lo = bisect_left(stored, key, lo)
+            if lo < len(stored) and stored[lo] == key:
+                results.append(_make_value(data[lo], lsns[lo]))
+                continue
+            found = buffer.get(key)
+            results.append(_make_value(*found) if found is not None else None)
+        return results
+
+    def apply_sorted(self, entries: Iterable[Tuple[str, Any, str]]) -> None:
+        # (key, data, lsn) in ascending key order, deletes carrying the tombstone
+        for key, data, lsn in entries:
+            self._put(key, data, lsn)
+
+    def bulk_load(self, entries: Iterable[Tuple[str, Any, str]]) -> None:
+        # fill an empty memtable from (key, data, lsn) in strictly ascending key order
+        if self._keys or self._buffer:
+            raise ValueError("bulk_load needs an empty memtable")
+
+        tombstone = sst_u.tombstone()
+        for key, data, lsn in entries:
+            self._data.append(data)
+            self._lsns.append(lsn)
+            self._keys.append(key)
+            if data != tombstone:
+                self._size += 1
+            self._bytes += _entry_bytes(key, data, lsn)
+
+    def count(self) -> int:
+        return self._size
+
+    def entry_count(self) -> int:
+        # live entries and tombstones
+        return len(self._keys) + len(self._buffer)
+
+    def approximate_bytes(self) -> int:
+        return self._bytes
+
+    def flush_to_level_zero(self, write_records: RecordWriteCallback) -> tuple[str, str]:
+        records = ((key, {"data": data, "lsn": lsn}) for key, data, lsn in self._items())
+        return write_records(0, self.block_size, records)
+
+    def ordered_keys(self) -> Iterator[str]:
+        tombstone = sst_u.tombstone()
+        for key, data, _ in self._items():
+            if data != tombstone:
+                yield key
+
+    def scan(
+        self, start: Optional[str] = None, end: Optional[str] = None, reverse: bool = False
+    ) -> Iterator[SortedArrayEntry]:
+        # entries with start <= key < end (either bound may be None), tombstones included
+        for key, data, lsn in self._items(start, end, reverse):
+            yield SortedArrayEntry(key, data, lsn)
+
+    def build_value(self, value: dict) -> SkipListNode.SkipListValue:
+        return _make_value(value["data"], value["lsn"])
+
+    def __str__(self) -> str:
+        pairs = ", ".join(f"{key!r}: {data!r}" for key, data, _ in self._items())
+        return f"SortedArrayMemtable({{{pairs}}})"
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _put(self, key: str, data: Any, lsn: str) -> None:
+        tombstone = sst_u.tombstone()
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            if self._lsns[i] > lsn:
+                return  # stale write, skip — newer value already applied
+            self._keep_version(key, self._data[i], self._lsns[i], lsn)
+            self._replace(self._data[i], data)
+            self._data[i] = data
+            self._lsns[i] = lsn
+            return
+
+        found = self._buffer.get(key)
+        if found is not None:
+            if found[1] > lsn:
+                return
+            self._keep_version(key, found[0], found[1], lsn)
+            self._replace(found[0], data)
+            self._buffer[key] = (data, lsn)
+            return
+
+        if data != tombstone:
+            self._size += 1
+        self._bytes += _entry_bytes(key, data, lsn)
+        if i == len(keys):
+            # past the last key - ordered ingestion appends and never touches the buffer
+            self._data.append(data)
+            self._lsns.append(lsn)
+            keys.append(key)
+            return
+
+        self._buffer[key] = (data, lsn)
+        if len(self._buffer) >= self._buffer_limit:
+            self._merge_buffer()
+
+    def _keep_version(self, key: str, data: Any, lsn: str, new_lsn: str) -> None:
+        if self._retain is not None and lsn < new_lsn and self._retain(lsn, new_lsn):
+            self._history.setdefault(key, []).insert(0, (data, lsn))
+            self._bytes += approximate_size(data) + sys.getsizeof(lsn)
+
+    def _replace(self, old: Any, new: Any) -> None:
+        tombstone = sst_u.tombstone()
+        self._size += (new != tombstone) - (old != tombstone)
+        self._bytes += approximate_size(new) - approximate_size(old)
+
+    def _merge_buffer(self) -> None:
+        # splice the sorted buffer into fresh lists: one bisect per buffered key and C-level slice
+        # copies for the runs between them, O(n + b log n). Fresh lists rather than in-place inserts,
+        # so a scan already walking the old lists is not shifted under it
+        pending = sorted(self._buffer.items())
+        keys, data, lsns = self._keys, self._data, self._lsns
+        merged_keys, merged_data, merged_lsns = [], [], []
+        prev = 0
+        for key, (value, lsn) in pending:
+            i = bisect_left(keys, key, prev)
+            merged_keys += keys[prev:i]
+            merged_data += data[prev:i]
+            merged_lsns += lsns[prev:i]
+            merged_keys.append(key)
+            merged_data.append(value)
+            merged_lsns.append(lsn)
+            prev = i
+        merged_keys += keys[prev:]
+        merged_data += data[prev:]
+        merged_lsns += lsns[prev:]
+
+        self._data, self._lsns = merged_data, merged_lsns
+        self._keys = merged_keys
+        self._buffer = {}
+
+    def _items(
+        self, start: Optional[str] = None, end: Optional[str] = None, reverse: bool = False
+    ) -> Iterator[Tuple[str, Any, str]]:
+        # (key, data, lsn) in key order: the arrays' range merged with the buffered keys in it
+        keys, data, lsns = self._keys, self._data, self._lsns
+        lo = bisect_left(keys, start) if start is not None else 0
+        hi = bisect_left(keys, end) if end is not None else len(keys)
+        buffered = sorted(
+            (key, value, lsn)
+            for key, (value, lsn) in list(self._buffer.items())
+            if (start is None or key >= start) and (end is None or key < end)
+        )
+
+        if reverse:
+            buffered.reverse()
+            indexes = range(hi - 1, lo - 1, -1)
+        else:
+            indexes = range(lo, hi)
+
+        b = 0
+        for i in indexes:
+            key = keys[i]
+            while b < len(buffered) and (buffered[b][0] > key if reverse else buffered[b][0] < key):
+                yield buffered[b]
+                b += 1
+            yield key, data[i], lsns[i]
+        yield from buffered[b:]
+
+
+def _make_value(data: Any, lsn: str) -> SkipListNode.SkipListValue:
+    # values are materialised on read, the same type the skip list hands out
+    value = SkipListNode.SkipListValue()
+    value.data = data
+    value.lsn = lsn
+    return value
+
+
+def _entry_bytes(key: str, data: Any, lsn: str) -> int:
+    return sys.getsizeof(key) + approximate_size(data) + sys.getsizeof(lsn) + _SLOT_BYTES
@@ -0,0 +1,74 @@
+import hashlib
+import math
+import struct
+from dataclasses import dataclass
+
+
+@dataclass
+class BloomFilterStats:
+    checks: int = 0
+    useful: int = 0
+    false_positives: int = 0
+
+    @property
+    def false_positive_rate(self) -> float:
+        # share of "maybe" answers that turned out to be wrong
+        maybes = self.checks - self.useful
+        return self.false_positives / maybes if maybes else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "checks": self.checks,
+            "useful": self.useful,
+            "false_positives": self.false_positives,
+            "false_positive_rate": round(self.false_positive_rate, 4),
+        }
+
+
+class BloomFilter:
+    # on-disk header: magic, bit count, hash count - followed by the raw bit array
+    _HEADER = struct.Struct("<4sIB")
+    _MAGIC = b"BLM1"
+
+    def __init__(self, bit_count: int, hash_count: int, bits: bytearray = None):
+        self.bit_count = max(bit_count, 64)
+        self.hash_count = hash_count
+        self._bits = bits if bits is not None else bytearray((self.bit_count + 7) // 8)
+
+    @classmethod
+    def for_keys(cls, key_count: int, bits_per_key: int) -> "BloomFilter":
+        # k = bits_per_key * ln(2) minimises the false-positive rate
+        hash_count = min(30, max(1, round(bits_per_key * math.log(2))))
+        return cls(key_count * bits_per_key, hash_count)
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def may_contain(self, key: str) -> bool:
+        for pos in self._positions(key):
+            if not self._bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def to_bytes(self) -> bytes:
+        return self._HEADER.pack(self._MAGIC, self.bit_count, self.hash_count) + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "BloomFilter":
+        magic, bit_count, hash_count = cls._HEADER.unpack_from(raw)
+        if magic != cls._MAGIC:
+            raise ValueError("not a bloom filter file")
+        return cls(bit_count, hash_count, bytearray(raw[cls._HEADER.size :]))
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _positions(self, key: str):
+        # double hashing: g_i(x) = h1(x) + i * h2(x)
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.bit_count
@@ -0,0 +1,250 @@
+import mmap
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Set, Tuple
+
+BlockCacheKey = Tuple[str, str, int]  # (level folder, file_id, block offset)
+
+
+@dataclass
+class BlockCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUBlockCache:
+    """Opened SSTable blocks, evicted least-recently-used first once over a byte budget.
+
+    A block is charged its encoded size on disk - a stable, cheap proxy for its decoded size.
+    """
+
+    def __init__(self, capacity_bytes: int):
+        self._capacity_bytes = capacity_bytes
+        self._used_bytes = 0
+        # values are the format's block objects (DecodedBlock / RestartBlock) with their charge
+        self._blocks: "OrderedDict[BlockCacheKey, Tuple[Any, int]]" = OrderedDict()
+        self._by_file: Dict[Tuple[str, str], Set[int]] = {}
+        self._stats = BlockCacheStats()
+        # searches and background compaction share the cache
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> BlockCacheStats:
+        return self._stats
+
+    def get(self, folder: str, file_id: str, offset: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._blocks.get((folder, file_id, offset))
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            self._blocks.move_to_end((folder, file_id, offset))
+            self._stats.hits += 1
+            return entry[0]
+
+    def put(self, folder: str, file_id: str, offset: int, block: Any, charge: int) -> None:
+        if charge > self._capacity_bytes:
+            return  # would evict everything and still not fit
+
+        key = (folder, file_id, offset)
+        with self._lock:
+            if key in self._blocks:
+                self._used_bytes -= self._blocks[key][1]
+            self._blocks[key] = (block, charge)
+            self._blocks.move_to_end(key)
+            self._by_file.setdefault((folder, file_id), set()).add(offset)
+            self._used_bytes += charge
+
+            while self._used_bytes > self._capacity_bytes:
+                (old_folder, old_file_id, old_offset), (_, old_charge) = self._blocks.popitem(last=False)
+                self._forget(old_folder, old_file_id, old_offset)
+                self._used_bytes -= old_charge
+                self._stats.evictions += 1
+
+    def evict_file(self, folder: str, file_id: str) -> None:
+        with self._lock:
+            for offset in self._by_file.pop((folder, file_id), ()):
+                _, charge = self._blocks.pop((folder, file_id, offset))
+                self._used_bytes -= charge
+                self._stats.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self._by_file.clear()
+            self._used_bytes = 0
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {
+                "blocks": len(self._blocks),
+                "used_bytes": self._used_bytes,
+                "capacity_bytes": self._capacity_bytes,
+                "hits": self._stats.hits,
+                "misses": self._stats.misses,
+                "hit_rate": round(self._stats.hit_rate, 4),
+                "evictions": self._stats.evictions,
+                "invalidations": self._stats.invalidations,
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _forget(self, folder: str, file_id: str, offset: int) -> None:
+        offsets = self._by_file.get((folder, file_id))
+        if offsets is None:
+            return
+        offsets.discard(offset)
+        if not offsets:
+            del self._by_file[(folder, file_id)]
+
+
+@dataclass
+class _OpenTable:
+    file: BinaryIO
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    pins: int = 0
+    retired: bool = False  # evicted or deleted while pinned - close on last release
+
+
+class TableHandleCache:
+    """Bounded LRU pool of open SSTable data files keyed by (level folder, file_id).
+
+    A handle is pinned for the duration of each read, and only unpinned handles are
+    closed on eviction; a handle evicted or invalidated while pinned is closed by the
+    reader that releases it last.
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = max(capacity, 1)
+        self._lock = threading.Lock()
+        self._tables: "OrderedDict[Tuple[str, str], _OpenTable]" = OrderedDict()
+        self._opens = 0
+
+    @contextmanager
+    def open(self, folder: str, file_id: str, path: str) -> Iterator[BinaryIO]:
+        table = self._pin(folder, file_id, path)
+        try:
+            # the seek position is shared, so one reader at a time per handle
+            with table.lock:
+                yield table.file
+        finally:
+            self._unpin(table)
+
+    def close_file(self, folder: str, file_id: str) -> None:
+        with self._lock:
+            table = self._tables.pop((folder, file_id), None)
+            if table is not None:
+                self._retire(table)
+
+    def close_all(self) -> None:
+        with self._lock:
+            while self._tables:
+                _, table = self._tables.popitem(last=False)
+                self._retire(table)
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {"open_files": len(self._tables), "capacity": self._capacity, "opens": self._opens}
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _pin(self, folder: str, file_id: str, path: str) -> _OpenTable:
+        with self._lock:
+            table = self._tables.get((folder, file_id))
+            if table is None:
+                table = _OpenTable(open(path, "rb"))
+                self._tables[(folder, file_id)] = table
+                self._opens += 1
+                self._evict_unpinned()
+            else:
+                self._tables.move_to_end((folder, file_id))
+            table.pins += 1
+            return table
+
+    def _unpin(self, table: _OpenTable) -> None:
+        with self._lock:
+            table.pins -= 1
+            if table.retired and table.pins == 0:
+                table.file.close()
+
+    def _evict_unpinned(self) -> None:
+        # pinned handles are skipped, so the pool may briefly exceed capacity under load
+        for key in list(self._tables):
+            if len(self._tables) <= self._capacity:
+                return
+            if self._tables[key].pins == 0:
+                self._retire(self._tables.pop(key))
+
+    def _retire(self, table: _OpenTable) -> None:
+        table.retired = True
+        if table.pins == 0:
+            table.file.close()
+
+
+class MappedTableCache:
+    """Bounded LRU pool of read-only memory maps of SSTable data files.
+
+    Each immutable file is mapped once and read through zero-copy `memoryview` slices.
+    A map that still has live views (blocks held by the block cache or a cursor) cannot
+    be closed; it is dropped instead and unmapped when its last view is released.
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = max(capacity, 1)
+        self._lock = threading.Lock()
+        self._maps: "OrderedDict[Tuple[str, str], mmap.mmap]" = OrderedDict()
+        self._maps_opened = 0
+
+    def get(self, folder: str, file_id: str, path: str) -> mmap.mmap:
+        with self._lock:
+            mapping = self._maps.get((folder, file_id))
+            if mapping is None:
+                with open(path, "rb") as f:
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[(folder, file_id)] = mapping
+                self._maps_opened += 1
+                while len(self._maps) > self._capacity:
+                    _, old = self._maps.popitem(last=False)
+                    self._unmap(old)
+            else:
+                self._maps.move_to_end((folder, file_id))
+            return mapping
+
+    def close_file(self, folder: str, file_id: str) -> None:
+        with self._lock:
+            mapping = self._maps.pop((folder, file_id), None)
+            if mapping is not None:
+                self._unmap(mapping)
+
+    def close_all(self) -> None:
+        with self._lock:
+            while self._maps:
+                _, mapping = self._maps.popitem(last=False)
+                self._unmap(mapping)
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {"mapped_files": len(self._maps), "capacity": self._capacity, "maps": self._maps_opened}
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _unmap(self, mapping: mmap.mmap) -> None:
+        try:
+            mapping.close()
+        except BufferError:
+            pass  # views still exported - unmapped when the last one is garbage collected
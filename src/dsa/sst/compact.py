@@ -1,51 +1,106 @@
+import heapq
+import itertools
+import multiprocessing
 import os
-from typing import Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, List, Optional, Tuple
 
+import src.dsa.sst.manifest as sst_manifest
 import src.dsa.sst.write as sst_write
 import src.dsa.sst.read as sst_read
 import src.dsa.sst.utility as sst_u
 
 
 class SortedTableCompactor:
-    def __init__(self, root_data_path: str, config: sst_u.SortedTableConfiguration):
+    def __init__(
+        self,
+        root_data_path: str,
+        config: sst_u.SortedTableConfiguration,
+        reader: Optional[sst_read.SortedTableReader] = None,
+        fill_block_cache: bool = False,
+        max_subcompactions: int = 1,
+        min_subcompaction_bytes: int = 1024 * 1024,
+    ):
         self._root_data_path = root_data_path
+        # merge scans read every block once - by default they must not evict hot search blocks
+        self._fill_block_cache = fill_block_cache
+        # a merge of at least 2 * min_subcompaction_bytes of input is cut into up to max_subcompactions
+        # key ranges, each merged and written by a worker process - decode and encode are CPU-bound
+        self._max_subcompactions = max_subcompactions
+        self._min_subcompaction_bytes = min_subcompaction_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.stats = {"parallel_compactions": 0, "subcompactions": 0}
 
         self._config = config
-        self._reader = sst_read.SortedTableReader(self._root_data_path)
-        self._writer = sst_write.SortedTableWriter(self._root_data_path)
+        self._reader = reader or sst_read.SortedTableReader(self._root_data_path)
+        self._writer = sst_write.SortedTableWriter(self._root_data_path, self._config, self._reader)
 
     def compact_level_zero(self, last_l1_id: str) -> Tuple[str, List[str]]:
-        l0_dir = self._level_dir(0)
-        l1_dir = self._level_dir(1)
-        os.makedirs(l1_dir, exist_ok=True)
-
-        merge_l0_id = self._oldest_file_id(0)
+        merge_l0_id = self.oldest_file_id(0)
         if merge_l0_id is None:
-            return None, self._reader.list_file_ids(l1_dir, last_l1_id)
+            return None, self._reader.list_file_ids(self._level_dir(1), last_l1_id)
+        return self.compact_file(0, merge_l0_id, last_l1_id)
+
+    def compact_file(self, level: int, file_id: str, last_next_id: str = sst_u.ulid_max()) -> Tuple[str, List[str]]:
+        # merge one file of `level` with the files it overlaps at level + 1
+        from_dir = self._level_dir(level)
+        to_level = level + 1
+        to_dir = self._level_dir(to_level)
+        os.makedirs(to_dir, exist_ok=True)
 
         # key range from index + last block only - no full file load
-        l0_range = self._reader.get_key_range(l0_dir, merge_l0_id)
-        if l0_range is None:
-            return None, self._reader.list_file_ids(l1_dir, last_l1_id)
+        key_range = self._reader.get_key_range(from_dir, file_id)
+        if key_range is None:
+            return None, self._reader.list_file_ids(to_dir, last_next_id)
 
-        l0_min, l0_max = l0_range
-        # determine which L1 files overlap using index reads only
-        overlapping_file_ids, untouched_file_ids = self._partition_level_files(l1_dir, l0_min, l0_max, last_l1_id)
+        key_min, key_max = key_range
+        # determine which next-level files overlap using index reads only
+        overlapping_file_ids, untouched_file_ids = self._partition_level_files(to_dir, key_min, key_max, last_next_id)
 
         # plan how many output files and where to split, using only index reads
-        split_keys = self._level_key_splits(l0_dir, merge_l0_id, l1_dir, overlapping_file_ids, 1)
+        split_keys = self._level_key_splits(from_dir, file_id, to_dir, overlapping_file_ids, to_level)
+
+        ranges = self._subcompaction_ranges(from_dir, file_id, to_dir, overlapping_file_ids)
+        if len(ranges) > 1:
+            new_file_ids = self._compact_ranges(ranges, from_dir, file_id, to_dir, overlapping_file_ids, split_keys)
+        else:
+            # merge streams block by block - one block per cursor in memory at a time
+            merged = self._merge_records(from_dir, file_id, to_dir, overlapping_file_ids)
+            new_file_ids = self._write_merged(to_level, merged, split_keys)
+
+        return file_id, untouched_file_ids + new_file_ids
+
+    def oldest_file_id(self, level: int) -> Optional[str]:
+        file_ids = self._read_file_ids(level)
+        return sorted(file_ids)[0] if file_ids else None
+
+    def level_file_ids(self, level: int) -> List[str]:
+        return self._read_file_ids(level)
 
-        # merge streams block by block - one block per cursor in memory at a time
-        l1_cfg = self._config.for_level(1)
-        merged = self._merge_records(l0_dir, merge_l0_id, l1_dir, overlapping_file_ids)
-        new_file_ids = self._writer.write_split(1, merged, split_keys, l1_cfg.block_size, l1_cfg.blocks_per_file)
+    def level_bytes(self, level: int) -> int:
+        return sum(meta.data_bytes for meta in self._reader.level_files(level))
 
-        return merge_l0_id, untouched_file_ids + new_file_ids
+    def pick_file(self, level: int, after_key: Optional[str] = None) -> Optional[sst_manifest.SortedFileMeta]:
+        # round-robin over the key space: first file starting after the previous pick, wrapping around
+        files = sorted(self._reader.level_files(level), key=lambda meta: meta.first_key)
+        if not files:
+            return None
+        if after_key is not None:
+            for meta in files:
+                if meta.first_key > after_key:
+                    return meta
+        return files[0]
 
     def newest_file_id(self, level: int) -> Optional[str]:
         file_ids = self._read_file_ids(level)
         return sorted(file_ids, reverse=True)[0] if file_ids else None
 
+    def close(self) -> None:
+        # stops the subcompaction worker processes, if any were started
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
     # ------------------------------------------------------------------
     # Internal helpers
     # ------------------------------------------------------------------
@@ -58,17 +113,18 @@ class SortedTableCompactor:
         file_ids = self._reader.list_file_ids(folder, sst_u.ulid_max())
         return file_ids
 
-    def _oldest_file_id(self, level: int) -> Optional[str]:
-        file_ids = self._read_file_ids(level)
-        return sorted(file_ids)[0] if file_ids else None
-
     def _partition_level_files(
         self, to_directory: str, from_key_min: str, from_key_max: str, last_id: str
     ) -> Tuple[List[str], List[str]]:
         overlapping: List[str] = []
         untouched: List[str] = []
+        level_cfg = self._config.for_level(sst_u.folder_level(to_directory))
 
         for file_id in self._reader.list_file_ids(to_directory, last_id):
+            if not self._reader.read_metadata(to_directory, file_id).record_format.matches(level_cfg):
+                # written under an older format / compression setting - rewrite it in this merge
+                overlapping.append(file_id)
+                continue
             key_range = self._reader.get_key_range(to_directory, file_id)
             if key_range is None:
                 untouched.append(file_id)
@@ -87,21 +143,20 @@ class SortedTableCompactor:
         n = self._config.for_level(to_level).min_files
         if n <= 1:
             return []
+        return _even_splits(self._input_block_keys(from_directory, from_file_id, to_directory, to_file_id), n)
 
-        # collect all block first_keys from input indices
+    def _input_block_keys(
+        self, from_directory: str, from_file_id: str, to_directory: str, to_file_ids: List[str]
+    ) -> List[str]:
+        # collect all block first_keys from input indices, sorted
         all_keys: List[str] = []
         for block in self._reader.read_index(from_directory, from_file_id):
             all_keys.append(block["first_key"])
-        for fid in to_file_id:
+        for fid in to_file_ids:
             for block in self._reader.read_index(to_directory, fid):
                 all_keys.append(block["first_key"])
-
-        if not all_keys:
-            return []
-
         all_keys.sort()
-        # pick n-1 evenly-spaced keys as split boundaries
-        return sorted(set(all_keys[round(i * len(all_keys) / n)] for i in range(1, n)))
+        return all_keys
 
     def _merge_records(
         self,
@@ -109,30 +164,176 @@ class SortedTableCompactor:
         from_file_id: str,
         to_directory: str,
         to_file_ids: List[str],
-    ) -> Iterator[dict]:
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> Iterator[Tuple[str, Any]]:
+        # records with start <= key < end; L0 wins ties over L1 (lower priority value = newer source)
         cursors = []
-
-        c = self._reader.make_cursor(from_directory, from_file_id, 0)
+        c = self._reader.make_cursor(from_directory, from_file_id, 0, self._fill_block_cache, start)
         if c:
             cursors.append(c)
         for fid in to_file_ids:
-            c = self._reader.make_cursor(to_directory, fid, 1)
+            c = self._reader.make_cursor(to_directory, fid, 1, self._fill_block_cache, start)
             if c:
                 cursors.append(c)
 
-        last_key: Optional[str] = None
-        while cursors:
-            # always take the lowest key; L0 wins on tie
-            min_idx = min(
-                range(len(cursors)),
-                key=lambda i: (cursors[i].current["key"], cursors[i].priority),
+        merged = merge_cursors(self._reader, cursors)
+        if end is not None:
+            merged = itertools.takewhile(lambda entry: entry[0] < end, merged)
+        return merged
+
+    def _write_merged(
+        self,
+        to_level: int,
+        merged: Iterator[Tuple[str, Any]],
+        split_keys: List[str],
+        started: Optional[List[str]] = None,
+    ) -> List[str]:
+        to_cfg = self._config.for_level(to_level)
+        if to_level >= self._config.max_level:
+            # nothing older lies below the last level - deletes have done their job
+            merged = (entry for entry in merged if entry[1]["data"] != sst_u.tombstone())
+        return self._writer.write_split(
+            to_level, merged, split_keys, to_cfg.block_size, to_cfg.blocks_per_file, started
+        )
+
+    def _subcompaction_ranges(
+        self, from_directory: str, from_file_id: str, to_directory: str, to_file_ids: List[str]
+    ) -> List[Tuple[Optional[str], Optional[str]]]:
+        # disjoint [start, end) key ranges covering the merge, cut at block first keys of the inputs
+        whole = [(None, None)]
+        if self._max_subcompactions <= 1:
+            return whole
+        input_bytes = self._data_bytes(from_directory, from_file_id)
+        input_bytes += sum(self._data_bytes(to_directory, fid) for fid in to_file_ids)
+        n = min(self._max_subcompactions, input_bytes // max(self._min_subcompaction_bytes, 1))
+        if n <= 1:
+            return whole
+
+        bounds = _even_splits(self._input_block_keys(from_directory, from_file_id, to_directory, to_file_ids), n)
+        edges = [None] + bounds + [None]
+        return list(zip(edges, edges[1:]))
+
+    def _compact_ranges(
+        self,
+        ranges: List[Tuple[Optional[str], Optional[str]]],
+        from_directory: str,
+        from_file_id: str,
+        to_directory: str,
+        to_file_ids: List[str],
+        split_keys: List[str],
+    ) -> List[str]:
+        to_level = sst_u.folder_level(to_directory)
+        pool = self._process_pool()
+        jobs = []
+        for start, end in ranges:
+            # each range starts a new file; split keys inside it still cut its output as usual
+            inner = [key for key in split_keys if (start is None or key > start) and (end is None or key < end)]
+            jobs.append(
+                pool.submit(
+                    _subcompact,
+                    self._root_data_path,
+                    self._config,
+                    from_directory,
+                    from_file_id,
+                    to_directory,
+                    to_file_ids,
+                    start,
+                    end,
+                    inner,
+                )
             )
-            record = cursors[min_idx].current
 
-            if record["key"] != last_key:
-                yield record
-                last_key = record["key"]
-            # else: same key from a lower-priority source - discard
+        written: List[List[str]] = []
+        error = None
+        for job in jobs:
+            try:
+                written.append(job.result())
+            except Exception as exc:
+                error = error or exc
+        if error is not None:
+            # nothing was installed - drop what the other ranges wrote; a failed range has
+            # already removed its own output
+            for file_ids in written:
+                for fid in file_ids:
+                    self._writer.remove_file(to_level, fid)
+            raise error
+
+        self.stats["parallel_compactions"] += 1
+        self.stats["subcompactions"] += len(ranges)
+        # ranges are in key order, so their file lists concatenate into the level's order;
+        # the caller installs them all in one MANIFEST edit
+        new_file_ids = [fid for file_ids in written for fid in file_ids]
+        for fid in new_file_ids:
+            self._reader.file_added(to_directory, fid)
+        return new_file_ids
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        # spawned, not forked: the parent runs flush, compaction and server threads whose locks
+        # a forked child would inherit mid-use
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._max_subcompactions, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _data_bytes(self, folder: str, file_id: str) -> int:
+        return os.path.getsize(self._reader.read_metadata(folder, file_id).record_format.data_path(folder, file_id))
+
+
+def _subcompact(
+    root_data_path: str,
+    config: sst_u.SortedTableConfiguration,
+    from_directory: str,
+    from_file_id: str,
+    to_directory: str,
+    to_file_ids: List[str],
+    start: Optional[str],
+    end: Optional[str],
+    split_keys: List[str],
+) -> List[str]:
+    # one key range of a compaction, run in a worker process with its own reader and writer
+    compactor = SortedTableCompactor(root_data_path, config)
+    to_level = sst_u.folder_level(to_directory)
+    started: List[str] = []
+    try:
+        merged = compactor._merge_records(from_directory, from_file_id, to_directory, to_file_ids, start, end)
+        return compactor._write_merged(to_level, merged, split_keys, started)
+    except BaseException:
+        # the parent installs nothing from a failed range - remove its files, the one cut short included
+        for file_id in started:
+            compactor._writer.remove_file(to_level, file_id)
+        raise
+
+
+def _even_splits(sorted_keys: List[str], n: int) -> List[str]:
+    # n-1 evenly-spaced keys as split boundaries
+    if not sorted_keys:
+        return []
+    return sorted(set(sorted_keys[round(i * len(sorted_keys) / n)] for i in range(1, n)))
+
+
+def merge_cursors(
+    reader: sst_read.SortedTableReader, cursors: List[sst_read.SortedTableCursor]
+) -> Iterator[Tuple[str, Any]]:
+    """Heap k-way merge of sorted cursors into unique (key, value) entries, newest source per key.
+
+    The heap holds one (key, priority, cursor index) tuple per cursor, so each output entry
+    costs O(log k) comparisons instead of a scan over every cursor.
+    """
+    heap = [(c.current[0], c.priority, i) for i, c in enumerate(cursors)]
+    heapq.heapify(heap)
+
+    last_key: Optional[str] = None
+    while heap:
+        key, priority, i = heap[0]
+        cursor = cursors[i]
+        if key != last_key:
+            yield cursor.current
+            last_key = key
+        # else: same key from a lower-priority source - discard
 
-            if not self._reader.advance_cursor(cursors[min_idx]):
-                cursors.pop(min_idx)
+        if reader.advance_cursor(cursor):
+            heapq.heapreplace(heap, (cursor.current[0], priority, i))
+        else:
+            heapq.heappop(heap)
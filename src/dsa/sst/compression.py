@@ -0,0 +1,99 @@
+import bz2
+import lzma
+import zlib
+from collections import Counter
+from typing import Iterable, List
+
+
+class NoCompression:
+    name = "none"
+    codec_id = 0
+
+    def compress(self, raw: bytes) -> bytes:
+        return raw
+
+    def decompress(self, payload: bytes) -> bytes:
+        return payload
+
+
+class ZlibCompression:
+    """zlib (deflate) with an optional preset dictionary shared by every block of a file.
+
+    Blocks are small, so on their own they give deflate little history to match against.
+    A dictionary trained on the file's own records supplies that history up front.
+    """
+
+    name = "zlib"
+    codec_id = 1
+
+    def __init__(self, dictionary: bytes = b"", level: int = 6):
+        self.dictionary = dictionary
+        self._level = level
+
+    def compress(self, raw: bytes) -> bytes:
+        if self.dictionary:
+            compressor = zlib.compressobj(self._level, zdict=self.dictionary)
+        else:
+            compressor = zlib.compressobj(self._level)
+        return compressor.compress(raw) + compressor.flush()
+
+    def decompress(self, payload: bytes) -> bytes:
+        if self.dictionary:
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+
+
+class LzmaCompression:
+    name = "lzma"
+    codec_id = 2
+
+    def compress(self, raw: bytes) -> bytes:
+        return lzma.compress(raw, format=lzma.FORMAT_XZ, check=lzma.CHECK_NONE)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return lzma.decompress(payload)
+
+
+class Bz2Compression:
+    name = "bz2"
+    codec_id = 3
+
+    def compress(self, raw: bytes) -> bytes:
+        return bz2.compress(raw)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return bz2.decompress(payload)
+
+
+_CODECS = {codec.name: codec for codec in (NoCompression, ZlibCompression, LzmaCompression, Bz2Compression)}
+_CODEC_IDS = {codec.codec_id: codec for codec in _CODECS.values()}
+
+
+def for_name(name: str, dictionary: bytes = b""):
+    codec = _CODECS[name]
+    return codec(dictionary) if codec is ZlibCompression else codec()
+
+
+def for_id(codec_id: int, dictionary: bytes = b""):
+    if codec_id not in _CODEC_IDS:
+        raise ValueError(f"unknown block compression codec {codec_id}")
+    return for_name(_CODEC_IDS[codec_id].name, dictionary)
+
+
+def train_dictionary(samples: Iterable[bytes], size: int) -> bytes:
+    # deflate finds matches most cheaply near the end of the dictionary, so the most
+    # frequent fragments (keys, repeated sensor payloads) go last
+    counts = Counter(sample for sample in samples if sample)
+    if size <= 0 or not counts:
+        return b""
+
+    picked: List[bytes] = []
+    total = 0
+    for fragment, _ in counts.most_common():
+        if total + len(fragment) > size:
+            continue
+        picked.append(fragment)
+        total += len(fragment)
+    return b"".join(reversed(picked))
@@ -0,0 +1,446 @@
+import bisect
+import json
+import os
+import struct
+import zlib
+from typing import Any, List, Optional, Tuple
+
+import src.dsa.sst.compression as sst_compression
+import src.dsa.sst.utility as sst_u
+
+
+class DecodedBlock:
+    """A block whose records were all decoded up front (JSONL and binary v1 files)."""
+
+    def __init__(self, records: List[dict], nbytes: int):
+        self._records = records
+        self.nbytes = nbytes  # encoded size - charged to the block cache
+
+    def records(self) -> List[dict]:
+        return self._records
+
+    def entries(self) -> List[Tuple[str, Any]]:
+        return [(record["key"], record["value"]) for record in self._records]
+
+    def find(self, key: str) -> Tuple[bool, Any]:
+        for record in self._records:
+            if record["key"] == key:
+                return True, record["value"]
+            if record["key"] > key:
+                break  # records are sorted; we passed the target
+        return False, None
+
+
+class RestartBlock:
+    """Prefix-compressed block (binary v2), kept encoded and decoded on demand.
+
+    entries…  | restart offsets (u32 each) | u32 restart count
+    entry:      u16 shared | u16 unshared | u32 data_len | u8 flags | lsn (26 bytes) | key suffix | data
+
+    Each key stores only the suffix it does not share with the previous key. Every
+    `restart_interval` entries the full key is stored (shared = 0) and its offset recorded,
+    so a lookup binary-searches the restart keys and decodes at most one interval.
+    """
+
+    _ENTRY = struct.Struct("<HHIB26s")
+    _COUNT = struct.Struct("<I")
+
+    def __init__(self, raw: bytes):
+        self._raw = raw
+        self.nbytes = len(raw)
+        (restart_count,) = self._COUNT.unpack_from(raw, len(raw) - self._COUNT.size)
+        self._entries_end = len(raw) - self._COUNT.size - restart_count * 4
+        self._restarts = struct.unpack_from(f"<{restart_count}I", raw, self._entries_end)
+
+    def records(self) -> List[dict]:
+        return [{"key": key, "value": value} for key, value in self.entries()]
+
+    def entries(self) -> List[Tuple[str, Any]]:
+        entries = []
+        pos = 0
+        key = b""
+        while pos < self._entries_end:
+            key, flags, lsn, data, pos = self._decode_entry(pos, key)
+            entries.append((key.decode("utf-8"), _decode_value(flags, lsn, data)))
+        return entries
+
+    def find(self, key: str) -> Tuple[bool, Any]:
+        target = key.encode("utf-8")  # UTF-8 byte order matches str order
+
+        # rightmost restart whose full key <= target
+        restart_keys = _RestartKeys(self)
+        idx = bisect.bisect_right(restart_keys, target, 0, len(self._restarts)) - 1
+        if idx < 0:
+            return False, None
+
+        pos = self._restarts[idx]
+        end = self._restarts[idx + 1] if idx + 1 < len(self._restarts) else self._entries_end
+        current = b""
+        while pos < end:
+            current, flags, lsn, data, pos = self._decode_entry(pos, current)
+            if current == target:
+                return True, self._materialize(current, flags, lsn, data)["value"]
+            if current > target:
+                break
+        return False, None
+
+    def restart_key(self, idx: int) -> bytes:
+        pos = self._restarts[idx]
+        _, unshared, _, _, _ = self._ENTRY.unpack_from(self._raw, pos)
+        start = pos + self._ENTRY.size
+        return bytes(self._raw[start : start + unshared])  # raw may be a memoryview, which cannot be ordered
+
+    @classmethod
+    def encode(cls, records: List[Tuple[str, Any]], restart_interval: int) -> bytes:
+        out = bytearray()
+        restarts = []
+        previous = b""
+        for i, (key, value) in enumerate(records):
+            key_bytes = key.encode("utf-8")
+            if i % restart_interval == 0:
+                restarts.append(len(out))
+                shared = 0
+            else:
+                shared = _shared_prefix_length(previous, key_bytes)
+            flags, data = _encode_value(value)
+            lsn = value["lsn"].encode("ascii").ljust(26)
+            out += cls._ENTRY.pack(shared, len(key_bytes) - shared, len(data), flags, lsn)
+            out += key_bytes[shared:]
+            out += data
+            previous = key_bytes
+        out += struct.pack(f"<{len(restarts)}I", *restarts)
+        out += cls._COUNT.pack(len(restarts))
+        return bytes(out)
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _decode_entry(self, pos: int, previous: bytes):
+        shared, unshared, data_len, flags, lsn = self._ENTRY.unpack_from(self._raw, pos)
+        pos += self._ENTRY.size
+        key = previous[:shared] + self._raw[pos : pos + unshared]
+        pos += unshared
+        data = self._raw[pos : pos + data_len]
+        return key, flags, lsn, data, pos + data_len
+
+    def _materialize(self, key: bytes, flags: int, lsn: bytes, data: bytes) -> dict:
+        return {"key": key.decode("utf-8"), "value": _decode_value(flags, lsn, data)}
+
+
+class RecordBlock:
+    """Binary v1 block walked in place - over bytes, or a memoryview of a mapped file.
+
+    record: u16 key_len | u32 data_len | u8 flags | lsn (26 ASCII bytes) | key | data (compact JSON)
+
+    Keys are compared as raw bytes; only the record that is asked for becomes a dict.
+    """
+
+    _HEADER = struct.Struct("<HIB26s")
+
+    def __init__(self, raw, record_count: int):
+        self._raw = raw
+        self._record_count = record_count
+        self.nbytes = len(raw)
+
+    def records(self) -> List[dict]:
+        return [{"key": key, "value": value} for key, value in self.entries()]
+
+    def entries(self) -> List[Tuple[str, Any]]:
+        return [(str(key, "utf-8"), _decode_value(flags, lsn, data)) for key, flags, lsn, data in self._walk()]
+
+    def find(self, key: str) -> Tuple[bool, Any]:
+        target = key.encode("utf-8")
+        for current, flags, lsn, data in self._walk():
+            if current == target:
+                return True, _decode_value(flags, lsn, data)
+            if bytes(current) > target:  # raw may be a memoryview, which cannot be ordered
+                break  # records are sorted; we passed the target
+        return False, None
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _walk(self):
+        raw = self._raw
+        unpack_header = self._HEADER.unpack_from
+        header_size = self._HEADER.size
+        pos = 0
+        for _ in range(self._record_count):
+            key_len, data_len, flags, lsn = unpack_header(raw, pos)
+            pos += header_size
+            key = raw[pos : pos + key_len]
+            pos += key_len
+            yield key, flags, lsn, raw[pos : pos + data_len]
+            pos += data_len
+
+
+# how the writer's json.dumps({"key": ..., "value": ...}) opens every line
+_JSONL_KEY_OPEN = b'{"key": "'
+
+
+class MappedJsonLinesBlock:
+    """JSONL block read straight from a memory-mapped data file.
+
+    A lookup matches each line's encoded `{"key": ...` prefix against the mapping in place
+    and parses only the matching line.
+    """
+
+    def __init__(self, mapping, start: int, end: int):
+        self._mapping = mapping
+        self._view = memoryview(mapping)
+        self._start = start
+        self._end = end
+        self.nbytes = end - start
+
+    def records(self) -> List[dict]:
+        return [json.loads(self._mapping[start:end]) for start, end in self._lines() if end > start]
+
+    def entries(self) -> List[Tuple[str, Any]]:
+        return [(record["key"], record["value"]) for record in self.records()]
+
+    def find(self, key: str) -> Tuple[bool, Any]:
+        # same encoding the writer used, up to the separator before "value"
+        prefix = (json.dumps({"key": key})[:-1] + ", ").encode("utf-8")
+        for start, end in self._lines():
+            if self._view[start : start + len(prefix)] == prefix:
+                return True, json.loads(self._mapping[start:end])["value"]
+            if self._line_key(start, end) > key:
+                break  # lines are sorted; we passed the target
+        return False, None
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _line_key(self, start: int, end: int) -> str:
+        # the key alone, decoded from the line's leading {"key": "... - the value is never parsed
+        text = str(self._mapping[start + len(_JSONL_KEY_OPEN) : end], "utf-8")
+        return json.decoder.scanstring(text, 0)[0]
+
+    def _lines(self):
+        pos = self._start
+        while pos < self._end:
+            newline = self._mapping.find(b"\n", pos, self._end)
+            if newline < 0:
+                newline = self._end
+            yield pos, newline
+            pos = newline + 1
+
+
+class _RestartKeys:
+    # sequence view of a block's restart keys, so bisect can search them without building a list
+    def __init__(self, block: RestartBlock):
+        self._block = block
+
+    def __getitem__(self, idx: int) -> bytes:
+        return self._block.restart_key(idx)
+
+
+class JsonLinesFormat:
+    """Original layout: one {"key", "value": {"data", "lsn"}} JSON object per line."""
+
+    name = "jsonl"
+    extension = ".jsonl"
+    wants_sample = False
+
+    def data_path(self, folder: str, file_id: str) -> str:
+        return os.path.join(folder, f"{file_id}{self.extension}")
+
+    def file_header(self) -> bytes:
+        return b""
+
+    def file_footer(self) -> bytes:
+        return b""
+
+    def train(self, sample: List[Tuple[str, Any]]) -> None:
+        pass
+
+    def matches(self, level_cfg) -> bool:
+        return level_cfg.record_format == self.name
+
+    def encode_block(self, records: List[Tuple[str, Any]], restart_interval: int) -> bytes:
+        return b"".join((json.dumps({"key": key, "value": value}) + "\n").encode("utf-8") for key, value in records)
+
+    def open_block(self, raw: bytes, record_count: int) -> DecodedBlock:
+        return DecodedBlock([json.loads(line) for line in raw.splitlines()[:record_count] if line], len(raw))
+
+    def map_block(self, mapping, offset: int, length: Optional[int], record_count: int) -> MappedJsonLinesBlock:
+        if length is None:
+            # JSONL indexes written before block lengths were recorded
+            end = offset
+            for _ in range(record_count):
+                end = mapping.find(b"\n", end) + 1
+            length = end - offset
+        return MappedJsonLinesBlock(mapping, offset, offset + length)
+
+
+class BinaryFormat:
+    """Length-prefixed binary records with a fixed-width sequence number.
+
+    file: magic "LSMB" | u8 version | u8 compression codec | 2 reserved bytes | blocks… | footer (v3)
+
+    version 1 - records back to back:
+        u16 key_len | u32 data_len | u8 flags | lsn (26 ASCII bytes) | key | data (compact JSON)
+    version 2 - prefix-compressed blocks with restart points (see RestartBlock)
+    version 3 - each RestartBlock compressed by the file's codec and followed by a u32 CRC32 of
+                the stored bytes; footer: zlib preset dictionary | u32 dictionary length | "LSMF".
+                Written today.
+
+    A tombstone sets flag bit 0 and stores no data bytes.
+    """
+
+    name = "binary"
+    extension = ".sst"
+    current_version = 3
+
+    _MAGIC = b"LSMB"
+    _FILE_HEADER = struct.Struct("<4sBB2x")
+    header_size = _FILE_HEADER.size
+    _RECORD_HEADER = RecordBlock._HEADER
+    _CRC = struct.Struct("<I")
+    _FOOTER = struct.Struct("<I4s")
+    _FOOTER_MAGIC = b"LSMF"
+
+    def __init__(self, version: int = current_version, codec=None, dictionary_bytes: int = 0):
+        if version not in (1, 2, 3):
+            raise ValueError(f"unsupported binary SSTable version {version}")
+        self.version = version
+        self.codec = codec or sst_compression.NoCompression()
+        # size of the zlib preset dictionary to train when writing (0 = none)
+        self._dictionary_bytes = dictionary_bytes if self.codec.name == "zlib" else 0
+
+    @property
+    def wants_sample(self) -> bool:
+        return self._dictionary_bytes > 0
+
+    def data_path(self, folder: str, file_id: str) -> str:
+        return os.path.join(folder, f"{file_id}{self.extension}")
+
+    def file_header(self) -> bytes:
+        return self._FILE_HEADER.pack(self._MAGIC, self.version, self.codec.codec_id)
+
+    def file_footer(self) -> bytes:
+        if self.version < 3:
+            return b""
+        dictionary = getattr(self.codec, "dictionary", b"")
+        return dictionary + self._FOOTER.pack(len(dictionary), self._FOOTER_MAGIC)
+
+    def train(self, sample: List[Tuple[str, Any]]) -> None:
+        # keys and encoded payloads of the first records seed the file's zlib dictionary
+        fragments = []
+        for key, value in sample:
+            fragments.append(key.encode("utf-8"))
+            fragments.append(_encode_value(value)[1])
+        dictionary = sst_compression.train_dictionary(fragments, self._dictionary_bytes)
+        self.codec = sst_compression.for_name(self.codec.name, dictionary)
+
+    def matches(self, level_cfg) -> bool:
+        return (
+            level_cfg.record_format == self.name
+            and self.version == self.current_version
+            and self.codec.name == level_cfg.compression
+        )
+
+    @classmethod
+    def from_file(cls, f) -> "BinaryFormat":
+        magic, version, codec_id = cls._FILE_HEADER.unpack(f.read(cls.header_size))
+        if magic != cls._MAGIC:
+            raise ValueError("not a binary SSTable")
+        if version < 3:
+            return cls(version)
+
+        f.seek(-cls._FOOTER.size, os.SEEK_END)
+        dictionary_len, footer_magic = cls._FOOTER.unpack(f.read(cls._FOOTER.size))
+        if footer_magic != cls._FOOTER_MAGIC:
+            raise ValueError("binary SSTable footer is missing or corrupt")
+        f.seek(-cls._FOOTER.size - dictionary_len, os.SEEK_END)
+        dictionary = f.read(dictionary_len)
+        return cls(version, sst_compression.for_id(codec_id, dictionary))
+
+    def encode_block(self, records: List[Tuple[str, Any]], restart_interval: int) -> bytes:
+        if self.version >= 2:
+            payload = RestartBlock.encode(records, restart_interval)
+            if self.version == 2:
+                return payload
+            stored = self.codec.compress(payload)
+            return stored + self._CRC.pack(zlib.crc32(stored))
+
+        out = bytearray()
+        for key, value in records:
+            key_bytes = key.encode("utf-8")
+            flags, data = _encode_value(value)
+            lsn = value["lsn"].encode("ascii").ljust(26)
+            out += self._RECORD_HEADER.pack(len(key_bytes), len(data), flags, lsn) + key_bytes + data
+        return bytes(out)
+
+    def open_block(self, raw: bytes, record_count: int):
+        if self.version == 3:
+            stored = raw[: -self._CRC.size]
+            (crc,) = self._CRC.unpack_from(raw, len(raw) - self._CRC.size)
+            if zlib.crc32(stored) != crc:
+                raise ValueError("SSTable block checksum mismatch")
+            return RestartBlock(self.codec.decompress(stored))
+        if self.version == 2:
+            return RestartBlock(raw)
+        return DecodedBlock(RecordBlock(raw, record_count).records(), len(raw))
+
+    def map_block(self, mapping, offset: int, length: Optional[int], record_count: int):
+        # zero-copy view of the block; v2 blocks decode from it in place, v3 only copy on decompression
+        view = memoryview(mapping)[offset : offset + length]
+        if self.version == 1:
+            return RecordBlock(view, record_count)
+        return self.open_block(view, record_count)
+
+
+_TOMBSTONE_FLAG = 0x01
+
+_JSONL = JsonLinesFormat()
+
+
+def for_level(level_cfg):
+    # a fresh writer-side format for one file - binary formats train per-file state
+    if level_cfg.record_format == JsonLinesFormat.name:
+        return _JSONL
+    if level_cfg.record_format == BinaryFormat.name:
+        codec = sst_compression.for_name(level_cfg.compression)
+        return BinaryFormat(codec=codec, dictionary_bytes=level_cfg.zlib_dictionary_bytes)
+    raise ValueError(f"unknown SSTable record format {level_cfg.record_format!r}")
+
+
+def all_formats():
+    return [_JSONL, BinaryFormat()]
+
+
+def detect(folder: str, file_id: str):
+    # the data file's extension names its format; binary files also carry a versioned header
+    path = os.path.join(folder, f"{file_id}{BinaryFormat.extension}")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return BinaryFormat.from_file(f)
+    return _JSONL
+
+
+# ----------------------------------------------------------------------
+# Internal helpers
+# ----------------------------------------------------------------------
+
+
+def _encode_value(value: dict) -> Tuple[int, bytes]:
+    if value["data"] == sst_u.tombstone():
+        return _TOMBSTONE_FLAG, b""
+    return 0, json.dumps(value["data"], separators=(",", ":")).encode("utf-8")
+
+
+def _decode_value(flags: int, lsn: bytes, data: bytes) -> dict:
+    payload = sst_u.tombstone() if flags & _TOMBSTONE_FLAG else json.loads(bytes(data))
+    return {"data": payload, "lsn": lsn.decode("ascii").rstrip()}
+
+
+def _shared_prefix_length(a: bytes, b: bytes) -> int:
+    limit = min(len(a), len(b))
+    n = 0
+    while n < limit and a[n] == b[n]:
+        n += 1
+    return n
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import src.dsa.sst.utility as sst_u
+
+
+@dataclass(frozen=True)
+class SortedFileMeta:
+    level: int
+    file_id: str
+    first_key: str
+    last_key: str
+    record_count: int
+    data_bytes: int = 0  # size of the data file; edits logged before sizes were tracked read as 0
+
+
+@dataclass
+class SortedTableVersionEdit:
+    added: List[SortedFileMeta] = field(default_factory=list)
+    removed: List[Tuple[int, str]] = field(default_factory=list)  # (level, file_id)
+    # first WAL segment still needed: every segment below it is flushed into the live files
+    log_number: Optional[int] = None
+
+    def add_file(self, meta: SortedFileMeta) -> None:
+        self.added.append(meta)
+
+    def remove_file(self, level: int, file_id: str) -> None:
+        self.removed.append((level, file_id))
+
+    def to_dict(self, edit_number: int) -> dict:
+        result = {
+            "edit": edit_number,
+            "add": [asdict(meta) for meta in self.added],
+            "remove": [{"level": level, "file_id": file_id} for level, file_id in self.removed],
+        }
+        if self.log_number is not None:
+            result["log_number"] = self.log_number
+        return result
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> "SortedTableVersionEdit":
+        return cls(
+            added=[SortedFileMeta(**meta) for meta in raw.get("add", [])],
+            removed=[(r["level"], r["file_id"]) for r in raw.get("remove", [])],
+            log_number=raw.get("log_number"),
+        )
+
+
+class SortedTableVersion:
+    """Immutable set of live SSTables per level. Edits produce a new version."""
+
+    def __init__(self, levels: Optional[Dict[int, Dict[str, SortedFileMeta]]] = None, log_number: int = 0):
+        self._levels = levels or {}
+        self.log_number = log_number
+
+    def file_ids(self, level: int) -> List[str]:
+        return sorted(self._levels.get(level, {}))
+
+    def files(self, level: int) -> List[SortedFileMeta]:
+        files = self._levels.get(level, {})
+        return [files[file_id] for file_id in sorted(files)]
+
+    def file_meta(self, level: int, file_id: str) -> Optional[SortedFileMeta]:
+        return self._levels.get(level, {}).get(file_id)
+
+    def levels(self) -> List[int]:
+        return sorted(level for level, files in self._levels.items() if files)
+
+    def newest_file_id(self, level: int) -> Optional[str]:
+        files = self._levels.get(level)
+        return max(files) if files else None
+
+    def apply(self, edit: SortedTableVersionEdit) -> "SortedTableVersion":
+        levels = {level: dict(files) for level, files in self._levels.items()}
+        for level, file_id in edit.removed:
+            levels.get(level, {}).pop(file_id, None)
+        for meta in edit.added:
+            levels.setdefault(meta.level, {})[meta.file_id] = meta
+        log_number = max(self.log_number, edit.log_number or 0)
+        return SortedTableVersion(levels, log_number)
+
+
+class SortedTableManifest:
+    """Append-only MANIFEST log of version edits; replaces directory listing as the source of live files.
+
+    Each edit is one JSON line written and fsynced before it is applied in memory, so a flush
+    or compaction becomes visible all at once or not at all. A torn final line is ignored on
+    recovery. Once the log holds `max_edits` edits it is rewritten as a single snapshot.
+
+    Readers pin the version they search; files an edit removes are only deleted once no
+    pinned version still lists them.
+    """
+
+    def __init__(self, root_data_path: str, max_edits: int = 1000):
+        self._root_data_path = root_data_path
+        self._path = os.path.join(root_data_path, "MANIFEST.jsonl")
+        self._max_edits = max_edits
+        self._edit_count = 0
+        self._current = SortedTableVersion()
+        # flushes and background compaction log edits concurrently
+        self._lock = threading.RLock()
+        self._pins: Dict[int, Tuple[SortedTableVersion, int]] = {}  # id(version) -> (version, pin count)
+        self._obsolete: List[Tuple[int, str, Callable[[int, str], None]]] = []
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def current(self) -> SortedTableVersion:
+        return self._current
+
+    def recover(self, reader) -> SortedTableVersion:
+        if not os.path.exists(self._path):
+            # first start on a data directory written before the MANIFEST existed
+            self._current = self._scan_directories(reader)
+            self._write_snapshot()
+            return self._current
+
+        version = SortedTableVersion()
+        edit_count = 0
+        good_bytes = 0
+        with open(self._path, "rb") as f:
+            for line in f:
+                try:
+                    raw = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    break  # torn tail from a crash mid-append - everything after it is discarded
+                version = version.apply(SortedTableVersionEdit.from_dict(raw))
+                edit_count += 1
+                good_bytes += len(line)
+
+        if good_bytes < os.path.getsize(self._path):
+            with open(self._path, "r+b") as f:
+                f.truncate(good_bytes)
+
+        self._current = version
+        self._edit_count = edit_count
+        return self._current
+
+    def log_and_apply(self, edit: SortedTableVersionEdit) -> SortedTableVersion:
+        with self._lock:
+            if self._edit_count >= self._max_edits:
+                self._current = self._current.apply(edit)
+                self._write_snapshot()
+            else:
+                os.makedirs(self._root_data_path, exist_ok=True)
+                with open(self._path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(edit.to_dict(self._edit_count)) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                self._edit_count += 1
+                self._current = self._current.apply(edit)
+            version = self._current
+        self._notify()
+        return version
+
+    def subscribe(self, listener: Callable[[], None]) -> None:
+        # listener() runs after every new current version, outside the MANIFEST lock
+        self._listeners.append(listener)
+
+    def pin(self) -> SortedTableVersion:
+        # the current version, kept readable until unpin
+        with self._lock:
+            version = self._current
+            _, count = self._pins.get(id(version), (version, 0))
+            self._pins[id(version)] = (version, count + 1)
+            return version
+
+    def unpin(self, version: SortedTableVersion) -> None:
+        with self._lock:
+            _, count = self._pins[id(version)]
+            if count > 1:
+                self._pins[id(version)] = (version, count - 1)
+            else:
+                del self._pins[id(version)]
+            self._remove_obsolete()
+
+    def remove_when_unused(self, level: int, file_id: str, remove: Callable[[int, str], None]) -> None:
+        # called after an edit dropped the file: delete it now, or when the last version listing it is unpinned
+        with self._lock:
+            self._obsolete.append((level, file_id, remove))
+            self._remove_obsolete()
+
+    def reset(self) -> None:
+        # the data directory was wiped - start from an empty version
+        with self._lock:
+            self._current = SortedTableVersion()
+            self._edit_count = 0
+            self._obsolete.clear()
+        self._notify()
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _notify(self) -> None:
+        for listener in self._listeners:
+            listener()
+
+    def _remove_obsolete(self) -> None:
+        pending = []
+        for level, file_id, remove in self._obsolete:
+            if any(version.file_meta(level, file_id) is not None for version, _ in self._pins.values()):
+                pending.append((level, file_id, remove))
+            else:
+                remove(level, file_id)
+        self._obsolete = pending
+
+    def _write_snapshot(self) -> None:
+        snapshot = SortedTableVersionEdit(log_number=self._current.log_number or None)
+        for level in self._current.levels():
+            for meta in self._current.files(level):
+                snapshot.add_file(meta)
+
+        os.makedirs(self._root_data_path, exist_ok=True)
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot.to_dict(0)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
+        self._edit_count = 1
+
+    def _scan_directories(self, reader) -> SortedTableVersion:
+        edit = SortedTableVersionEdit()
+        level = 0
+        while os.path.exists(sst_u.level_dir(self._root_data_path, level)):
+            folder = sst_u.level_dir(self._root_data_path, level)
+            for file_id in reader.scan_file_ids(folder):
+                meta = reader.file_meta(folder, file_id)
+                if meta is not None:
+                    edit.add_file(meta)
+            level += 1
+        return SortedTableVersion().apply(edit)
@@ -0,0 +1,72 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import src.dsa.sst.bloom as sst_bloom
+
+
+@dataclass
+class SortedTableMetadata:
+    blocks: List[dict]
+    bloom: Optional[sst_bloom.BloomFilter]
+    record_format: object  # JsonLinesFormat or BinaryFormat of the data file
+    last_key: Optional[str] = None  # filled lazily - needs the final block
+
+    @property
+    def first_key(self) -> Optional[str]:
+        return self.blocks[0]["first_key"] if self.blocks else None
+
+
+@dataclass
+class SortedLevelFences:
+    # parallel arrays sorted by first_key: fence_keys[i] is the smallest key in file_ids[i]
+    fence_keys: List[str]
+    file_ids: List[str]
+    # the live file set the fences were built from - a reader of another version rebuilds them
+    source_ids: Tuple[str, ...] = ()
+
+
+class SortedTableMetadataCache:
+    """Parsed index + filter of each immutable SSTable, plus per-level fence pointers.
+
+    SSTables never change once written, so a file's entry stays valid until the file is
+    removed. Level fences depend on the set of files and are dropped whenever a file is
+    added to or removed from that level.
+
+    Safe to share between the search path and background compaction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files: Dict[Tuple[str, str], SortedTableMetadata] = {}
+        self._fences: Dict[str, SortedLevelFences] = {}
+
+    def get(self, folder: str, file_id: str) -> Optional[SortedTableMetadata]:
+        with self._lock:
+            return self._files.get((folder, file_id))
+
+    def put(self, folder: str, file_id: str, metadata: SortedTableMetadata) -> None:
+        with self._lock:
+            self._files[(folder, file_id)] = metadata
+
+    def get_fences(self, folder: str) -> Optional[SortedLevelFences]:
+        with self._lock:
+            return self._fences.get(folder)
+
+    def put_fences(self, folder: str, fences: SortedLevelFences) -> None:
+        with self._lock:
+            self._fences[folder] = fences
+
+    def file_added(self, folder: str) -> None:
+        with self._lock:
+            self._fences.pop(folder, None)
+
+    def file_removed(self, folder: str, file_id: str) -> None:
+        with self._lock:
+            self._files.pop((folder, file_id), None)
+            self._fences.pop(folder, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._files.clear()
+            self._fences.clear()
@@ -1,34 +1,96 @@
+import bisect
 import json
 import os
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Any, Iterator, List, Optional, Tuple
 
+import src.dsa.sst.bloom as sst_bloom
+import src.dsa.sst.cache as sst_cache
+import src.dsa.sst.format as sst_format
+import src.dsa.sst.manifest as sst_manifest
+import src.dsa.sst.metadata as sst_meta
 import src.dsa.sst.utility as sst_u
 
 
-@dataclass
+@dataclass(slots=True)
 class SortedTableCursor:
-    records: List[dict]
+    # entries are (key, value) tuples - merges compare and forward them without building dicts
+    entries: List[Tuple[str, Any]]
     pos: int
     priority: int
     folder: str
     file_id: str
     blocks: List[dict]
     block_idx: int
+    fill_cache: bool = True
 
     @property
-    def current(self) -> dict:
-        return self.records[self.pos]
+    def current(self) -> Tuple[str, Any]:
+        return self.entries[self.pos]
 
 
 class SortedTableReader:
-    def __init__(self, root_data_path: str):
+    def __init__(
+        self,
+        root_data_path: str,
+        block_cache_bytes: int = 4 * 1024 * 1024,
+        max_open_files: int = 64,
+        manifest: Optional[sst_manifest.SortedTableManifest] = None,
+        use_mmap: bool = False,
+    ):
         self._root_data_path = root_data_path
+        # when set, live files come from the MANIFEST version instead of directory listings
+        self._manifest = manifest
+        self._metadata = sst_meta.SortedTableMetadataCache()
+        self._block_cache = sst_cache.LRUBlockCache(block_cache_bytes)
+        self._handles = sst_cache.TableHandleCache(max_open_files)
+        # mmap mode maps each data file once and parses blocks from zero-copy views of it
+        self._mappings = sst_cache.MappedTableCache(max_open_files) if use_mmap else None
 
     @property
     def root_data_path(self) -> str:
         return self._root_data_path
 
+    @property
+    def use_mmap(self) -> bool:
+        return self._mappings is not None
+
+    @property
+    def manifest(self) -> Optional[sst_manifest.SortedTableManifest]:
+        return self._manifest
+
+    # ------------------------------------------------------------------
+    # Cache maintenance - called by SortedTableWriter as files come and go
+    # ------------------------------------------------------------------
+
+    def file_added(self, folder: str, file_id: str, metadata: Optional[sst_meta.SortedTableMetadata] = None) -> None:
+        # the writer already holds the new file's index and filter - seed them instead of re-reading
+        self._metadata.file_added(folder)
+        if metadata is not None:
+            self._metadata.put(folder, file_id, metadata)
+
+    def file_removed(self, folder: str, file_id: str) -> None:
+        self._metadata.file_removed(folder, file_id)
+        self._block_cache.evict_file(folder, file_id)
+        self._handles.close_file(folder, file_id)
+        if self._mappings is not None:
+            self._mappings.close_file(folder, file_id)
+
+    def clear_caches(self) -> None:
+        self._metadata.clear()
+        self._block_cache.clear()
+        self._handles.close_all()
+        if self._mappings is not None:
+            self._mappings.close_all()
+
+    def block_cache_usage(self) -> dict:
+        return self._block_cache.usage()
+
+    def table_cache_usage(self) -> dict:
+        if self._mappings is not None:
+            return self._mappings.usage()
+        return self._handles.usage()
+
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
@@ -38,83 +100,259 @@ class SortedTableReader:
         last_ids: dict[int, str],
         max_level: int,
     ):
+        # one version for every level, so a concurrent compaction cannot be counted twice
+        version = self._manifest.current() if self._manifest is not None else None
         result = []
         for i in range(0, max_level + 1):
             ldir = sst_u.level_dir(self.root_data_path, i)
             count = 0
-            for fileid in self.list_file_ids(ldir, last_ids[i]):
-                count += sum([ix["record_count"] for ix in self.read_index(ldir, fileid)])
+            for fileid in self.list_file_ids(ldir, last_ids.get(i, sst_u.ulid_max()), version):
+                if version is not None:
+                    count += version.file_meta(i, fileid).record_count
+                else:
+                    count += sum([ix["record_count"] for ix in self.read_index(ldir, fileid)])
 
             result.append({"lsm_level": f"L{i}", "key_count": count})
         return result
 
-    def list_file_ids(self, folder: str, last_id: str) -> List[str]:
-        if not os.path.exists(folder):
-            return []
-        ids = [
-            name[:-6]  # strip ".jsonl"
-            for name in os.listdir(folder)
-            if name.endswith(".jsonl") and not name.endswith(".index.jsonl")
-        ]
+    def list_file_ids(
+        self, folder: str, last_id: str, version: Optional[sst_manifest.SortedTableVersion] = None
+    ) -> List[str]:
+        # a reader that pinned a version keeps seeing its files while compaction installs newer ones
+        if version is None and self._manifest is not None:
+            version = self._manifest.current()
+        if version is not None:
+            ids = version.file_ids(sst_u.folder_level(folder))
+        else:
+            ids = self.scan_file_ids(folder)
 
         last_id = last_id or ""
         last_id = (sst_u.ulid_min() if last_id == "" else last_id).strip()
         return [fid for fid in ids if fid <= last_id]
 
+    def scan_file_ids(self, folder: str) -> List[str]:
+        # directory listing - only used without a MANIFEST, or to bootstrap / garbage collect one
+        if not os.path.exists(folder):
+            return []
+        names = set(os.listdir(folder))
+        file_ids = []
+        for name in names:
+            stem, extension = os.path.splitext(name)
+            # a data file without its index is a write that never completed (or the WAL)
+            if extension in (".jsonl", ".sst") and "." not in stem and f"{stem}.index.jsonl" in names:
+                file_ids.append(stem)
+        return file_ids
+
+    def file_meta(self, folder: str, file_id: str) -> Optional[sst_manifest.SortedFileMeta]:
+        # key range, record count and size as recorded in the MANIFEST
+        key_range = self.get_key_range(folder, file_id)
+        if key_range is None:
+            return None
+        record_format = self.read_metadata(folder, file_id).record_format
+        return sst_manifest.SortedFileMeta(
+            level=sst_u.folder_level(folder),
+            file_id=file_id,
+            first_key=key_range[0],
+            last_key=key_range[1],
+            record_count=sum(block["record_count"] for block in self.read_index(folder, file_id)),
+            data_bytes=os.path.getsize(record_format.data_path(folder, file_id)),
+        )
+
+    def level_files(self, level: int) -> List[sst_manifest.SortedFileMeta]:
+        # live files of a level with key ranges and sizes, ordered by file id
+        if self._manifest is not None:
+            return self._manifest.current().files(level)
+        folder = sst_u.level_dir(self._root_data_path, level)
+        metas = (self.file_meta(folder, file_id) for file_id in sorted(self.scan_file_ids(folder)))
+        return [meta for meta in metas if meta is not None]
+
     def read_index(self, folder: str, file_id: str) -> List[dict]:
-        with open(sst_u.index_path(folder, file_id), "r", encoding="utf-8") as f:
-            return [json.loads(line) for line in f if line.strip()]
+        return self.read_metadata(folder, file_id).blocks
 
-    def read_block(self, folder: str, file_id: str, block: dict) -> List[dict]:
-        data_path = sst_u.data_path(folder, file_id)
-        records = []
-        with open(data_path, "rb") as f:
-            f.seek(block["offset"])
-            for _ in range(block["record_count"]):
-                line = f.readline()
-                if line:
-                    records.append(json.loads(line.decode("utf-8")))
-        return records
+    def read_filter(self, folder: str, file_id: str) -> Optional[sst_bloom.BloomFilter]:
+        # files written without a filter (or before filters existed) return None
+        return self.read_metadata(folder, file_id).bloom
 
-    def get_key_range(self, folder: str, file_id: str) -> Optional[Tuple[str, str]]:
-        # first_key from the index; last key requires reading the final block
+    def read_metadata(self, folder: str, file_id: str) -> sst_meta.SortedTableMetadata:
+        # index and filter are parsed once per immutable file, then served from memory
+        metadata = self._metadata.get(folder, file_id)
+        if metadata is None:
+            metadata = sst_meta.SortedTableMetadata(
+                blocks=self._load_index(folder, file_id),
+                bloom=self._load_filter(folder, file_id),
+                record_format=sst_format.detect(folder, file_id),
+            )
+            self._metadata.put(folder, file_id, metadata)
+        return metadata
+
+    def read_level_fences(self, folder: str, file_ids: List[str]) -> sst_meta.SortedLevelFences:
+        # first key of every file at a non-overlapping level, sorted for a single bisect
+        fences = self._metadata.get_fences(folder)
+        if fences is None or fences.source_ids != tuple(file_ids):
+            ranges = []
+            for file_id in file_ids:
+                first_key = self.read_metadata(folder, file_id).first_key
+                if first_key is not None:
+                    ranges.append((first_key, file_id))
+            ranges.sort()
+            fences = sst_meta.SortedLevelFences(
+                fence_keys=[first_key for first_key, _ in ranges],
+                file_ids=[file_id for _, file_id in ranges],
+                source_ids=tuple(file_ids),
+            )
+            self._metadata.put_fences(folder, fences)
+        return fences
+
+    def find_level_file(self, folder: str, file_ids: List[str], key: str) -> Optional[str]:
+        # rightmost file whose first_key <= key
+        fences = self.read_level_fences(folder, file_ids)
+        pos = bisect.bisect_right(fences.fence_keys, key) - 1
+        return fences.file_ids[pos] if pos >= 0 else None
+
+    def read_block(self, folder: str, file_id: str, block: dict, fill_cache: bool = True) -> List[dict]:
+        # cached blocks are shared - callers must treat the returned records as read-only
+        return self._open_block(folder, file_id, block, fill_cache).records()
+
+    def find_in_block(self, folder: str, file_id: str, block: dict, key: str) -> Tuple[bool, Any]:
+        # prefix-compressed blocks binary-search their restart points and decode only the match
+        return self._open_block(folder, file_id, block, True).find(key)
+
+    def find_many_in_block(self, folder: str, file_id: str, block: dict, keys: List[str]) -> List[Tuple[bool, Any]]:
+        # the block is opened (read and decoded, or taken from the cache) once for all keys
+        opened = self._open_block(folder, file_id, block, True)
+        return [opened.find(key) for key in keys]
+
+    def scan_file(
+        self,
+        folder: str,
+        file_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        reverse: bool = False,
+        fill_cache: bool = True,
+    ) -> Iterator[dict]:
+        # records with start <= key < end, one block in memory at a time; the index picks the first block
         blocks = self.read_index(folder, file_id)
-        if not blocks:
+        if not reverse:
+            first = 0 if start is None else max(bisect.bisect_right(blocks, start, key=_first_key) - 1, 0)
+            for block in blocks[first:]:
+                if end is not None and block["first_key"] >= end:
+                    return
+                for record in self.read_block(folder, file_id, block, fill_cache):
+                    if end is not None and record["key"] >= end:
+                        return
+                    if start is None or record["key"] >= start:
+                        yield record
+            return
+
+        last = len(blocks) if end is None else bisect.bisect_left(blocks, end, key=_first_key)
+        for block in reversed(blocks[:last]):
+            for record in reversed(self.read_block(folder, file_id, block, fill_cache)):
+                if start is not None and record["key"] < start:
+                    return
+                if end is None or record["key"] < end:
+                    yield record
+
+    def get_key_range(self, folder: str, file_id: str) -> Optional[Tuple[str, str]]:
+        # first_key from the index; last key requires reading the final block (once)
+        metadata = self.read_metadata(folder, file_id)
+        if not metadata.blocks:
             return None
-        file_min = blocks[0]["first_key"]
-        last_block_records = self.read_block(folder, file_id, blocks[-1])
-        file_max = last_block_records[-1]["key"] if last_block_records else file_min
-        return file_min, file_max
+        file_min = metadata.first_key
+        if metadata.last_key is None:
+            last_block_records = self.read_block(folder, file_id, metadata.blocks[-1])
+            metadata.last_key = last_block_records[-1]["key"] if last_block_records else file_min
+        return file_min, metadata.last_key
 
-    def make_cursor(self, folder: str, file_id: str, priority: int) -> Optional[SortedTableCursor]:
+    def make_cursor(
+        self, folder: str, file_id: str, priority: int, fill_cache: bool = True, start: Optional[str] = None
+    ) -> Optional[SortedTableCursor]:
+        # positioned on the first record >= start; the index picks the block to open
         blocks = self.read_index(folder, file_id)
         if not blocks:
             return None
-        first_block = self.read_block(folder, file_id, blocks[0])
-        if not first_block:
+        block_idx = 0 if start is None else max(bisect.bisect_right(blocks, start, key=_first_key) - 1, 0)
+        entries = self._open_block(folder, file_id, blocks[block_idx], fill_cache).entries()
+        if not entries:
             return None
-        return SortedTableCursor(
-            records=first_block,
+        cursor = SortedTableCursor(
+            entries=entries,
             pos=0,
             priority=priority,
             folder=folder,
             file_id=file_id,
             blocks=blocks,
-            block_idx=0,
+            block_idx=block_idx,
+            fill_cache=fill_cache,
         )
+        if start is not None:
+            cursor.pos = bisect.bisect_left(entries, start, key=_entry_key)
+            if cursor.pos >= len(entries):
+                # the whole block lies below start - the next one begins at or after it
+                cursor.pos = len(entries) - 1
+                return cursor if self.advance_cursor(cursor) else None
+        return cursor
 
     def advance_cursor(self, cursor: SortedTableCursor) -> bool:
-        if cursor.pos + 1 < len(cursor.records):
+        if cursor.pos + 1 < len(cursor.entries):
             cursor.pos += 1
             return True
         # current block exhausted - load the next one
         next_block_idx = cursor.block_idx + 1
         if next_block_idx >= len(cursor.blocks):
             return False
-        next_block = self.read_block(cursor.folder, cursor.file_id, cursor.blocks[next_block_idx])
-        if not next_block:
+        next_block = self._open_block(cursor.folder, cursor.file_id, cursor.blocks[next_block_idx], cursor.fill_cache)
+        entries = next_block.entries()
+        if not entries:
             return False
-        cursor.records = next_block
+        cursor.entries = entries
         cursor.pos = 0
         cursor.block_idx = next_block_idx
         return True
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _open_block(self, folder: str, file_id: str, block: dict, fill_cache: bool):
+        cached = self._block_cache.get(folder, file_id, block["offset"])
+        if cached is not None:
+            return cached
+
+        record_format = self.read_metadata(folder, file_id).record_format
+        if self._mappings is not None:
+            mapping = self._mappings.get(folder, file_id, record_format.data_path(folder, file_id))
+            opened = record_format.map_block(mapping, block["offset"], block.get("length"), block["record_count"])
+        else:
+            with self._handles.open(folder, file_id, record_format.data_path(folder, file_id)) as f:
+                f.seek(block["offset"])
+                if "length" in block:
+                    # one read for the whole block
+                    raw = f.read(block["length"])
+                else:
+                    # JSONL indexes written before block lengths were recorded
+                    raw = b"".join(f.readline() for _ in range(block["record_count"]))
+            opened = record_format.open_block(raw, block["record_count"])
+
+        if fill_cache:
+            self._block_cache.put(folder, file_id, block["offset"], opened, opened.nbytes)
+        return opened
+
+    def _load_index(self, folder: str, file_id: str) -> List[dict]:
+        with open(sst_u.index_path(folder, file_id), "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _load_filter(self, folder: str, file_id: str) -> Optional[sst_bloom.BloomFilter]:
+        path = sst_u.filter_path(folder, file_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return sst_bloom.BloomFilter.from_bytes(f.read())
+
+
+def _first_key(block: dict) -> str:
+    return block["first_key"]
+
+
+def _entry_key(entry: Tuple[str, Any]) -> str:
+    return entry[0]
@@ -1,6 +1,10 @@
-import os
-from typing import Any, List, Optional, Tuple
+import bisect
+import dataclasses
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import src.dsa.sst.bloom as sst_bloom
+import src.dsa.sst.manifest as sst_manifest
 import src.dsa.sst.read as sst_read
 import src.dsa.sst.utility as sst_u
 
@@ -13,15 +17,23 @@ class SortedTableSearch:
 
     def __init__(self, reader: sst_read.SortedTableReader):
         self._reader = reader
-
-    def search(self, key: str, level: int, last_id: str = "") -> Optional[Any]:
+        self._filter_stats = sst_bloom.BloomFilterStats()
+        # concurrent searches all count into the same stats
+        self._stats_lock = threading.Lock()
+
+    @property
+    def filter_stats(self) -> sst_bloom.BloomFilterStats:
+        # a copy: the counters keep moving while searches run
+        with self._stats_lock:
+            return dataclasses.replace(self._filter_stats)
+
+    def search(
+        self, key: str, level: int, last_id: str = "", version: Optional[sst_manifest.SortedTableVersion] = None
+    ) -> Optional[Any]:
         """Return the value for *key* at *level*, or None if not found / deleted."""
         level_dir = sst_u.level_dir(self._reader.root_data_path, level)
-        if not os.path.exists(level_dir):
-            return None
-
         last_id = last_id if level > 0 else sst_u.ulid_max()
-        file_ids = self._reader.list_file_ids(level_dir, last_id)
+        file_ids = self._reader.list_file_ids(level_dir, last_id, version)
 
         if not file_ids:
             return None
@@ -31,6 +43,76 @@ class SortedTableSearch:
         else:
             return self._search_level_n(key, level_dir, file_ids)
 
+    def multi_search(
+        self,
+        keys: List[str],
+        level: int,
+        last_id: str = "",
+        version: Optional[sst_manifest.SortedTableVersion] = None,
+    ) -> Dict[str, Any]:
+        """search() for many ascending keys at *level*: {key: value} for the keys found, tombstones included.
+
+        Keys are grouped by file and then by block, so each block is opened once per call.
+        """
+        level_dir = sst_u.level_dir(self._reader.root_data_path, level)
+        last_id = last_id if level > 0 else sst_u.ulid_max()
+        file_ids = self._reader.list_file_ids(level_dir, last_id, version)
+
+        found: Dict[str, Any] = {}
+        if not file_ids or not keys:
+            return found
+
+        if level == 0:
+            # newest file first; a key found in a newer file is not looked up in older ones
+            remaining = keys
+            for file_id in sorted(file_ids, reverse=True):
+                found.update(self._lookup_many_in_file(remaining, level_dir, file_id))
+                remaining = [key for key in remaining if key not in found]
+                if not remaining:
+                    break
+            return found
+
+        # non-overlapping files: the fence pointers split the sorted keys into one run per file
+        fences = self._reader.read_level_fences(level_dir, file_ids)
+        for pos, file_id in enumerate(fences.file_ids):
+            lo = bisect.bisect_left(keys, fences.fence_keys[pos])
+            hi = bisect.bisect_left(keys, fences.fence_keys[pos + 1]) if pos + 1 < len(fences.file_ids) else len(keys)
+            if lo < hi:
+                found.update(self._lookup_many_in_file(keys[lo:hi], level_dir, file_id))
+        return found
+
+    def scan_sources(
+        self,
+        level: int,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        reverse: bool = False,
+        last_id: str = "",
+        version: Optional[sst_manifest.SortedTableVersion] = None,
+    ) -> List[Iterator[dict]]:
+        """Sorted record streams over start <= key < end at *level*, newest source first."""
+        level_dir = sst_u.level_dir(self._reader.root_data_path, level)
+        last_id = last_id if level > 0 else sst_u.ulid_max()
+        file_ids = self._reader.list_file_ids(level_dir, last_id, version)
+
+        if not file_ids:
+            return []
+
+        if level == 0:
+            # overlapping files - one stream each, skipping files outside the range
+            sources = []
+            for file_id in sorted(file_ids, reverse=True):
+                key_range = self._reader.get_key_range(level_dir, file_id)
+                if key_range is None:
+                    continue
+                if (end is not None and key_range[0] >= end) or (start is not None and key_range[1] < start):
+                    continue
+                sources.append(self._reader.scan_file(level_dir, file_id, start, end, reverse))
+            return sources
+
+        # non-overlapping files chain into a single stream
+        return [self._scan_level_n(level_dir, file_ids, start, end, reverse)]
+
     # ------------------------------------------------------------------
     # Level-specific search
     # ------------------------------------------------------------------
@@ -46,40 +128,88 @@ class SortedTableSearch:
 
     def _search_level_n(self, key: str, level_dir: str, file_ids: List[str]) -> Optional[Any]:
         # Files have non-overlapping key ranges.
-        # Binary-search the file list for the rightmost file whose first_key <= key.
-        file_ranges: List[Tuple[str, str]] = []  # (first_key, file_id)
-        for file_id in file_ids:
-            index = self._reader.read_index(level_dir, file_id)
-            if index:
-                file_ranges.append((index[0]["first_key"], file_id))
-
-        if not file_ranges:
-            return None
-
-        file_ranges.sort()
-
-        lo, hi = 0, len(file_ranges) - 1
-        candidate_file_id: Optional[str] = None
-        while lo <= hi:
-            mid = (lo + hi) // 2
-            if file_ranges[mid][0] <= key:
-                candidate_file_id = file_ranges[mid][1]
-                lo = mid + 1
-            else:
-                hi = mid - 1
-
+        # One bisect over the cached fence pointers picks the rightmost file whose first_key <= key.
+        candidate_file_id = self._reader.find_level_file(level_dir, file_ids, key)
         if candidate_file_id is None:
             return None
 
         found, value = self._lookup_in_file(key, level_dir, candidate_file_id)
         return value if found else None
 
+    def _scan_level_n(
+        self, level_dir: str, file_ids: List[str], start: Optional[str], end: Optional[str], reverse: bool
+    ) -> Iterator[dict]:
+        # the fence pointers pick the first file; later files are opened only when reached
+        fences = self._reader.read_level_fences(level_dir, file_ids)
+        if not reverse:
+            first = 0 if start is None else max(bisect.bisect_right(fences.fence_keys, start) - 1, 0)
+            for pos in range(first, len(fences.file_ids)):
+                if end is not None and fences.fence_keys[pos] >= end:
+                    return
+                yield from self._reader.scan_file(level_dir, fences.file_ids[pos], start, end)
+            return
+
+        last = len(fences.file_ids) if end is None else bisect.bisect_left(fences.fence_keys, end)
+        for pos in range(last - 1, -1, -1):
+            yield from self._reader.scan_file(level_dir, fences.file_ids[pos], start, end, reverse=True)
+            if start is not None and fences.fence_keys[pos] <= start:
+                return
+
     # ------------------------------------------------------------------
     # File-level search: index binary search → seek → block scan
     # ------------------------------------------------------------------
 
     def _lookup_in_file(self, key: str, folder: str, file_id: str) -> Tuple[bool, Any]:
         """Return (found, value). value is None for tombstones; found is False if key absent."""
+        # the bloom filter rules out most absent keys without touching the index or data file
+        bloom = self._reader.read_filter(folder, file_id)
+        if bloom is not None and not bloom.may_contain(key):
+            self._count_filter(checks=1, useful=1)
+            return False, None
+
+        found, value = self._scan_file(key, folder, file_id)
+        if bloom is not None:
+            self._count_filter(checks=1, false_positives=int(not found))
+        return found, value
+
+    def _lookup_many_in_file(self, keys: List[str], folder: str, file_id: str) -> Dict[str, Any]:
+        bloom = self._reader.read_filter(folder, file_id)
+        if bloom is not None:
+            checks = len(keys)
+            keys = [key for key in keys if bloom.may_contain(key)]
+            useful = checks - len(keys)
+
+        index = self._reader.read_index(folder, file_id)
+        if not index or not keys:
+            if bloom is not None:
+                self._count_filter(checks=checks, useful=useful, false_positives=len(keys))
+            return {}
+
+        # one run of keys per block: the rightmost block whose first_key <= key
+        by_block: Dict[int, List[str]] = {}
+        for key in keys:
+            pos = bisect.bisect_right(index, key, key=_first_key) - 1
+            if pos >= 0:
+                by_block.setdefault(pos, []).append(key)
+
+        found = {}
+        for pos, block_keys in by_block.items():
+            for key, (hit, value) in zip(
+                block_keys, self._reader.find_many_in_block(folder, file_id, index[pos], block_keys)
+            ):
+                if hit:
+                    found[key] = value
+        if bloom is not None:
+            self._count_filter(checks=checks, useful=useful, false_positives=len(keys) - len(found))
+        return found
+
+    def _count_filter(self, checks: int, useful: int = 0, false_positives: int = 0) -> None:
+        with self._stats_lock:
+            self._filter_stats.checks += checks
+            self._filter_stats.useful += useful
+            self._filter_stats.false_positives += false_positives
+
+    def _scan_file(self, key: str, folder: str, file_id: str) -> Tuple[bool, Any]:
         index = self._reader.read_index(folder, file_id)
         if not index or key < index[0]["first_key"]:
             return False, None
@@ -95,10 +225,8 @@ class SortedTableSearch:
             else:
                 hi = mid - 1
 
-        for record in self._reader.read_block(folder, file_id, block_entry):
-            if record["key"] == key:
-                return True, record["value"]
-            if record["key"] > key:
-                break  # records are sorted; we passed the target
+        return self._reader.find_in_block(folder, file_id, block_entry, key)
+
 
-        return False, None
+def _first_key(block: dict) -> str:
+    return block["first_key"]
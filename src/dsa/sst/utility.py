@@ -5,6 +5,11 @@ def level_dir(root_path: str, level: int) -> str:
     return os.path.join(root_path, f"L{level}")
 
 
+def folder_level(folder: str) -> int:
+    # inverse of level_dir: "<root>/L3" -> 3
+    return int(os.path.basename(os.path.normpath(folder))[1:])
+
+
 def data_path(folder: str, file_id: str) -> str:
     return os.path.join(folder, f"{file_id}.jsonl")
 
@@ -13,6 +18,21 @@ def index_path(folder: str, file_id: str) -> str:
     return os.path.join(folder, f"{file_id}.index.jsonl")
 
 
+def filter_path(folder: str, file_id: str) -> str:
+    return os.path.join(folder, f"{file_id}.filter")
+
+
+def fsync_dir(path: str) -> None:
+    # make the directory's entries durable - new, renamed and deleted files; not possible on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def tombstone():
     return "__TOMBSTONE__"
 
@@ -29,17 +49,73 @@ def ulid_min():
     return "00000000000000000000000000"
 
 
+def prefix_end(prefix: str):
+    # smallest key greater than every key starting with prefix (None = no upper bound)
+    while prefix and prefix[-1] == chr(0x10FFFF):
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
 class SortedLevelConfiguration:
-    def __init__(self, block_size: int = 10, blocks_per_file: int = 20, min_files: int = 2):
+    def __init__(
+        self,
+        block_size: int = 10,
+        blocks_per_file: int = 20,
+        min_files: int = 2,
+        bloom_bits_per_key: int = 10,
+        record_format: str = "jsonl",
+        restart_interval: int = 16,
+        compression: str = "none",
+        zlib_dictionary_bytes: int = 4096,
+    ):
         self.block_size = block_size
         self.blocks_per_file = blocks_per_file
         self.min_files = min_files
+        # 0 disables the per-file bloom filter
+        self.bloom_bits_per_key = bloom_bits_per_key
+        # "jsonl" or "binary" - readers detect the format of each file, so levels can be switched freely
+        self.record_format = record_format
+        # binary blocks store a full key (restart point) every restart_interval records
+        if restart_interval <= 0:
+            raise ValueError(f"restart_interval must be a positive number of records, got {restart_interval}")
+        self.restart_interval = restart_interval
+        # binary levels only: "none", "zlib", "lzma" or "bz2" per block; zlib trains a preset
+        # dictionary of up to zlib_dictionary_bytes from each file's first records
+        self.compression = compression
+        self.zlib_dictionary_bytes = zlib_dictionary_bytes
 
 
 class SortedTableConfiguration:
-    def __init__(self, levels: dict[int, SortedLevelConfiguration]):
+    def __init__(
+        self,
+        levels: dict[int, SortedLevelConfiguration],
+        max_level: int = 3,
+        level_base_bytes: int = 64 * 1024,
+        level_size_multiplier: int = 10,
+        level0_file_trigger: int = 4,
+        sync_files: bool = True,
+    ):
         # levels: mapping of level number (int) -> SortedLevelConfiguration
         self._levels = levels
+        # deepest level (L0..L<max_level>); tombstones are dropped when compacting into it
+        self.max_level = max_level
+        # leveled compaction: L1 may hold level_base_bytes of data files, each deeper level
+        # level_size_multiplier times more; a level over its target is compacted into the next
+        self.level_base_bytes = level_base_bytes
+        self.level_size_multiplier = level_size_multiplier
+        # L0 files overlap, so L0 is scored by file count: compact once it holds this many
+        self.level0_file_trigger = level0_file_trigger
+        # fsync every data, index and filter file and its level directory before a MANIFEST edit
+        # or WAL retirement relies on it; off where the log is not synced either
+        self.sync_files = sync_files
+
+    def target_bytes(self, level: int) -> int:
+        return self.level_base_bytes * self.level_size_multiplier ** max(level - 1, 0)
 
     def for_level(self, level: int) -> SortedLevelConfiguration:
+        # levels without explicit tuning fall back to the defaults
+        if level not in self._levels:
+            return SortedLevelConfiguration()
         return self._levels[level]
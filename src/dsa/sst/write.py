@@ -1,67 +1,93 @@
+import itertools
 import json
 import os
 import pathlib
-from typing import Iterable, Iterator, List, Optional, Tuple
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
 
 from ulid import ULID
 
+import src.dsa.sst.bloom as sst_bloom
+import src.dsa.sst.format as sst_format
+import src.dsa.sst.metadata as sst_meta
+import src.dsa.sst.read as sst_read
 import src.dsa.sst.utility as sst_u
 
 
 class SortedTableWriter:
-    def __init__(self, root_data_path: str):
+    def __init__(
+        self,
+        root_data_path: str,
+        config: Optional[sst_u.SortedTableConfiguration] = None,
+        reader: Optional[sst_read.SortedTableReader] = None,
+    ):
         self._root_data_path = root_data_path
+        self._config = config or sst_u.SortedTableConfiguration(levels={})
+        # reader whose caches must follow files as they are added and removed
+        self._reader = reader
 
-    def write(self, level: int, block_size: int, records: Iterable[dict]) -> Tuple[str, str]:
+    def write(
+        self, level: int, block_size: int, records: Iterable[Tuple[str, Any]], file_id: Optional[str] = None
+    ) -> Tuple[str, str]:
         folder = sst_u.level_dir(self._root_data_path, level)
         os.makedirs(folder, exist_ok=True)
 
-        file_id = str(ULID())
-        data_path = sst_u.data_path(folder, file_id)
+        file_id = file_id or str(ULID())
+        level_cfg = self._config.for_level(level)
+        record_format = sst_format.for_level(level_cfg)
+        data_path = record_format.data_path(folder, file_id)
         index_path = sst_u.index_path(folder, file_id)
 
+        keys: List[str] = []
         index = []
-        block_num = 0
-        block_record_count = 0
-        block_first_key: Optional[str] = None
-        block_start_offset = 0
+        block: List[Tuple[str, Any]] = []
 
         with open(data_path, "wb") as f:
-            for record_num, record in enumerate(records):
-                key, value = record["key"], record["value"]
-                if record_num % block_size == 0:
-                    if block_first_key is not None:
-                        index.append(
-                            {
-                                "block": block_num,
-                                "first_key": block_first_key,
-                                "offset": block_start_offset,
-                                "record_count": block_record_count,
-                            }
-                        )
-                        block_num += 1
-                    block_start_offset = f.tell()
-                    block_first_key = key
-                    block_record_count = 0
-
-                line = (json.dumps({"key": key, "value": value}) + "\n").encode("utf-8")
-                f.write(line)
-                block_record_count += 1
-
-            if block_first_key is not None:
+
+            def write_block():
+                # blocks are encoded whole so formats can share key prefixes within a block
+                offset = f.tell()
+                f.write(record_format.encode_block(block, level_cfg.restart_interval))
                 index.append(
                     {
-                        "block": block_num,
-                        "first_key": block_first_key,
-                        "offset": block_start_offset,
-                        "record_count": block_record_count,
+                        "block": len(index),
+                        "first_key": block[0][0],
+                        "offset": offset,
+                        "record_count": len(block),
+                        "length": f.tell() - offset,
                     }
                 )
+                block.clear()
+
+            f.write(record_format.file_header())
+            records = iter(records)
+            if record_format.wants_sample:
+                # train the file's compression dictionary on its first blocks before writing any
+                sample = list(itertools.islice(records, block_size * 8))
+                record_format.train(sample)
+                records = itertools.chain(sample, records)
+
+            for key, value in records:
+                block.append((key, value))
+                keys.append(key)
+                if len(block) >= block_size:
+                    write_block()
+
+            if block:
+                write_block()
+            f.write(record_format.file_footer())
+            self._sync(f)
 
         with open(index_path, "w", encoding="utf-8") as f:
             for entry in index:
                 f.write(json.dumps(entry) + "\n")
-
+            self._sync(f)
+
+        bloom = self._write_filter(level, folder, file_id, keys)
+        if self._reader is not None:
+            metadata = sst_meta.SortedTableMetadata(
+                blocks=index, bloom=bloom, record_format=record_format, last_key=keys[-1] if keys else None
+            )
+            self._reader.file_added(folder, file_id, metadata)
         return data_path, file_id
 
     def preserve_files(self, level: int, file_ids: List[str]) -> str:
@@ -77,34 +103,45 @@ class SortedTableWriter:
             self.remove_file(level, id)
 
         file_ids.sort(reverse=True)
-        return file_ids[0]
+        return file_ids[0] if file_ids else None
 
     def remove_file(self, level: int, file_id: str) -> None:
         folder = sst_u.level_dir(self._root_data_path, level)
-        for path in (
-            sst_u.data_path(folder, file_id),
-            sst_u.index_path(folder, file_id),
-        ):
+        # let the reader close its handle first - open files cannot be deleted on Windows
+        if self._reader is not None:
+            self._reader.file_removed(folder, file_id)
+        data_paths = [fmt.data_path(folder, file_id) for fmt in sst_format.all_formats()]
+        for path in data_paths + [sst_u.index_path(folder, file_id), sst_u.filter_path(folder, file_id)]:
             if os.path.exists(path):
                 os.remove(path)
 
     def write_split(
-        self, level: int, records: Iterator[dict], split_keys: List[str], block_size: int, max_blocks_per_file: int
+        self,
+        level: int,
+        records: Iterator[Tuple[str, Any]],
+        split_keys: List[str],
+        block_size: int,
+        max_blocks_per_file: int,
+        started: Optional[List[str]] = None,
     ) -> List[str]:
         # Write records across multiple files; start a new file at each split key
         # and also when the current file reaches max_records_per_file.
+        # `started` collects each file id before its file is written - a failed caller removes them.
         split_idx = 0
         file_ids: List[str] = []
-        buffer: List[dict] = []
+        buffer: List[Tuple[str, Any]] = []
         max_records_per_file = max_blocks_per_file * block_size
 
         def flush():
-            data_path, _ = self.write(level, block_size, buffer)
-            file_ids.append(os.path.basename(data_path)[:-6])
+            file_id = str(ULID())
+            if started is not None:
+                started.append(file_id)
+            self.write(level, block_size, buffer, file_id)
+            file_ids.append(file_id)
             buffer.clear()
 
         for record in records:
-            while split_idx < len(split_keys) and record["key"] >= split_keys[split_idx]:
+            while split_idx < len(split_keys) and record[0] >= split_keys[split_idx]:
                 if buffer:
                     flush()
                 split_idx += 1
@@ -116,3 +153,27 @@ class SortedTableWriter:
             flush()
 
         return file_ids
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _write_filter(self, level: int, folder: str, file_id: str, keys: List[str]) -> Optional[sst_bloom.BloomFilter]:
+        bits_per_key = self._config.for_level(level).bloom_bits_per_key
+        if bits_per_key <= 0 or not keys:
+            return None
+
+        bloom = sst_bloom.BloomFilter.for_keys(len(keys), bits_per_key)
+        for key in keys:
+            bloom.add(key)
+
+        with open(sst_u.filter_path(folder, file_id), "wb") as f:
+            f.write(bloom.to_bytes())
+            self._sync(f)
+        return bloom
+
+    def _sync(self, f) -> None:
+        # the caller syncs the level directory once all of its new files are written
+        if self._config.sync_files:
+            f.flush()
+            os.fsync(f.fileno())
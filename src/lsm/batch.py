@@ -0,0 +1,41 @@
+from typing import Any, Dict, List, Tuple
+
+import src.dsa.sst.utility as sst_u
+
+
+class WriteBatch:
+    """Puts and deletes applied together: one WAL record, one contiguous LSN range, one memtable.
+
+    A key written twice keeps its last operation. Operations are applied in key order so each
+    skip-list descent starts from the previous key's position.
+    """
+
+    def __init__(self):
+        self._ops: Dict[str, Any] = {}
+
+    def put(self, key: str, value: Any) -> "WriteBatch":
+        self._ops.pop(key, None)
+        self._ops[key] = value
+        return self
+
+    def delete(self, key: str) -> "WriteBatch":
+        self._ops.pop(key, None)
+        self._ops[key] = sst_u.tombstone()
+        return self
+
+    def clear(self) -> None:
+        self._ops.clear()
+
+    def sorted_ops(self) -> List[Tuple[str, Any]]:
+        # (key, value) in key order; deletes carry the tombstone sentinel
+        return sorted(self._ops.items())
+
+    def with_sequences(self, lsns: List[str]) -> List[Tuple[str, Any, str]]:
+        # lsns is the batch's contiguous range, handed out in key order
+        ops = self.sorted_ops()
+        if len(lsns) != len(ops):
+            raise ValueError(f"expected {len(ops)} sequence numbers, got {len(lsns)}")
+        return [(key, value, lsn) for (key, value), lsn in zip(ops, lsns)]
+
+    def __len__(self) -> int:
+        return len(self._ops)
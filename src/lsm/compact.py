@@ -1,23 +1,137 @@
+from typing import List, Optional, Tuple
+
 import src.dsa.sst.compact as sst_compact
+import src.dsa.sst.manifest as sst_manifest
+import src.dsa.sst.read as sst_read
 import src.dsa.sst.utility as sst_u
 import src.dsa.sst.write as sst_write
 
 
 class LSMTreeCompator:
-    def __init__(self, data_root_path: str):
-        # only compacting 1 level for demo purposes
-        l1_only_config = sst_u.SortedTableConfiguration(levels={1: sst_u.SortedLevelConfiguration()})
+    def __init__(
+        self,
+        data_root_path: str,
+        reader: sst_read.SortedTableReader = None,
+        config: sst_u.SortedTableConfiguration = None,
+        max_subcompactions: int = 1,
+    ):
+        self._config = config or sst_u.SortedTableConfiguration(levels={})
         self._compactor = sst_compact.SortedTableCompactor(
             root_data_path=data_root_path,
-            config=l1_only_config,
+            config=self._config,
+            reader=reader,
+            max_subcompactions=max_subcompactions,
         )
 
-        self._writer = sst_write.SortedTableWriter(data_root_path)
+        self._data_root_path = data_root_path
+        self._reader = reader
+        self._writer = sst_write.SortedTableWriter(data_root_path, self._config, reader)
+        # per level, the last key of the previous compaction input - the next pick starts after it
+        self._compact_pointers: dict[int, str] = {}
 
-    def compact_level_zero(self, last_l1_id: str):
+    def compact_level_zero(self, last_l1_id: str = sst_u.ulid_max()):
         removed_l0_id, surviving_l1_ids = self._compactor.compact_level_zero(last_l1_id)
-        self._writer.remove_file(0, removed_l0_id)
-        return self._writer.preserve_files(1, surviving_l1_ids)
+        return self._install(0, removed_l0_id, surviving_l1_ids)
+
+    def compact_level(self, level: int) -> Optional[Tuple[int, str]]:
+        # one compaction step out of `level`; returns the (level, file_id) input, or None if there was none
+        if level == 0:
+            file_id = self._compactor.oldest_file_id(0)
+            if file_id is None:
+                return None
+            self.compact_level_zero()
+            return 0, file_id
+
+        picked = self._compactor.pick_file(level, self._compact_pointers.get(level))
+        if picked is None:
+            return None
+        removed_id, surviving_ids = self._compactor.compact_file(level, picked.file_id)
+        self._install(level, removed_id, surviving_ids)
+        self._compact_pointers[level] = picked.last_key
+        return level, picked.file_id
+
+    def compact_levels(self) -> List[Tuple[int, str]]:
+        # leveled compaction: while some level L1+ is over its target size, push one of its
+        # files into the overlapping files of the next level, fullest level first
+        compacted = []
+        while True:
+            level = self._pick_level()
+            if level is None:
+                return compacted
+            step = self.compact_level(level)
+            if step is None:
+                return compacted
+            compacted.append(step)
+
+    def level_scores(self) -> dict[int, float]:
+        # L0 by file count against its trigger, L1+ by bytes against the level target;
+        # above 1.0 a level needs compacting
+        scores = {0: len(self._compactor.level_file_ids(0)) / max(self._config.level0_file_trigger, 1)}
+        for level in range(1, self._config.max_level + 1):
+            scores[level] = self._compactor.level_bytes(level) / self._config.target_bytes(level)
+        return scores
+
+    def remove_orphan_files(self):
+        # files left behind by a flush or compaction that crashed before its MANIFEST edit
+        manifest = self._reader.manifest if self._reader is not None else None
+        if manifest is None:
+            return
+        version = manifest.current()
+        for level in range(0, max(version.levels(), default=1) + 1):
+            live = set(version.file_ids(level))
+            folder = sst_u.level_dir(self._data_root_path, level)
+            for file_id in self._reader.scan_file_ids(folder):
+                if file_id not in live:
+                    self._writer.remove_file(level, file_id)
 
     def newest_file_id(self, level: int):
         return self._compactor.newest_file_id(level)
+
+    def subcompaction_stats(self) -> dict:
+        return dict(self._compactor.stats)
+
+    def close(self):
+        self._compactor.close()
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _pick_level(self):
+        # the last level has no level below it to compact into
+        scores = {level: score for level, score in self.level_scores().items() if 0 < level < self._config.max_level}
+        level = max(scores, key=scores.get, default=None)
+        return level if level is not None and scores[level] > 1.0 else None
+
+    def _install(self, level: int, removed_id: str, surviving_ids: List[str]):
+        next_level = level + 1
+        if surviving_ids and self._config.sync_files:
+            # the writer synced each output file; their directory entries go before the edit naming them
+            sst_u.fsync_dir(sst_u.level_dir(self._data_root_path, next_level))
+        manifest = self._reader.manifest if self._reader is not None else None
+        if manifest is None:
+            if removed_id is not None:
+                self._writer.remove_file(level, removed_id)
+            return self._writer.preserve_files(next_level, surviving_ids)
+
+        if removed_id is None:
+            return manifest.current().newest_file_id(next_level)
+
+        # install the new files and retire the inputs in one MANIFEST edit
+        next_dir = sst_u.level_dir(self._data_root_path, next_level)
+        live_ids = manifest.current().file_ids(next_level)
+        edit = sst_manifest.SortedTableVersionEdit()
+        edit.remove_file(level, removed_id)
+        replaced_ids = [fid for fid in live_ids if fid not in surviving_ids]
+        for fid in replaced_ids:
+            edit.remove_file(next_level, fid)
+        for fid in surviving_ids:
+            if fid not in live_ids:
+                edit.add_file(self._reader.file_meta(next_dir, fid))
+        version = manifest.log_and_apply(edit)
+
+        # inputs are unreachable from the new version - delete them once no search still reads them
+        manifest.remove_when_unused(level, removed_id, self._writer.remove_file)
+        for fid in replaced_ids:
+            manifest.remove_when_unused(next_level, fid, self._writer.remove_file)
+        return version.newest_file_id(next_level)
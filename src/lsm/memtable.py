@@ -1,34 +1,203 @@
 import re
 import os
-from typing import Tuple, Any
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional, Tuple
 
-from src.dsa.memtable.skip_list import SkipList
+import src.dsa.memtable.backends as mt_backends
+import src.dsa.memtable.skip_list as skip_list
+import src.dsa.sst.manifest as sst_manifest
+import src.dsa.sst.read as sst_read
+import src.dsa.sst.utility as sst_u
 import src.dsa.sst.write as sst_write
+import src.lsm.read_view as lsm_view
+import src.lsm.snapshot as lsm_snap
+
+# lock-free tries of a memtable read before it waits for the lock instead (see read_consistent)
+OPTIMISTIC_READS = 8
+# failed flushes of the oldest frozen memtable in a row before waiting for the queue gives up,
+# and the pause between those retries
+MAX_FLUSH_FAILURES = 5
+FLUSH_RETRY_DELAY_S = 1.0
+
+
+@dataclass
+class ImmutableMemtable:
+    memtable: mt_backends.Memtable
+    # WAL segments holding its writes - retired only after the L0 file is in the MANIFEST
+    wal_segments: List[int] = field(default_factory=list)
 
 
 class LSMTreeMemtable:
     _max_memtable_count = 100
+    _max_memtable_bytes = 4 * 1024 * 1024
     _data_root_path = ""
 
     def __init__(
         self,
         max_memtable_count: int,
         data_root_path: str,
-        memtable_skip_levels: int = 3,
+        memtable_skip_levels: Optional[int] = None,
         index_block_size: int = 10,
+        reader: sst_read.SortedTableReader = None,
+        sst_config: sst_u.SortedTableConfiguration = None,
+        max_immutable_memtables: int = 4,
+        max_memtable_bytes: int = 4 * 1024 * 1024,
+        memtable_backend: str = "skiplist",
     ):
+        # flush on approximate memory first; the entry count (tombstones included) is a secondary cap
+        self._max_memtable_bytes = max_memtable_bytes
         self._max_memtable_count = max_memtable_count
+        self._reader = reader
+        self._sst_config = sst_config
 
         self._data_root_path = data_root_path
         os.makedirs(self._data_root_path, exist_ok=True)
-        self._current = SkipList(block_size=index_block_size, max_level=memtable_skip_levels)
+        # every memtable, active or frozen, is a fresh instance of the same backend
+        self._memtable_backend = memtable_backend
+        self._memtable_skip_levels = memtable_skip_levels
+        self._index_block_size = index_block_size
+        # live snapshots: a memtable keeps an overwritten value while one of them still reads it
+        self._snapshots = lsm_snap.SnapshotList()
+        self._current = self._new_memtable()
+
+        # frozen memtables waiting for the flush thread, oldest first; searches consult them
+        # newest first. `lock` serializes writers: group applies and swaps of current/immutables.
+        # Readers never need it - see read_consistent
+        self._max_immutable_memtables = max_immutable_memtables
+        self._immutables: List[ImmutableMemtable] = []
+        self._lock = threading.RLock()
+        self._flush_cond = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._on_flushed: Optional[Callable[[str, List[int]], None]] = None
+        self._stopping = False
+        self._flushing = False
+        self._last_flush_error: Optional[str] = None
+        self._flush_failures = 0
+
+        # readers take the published view (memtables + pinned MANIFEST version) without this lock;
+        # every freeze, flush and MANIFEST change publishes a new one
+        self._last_sequence: Optional[str] = None
+        # odd while a write group is being applied; every group moves it on by two
+        self._apply_epoch = 0
+        # a snapshot was released since the memtables' retained history was last pruned
+        self._prune_pending = False
+        manifest = reader.manifest if reader is not None else None
+        self._views = lsm_view.ReadViews(manifest)
+        self.publish_view()
+        if manifest is not None:
+            manifest.subscribe(self.publish_view)
 
     def set_max_memtable_count(self, value: int):
         self._max_memtable_count = value
 
+    def set_max_memtable_bytes(self, value: int):
+        self._max_memtable_bytes = value
+
     def get_current(self):
         return self._current
 
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    @property
+    def snapshots(self) -> lsm_snap.SnapshotList:
+        return self._snapshots
+
+    @property
+    def views(self) -> lsm_view.ReadViews:
+        return self._views
+
+    @property
+    def last_sequence(self) -> Optional[str]:
+        # the newest LSN applied to a memtable - every write up to it is visible to readers
+        return self._last_sequence
+
+    def set_last_sequence(self, lsn: str) -> None:
+        with self._lock:
+            if self._last_sequence is None or lsn > self._last_sequence:
+                self._last_sequence = lsn
+
+    @contextmanager
+    def applying(self):
+        # around a write group's memtable updates, with its last LSN published (set_last_sequence)
+        # before the end: readers that overlapped any of it read again
+        with self._lock:
+            self._prune_history()
+            self._apply_epoch += 1
+            try:
+                yield self._current
+            finally:
+                self._apply_epoch += 1
+
+    def read_consistent(self, read: Callable[[], Any], discard: Callable[[Any], None] = None) -> Any:
+        """read() over the memtables without the lock, as of the last write group applied.
+
+        A read that overlapped a group's apply may have seen part of it - it is run again, and
+        `discard` gets its result. Readers never wait on a writer unless they lose that race
+        OPTIMISTIC_READS times in a row; then they take the lock, which a writer holds only while
+        applying one group.
+        """
+        for _ in range(OPTIMISTIC_READS):
+            epoch = self._apply_epoch
+            if epoch % 2 == 0:
+                result = read()
+                if self._apply_epoch == epoch:
+                    return result
+                if discard is not None:
+                    discard(result)
+            time.sleep(0)
+        with self._lock:
+            return read()
+
+    def acquire_snapshot(self) -> Tuple[str, lsm_view.ReadView]:
+        # the last applied sequence and a view to read it in, registered before any later write
+        # can overwrite a value the snapshot reads
+        def register():
+            sequence = self._last_sequence or sst_u.ulid_min()
+            self._snapshots.acquire(sequence)
+            return sequence, self._views.acquire()
+
+        return self.read_consistent(register, discard=self.release_snapshot)
+
+    def release_snapshot(self, snapshot: Tuple[str, lsm_view.ReadView]) -> None:
+        sequence, view = snapshot
+        self._snapshots.release(sequence)
+        self._views.release(view)
+        # the values kept only for it are dropped by the next write group or freeze, which hold the
+        # writers' lock anyway - a reader releasing its snapshot never waits for it
+        self._prune_pending = True
+
+    def publish_view(self) -> None:
+        with self._lock:
+            sources = [(self._current, "MT")] + [(imm.memtable, "IMM") for imm in reversed(self._immutables)]
+            self._views.publish(sources)
+
+    def get_immutables(self) -> List[mt_backends.Memtable]:
+        # newest first - the order a search must consult them in
+        with self._lock:
+            return [imm.memtable for imm in reversed(self._immutables)]
+
+    def is_full(self) -> bool:
+        # entry_count, not count(): deletes of absent keys add tombstone nodes but no live entries
+        current = self._current
+        return (
+            current.approximate_bytes() >= self._max_memtable_bytes or current.entry_count() >= self._max_memtable_count
+        )
+
+    def memory_usage(self) -> dict:
+        with self._lock:
+            return {
+                "active_bytes": self._current.approximate_bytes(),
+                "immutable_bytes": sum(imm.memtable.approximate_bytes() for imm in self._immutables),
+                "max_memtable_bytes": self._max_memtable_bytes,
+            }
+
     def sanitize_key(self, s: str) -> str:
         s = s.lower()
         s = re.sub(r"[^a-z0-9-]", "-", s)
@@ -44,20 +213,190 @@ class LSMTreeMemtable:
     def memtable_keys(self):
         return self._current.ordered_keys()
 
-    def flush_if_full(self):
-        if self._current.count() >= self._max_memtable_count:
-            flush = self._current
-            self.init_memtable()
-
-            write_records = sst_write.SortedTableWriter(self._data_root_path).write
-            _, file_id = flush.flush_to_level_zero(write_records)
+    def flush_if_full(self, wal_segments: List[int] = ()) -> Optional[str]:
+        if self.is_full():
+            # queued like a frozen memtable, so readers keep finding its keys until the L0 file is
+            # installed - with the log number past wal_segments, as the flush thread does
+            with self._lock:
+                self._immutables.append(ImmutableMemtable(self._current, list(wal_segments)))
+                self.init_memtable()
+            file_id = self._flush_oldest()
             print(f"created L0 file id: {file_id}")
             return file_id
 
         return None
 
+    def load_sorted(self, entries: Iterable[Tuple[str, Any, str]]) -> None:
+        # (key, data, lsn) in ascending key order, e.g. a WAL replay; tombstones included
+        newest = []
+
+        def tracked():
+            for entry in entries:
+                if not newest or entry[2] > newest[0]:
+                    newest[:] = [entry[2]]
+                yield entry
+
+        with self.applying() as current:
+            if current.entry_count() == 0:
+                current.bulk_load(tracked())
+            else:
+                current.apply_sorted(tracked())
+            if newest:
+                self.set_last_sequence(newest[0])
+
+    def freeze(self, wal_segments: List[int]) -> mt_backends.Memtable:
+        # the full memtable turns read-only and joins the flush queue; writes go to a fresh one
+        with self._flush_cond:
+            # write stall: too many memtables waiting means the flush thread cannot keep up
+            while len(self._immutables) >= self._max_immutable_memtables and self._flush_thread is not None:
+                self._flush_cond.wait()
+            self._prune_history()
+            frozen = self._current
+            self._immutables.append(ImmutableMemtable(frozen, list(wal_segments)))
+            self.init_memtable()
+            self._flush_cond.notify_all()
+            return frozen
+
+    def start_flush_worker(self, on_flushed: Callable[[str, List[int]], None] = None) -> None:
+        # on_flushed(file_id, wal_segments) runs on the flush thread once an L0 file is installed
+        if self._flush_thread is not None:
+            return
+        self._on_flushed = on_flushed
+        self._stopping = False
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="lsm-flush", daemon=True)
+        self._flush_thread.start()
+
+    def wait_for_flushes(self) -> None:
+        # block until every frozen memtable is an installed L0 file; raises once the flush thread
+        # has failed MAX_FLUSH_FAILURES times in a row (it keeps retrying in the background)
+        if self._flush_thread is None:
+            # no flush thread: flush them here - outside the lock, as the thread does
+            while self._flush_oldest() is not None:
+                pass
+            return
+        with self._flush_cond:
+            while (self._immutables or self._flushing) and not self._flush_given_up():
+                self._flush_cond.wait()
+            if self._flush_given_up():
+                raise RuntimeError(
+                    f"flush failed {self._flush_failures} times in a row, {len(self._immutables)} frozen "
+                    f"memtables left in their WAL segments: {self._last_flush_error}"
+                )
+
+    def stop_flush_worker(self) -> None:
+        # drains the queue first: a frozen memtable only exists in memory and its WAL files. If the
+        # flushes keep failing the thread still ends, and the error is raised once it has
+        try:
+            self.wait_for_flushes()
+        finally:
+            with self._flush_cond:
+                self._stopping = True
+                self._flush_cond.notify_all()
+            if self._flush_thread is not None:
+                self._flush_thread.join()
+            self._flush_thread = None
+
+    def flush_status(self) -> dict:
+        with self._lock:
+            return {
+                "immutable_memtables": len(self._immutables),
+                "immutable_keys": sum(imm.memtable.count() for imm in self._immutables),
+                "immutable_bytes": sum(imm.memtable.approximate_bytes() for imm in self._immutables),
+                "flushing": self._flushing,
+                "last_error": self._last_flush_error,
+            }
+
     def init_memtable(self):
-        self._current = SkipList(block_size=self._current.block_size, max_level=self._current.max_level)
+        with self._lock:
+            self._current = self._new_memtable()
+            self.publish_view()
+
+    def _new_memtable(self) -> mt_backends.Memtable:
+        # skip lists start as tall as the entry cap calls for (and grow past it under a byte budget)
+        skip_levels = self._memtable_skip_levels or skip_list.height_for(self._max_memtable_count)
+        return mt_backends.for_name(
+            self._memtable_backend,
+            block_size=self._index_block_size,
+            skip_levels=skip_levels,
+            retain=self._snapshots.needs,
+        )
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._flush_cond:
+                while not self._immutables and not self._stopping:
+                    self._flush_cond.wait()
+                if not self._immutables or (self._stopping and self._flush_given_up()):
+                    return
+                self._flushing = True
+            try:
+                self._flush_oldest()
+                with self._flush_cond:
+                    self._flush_failures = 0
+            except Exception:
+                # keep the memtable queued and its WAL on disk; retry rather than lose writes
+                with self._flush_cond:
+                    self._last_flush_error = traceback.format_exc(limit=3)
+                    self._flush_failures += 1
+                time.sleep(FLUSH_RETRY_DELAY_S)
+            finally:
+                with self._flush_cond:
+                    self._flushing = False
+                    self._flush_cond.notify_all()
+
+    def _prune_history(self) -> None:
+        # under the lock; the flag is cleared first, so a release during the prune is not lost
+        if self._prune_pending:
+            self._prune_pending = False
+            for memtable in [self._current] + [imm.memtable for imm in self._immutables]:
+                memtable.prune_history()
+
+    def _flush_given_up(self) -> bool:
+        return bool(self._immutables) and self._flush_failures >= MAX_FLUSH_FAILURES
+
+    def _flush_oldest(self) -> Optional[str]:
+        # oldest first, so L0 file ids keep the order the memtables were written in; one at a time,
+        # though without the flush thread a writer and wait_for_flushes may both get here
+        with self._flush_lock:
+            with self._lock:
+                if not self._immutables:
+                    return None
+                imm = self._immutables[0]
+            return self._flush(imm)
+
+    def _flush(self, imm: ImmutableMemtable) -> str:
+        # the slow part runs outside the lock; searches still find the keys in the frozen memtable
+        write_records = sst_write.SortedTableWriter(self._data_root_path, self._sst_config, self._reader).write
+        _, file_id = imm.memtable.flush_to_level_zero(write_records)
+
+        # install the L0 file, then drop the memtable: a view published in between holds both,
+        # never neither. The MANIFEST fsync runs outside the lock, so writers carry on meanwhile.
+        # Segments are numbered in memtable order: everything up to this memtable's is now flushed
+        log_number = max(imm.wal_segments) + 1 if imm.wal_segments else None
+        self._install_level_zero(file_id, log_number)
+        with self._flush_cond:
+            self._immutables.pop(0)
+            self.publish_view()
+            self._flush_cond.notify_all()
+
+        if self._on_flushed is not None:
+            self._on_flushed(file_id, imm.wal_segments)
+        return file_id
+
+    def _install_level_zero(self, file_id: str, log_number: Optional[int] = None):
+        # the new file only becomes visible to readers once its MANIFEST edit is durable; its
+        # directory entry must be durable before that edit, and before the WAL behind it is retired
+        l0_dir = sst_u.level_dir(self._data_root_path, 0)
+        if self._sst_config is None or self._sst_config.sync_files:
+            sst_u.fsync_dir(l0_dir)
+        manifest = self._reader.manifest if self._reader is not None else None
+        if manifest is None:
+            return
+        meta = self._reader.file_meta(l0_dir, file_id)
+        if meta is not None:
+            edit = sst_manifest.SortedTableVersionEdit(log_number=log_number)
+            edit.add_file(meta)
+            manifest.log_and_apply(edit)
 
     def sensor_value(self, customer_id: str, raw: str) -> Tuple[str, Any] | None:
         parts = [p.strip() for p in raw.split(",")]
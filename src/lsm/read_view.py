@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, List, Optional, Tuple
+
+import src.dsa.sst.manifest as sst_manifest
+
+
+class ReadView:
+    """What a read sees: the active memtable, the frozen ones (newest first) and a MANIFEST version.
+
+    Never changed once published - a freeze, flush or compaction publishes a new view instead.
+    Every reader holds a reference while it reads; the version stays pinned, and so its files stay
+    on disk, until the last reference is dropped.
+    """
+
+    def __init__(self, memtables: List[Tuple[Any, str]], version: Optional[sst_manifest.SortedTableVersion]):
+        self.memtables = tuple(memtables)  # (memtable, source label)
+        self.version = version
+        self._refs = 1  # the publisher's own, dropped when a newer view replaces this one
+
+
+class ReadViews:
+    """The current ReadView, swapped by writers and reference-counted for readers.
+
+    Readers only take a short lock to count their reference - never the memtable lock or the
+    MANIFEST lock - so a running flush or compaction does not hold them up.
+    """
+
+    def __init__(self, manifest: sst_manifest.SortedTableManifest = None):
+        self._manifest = manifest
+        self._lock = threading.Lock()
+        self._current: Optional[ReadView] = None
+        self._published = 0
+
+    def publish(self, memtables: List[Tuple[Any, str]]) -> ReadView:
+        # called by writers, with the memtable lock held so memtables and version agree - readers never take it
+        version = self._manifest.pin() if self._manifest is not None else None
+        view = ReadView(memtables, version)
+        with self._lock:
+            previous, self._current = self._current, view
+            self._published += 1
+        if previous is not None:
+            self.release(previous)
+        return view
+
+    def acquire(self) -> ReadView:
+        with self._lock:
+            view = self._current
+            view._refs += 1
+            return view
+
+    def release(self, view: ReadView) -> None:
+        with self._lock:
+            view._refs -= 1
+            unused = view._refs == 0
+        if unused and view.version is not None:
+            # the last reader of a replaced view: compacted files it listed may be deleted now
+            self._manifest.unpin(view.version)
+
+    @contextmanager
+    def reading(self):
+        view = self.acquire()
+        try:
+            yield view
+        finally:
+            self.release(view)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"published": self._published, "current_refs": self._current._refs if self._current else 0}
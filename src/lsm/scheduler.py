@@ -0,0 +1,172 @@
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional
+
+import src.lsm.compact as lsm_c
+
+
+@dataclass
+class CompactionJob:
+    level: int
+    score: float
+    started_at: Optional[float] = None
+    file_id: Optional[str] = None  # input file, known once the job has run
+
+    def as_dict(self) -> dict:
+        result = {"level": f"L{self.level}", "score": round(self.score, 3)}
+        if self.started_at is not None:
+            result["running_for_s"] = round(time.monotonic() - self.started_at, 3)
+        return result
+
+
+class CompactionScheduler:
+    """Runs compaction on a background worker thread.
+
+    Every level is scored - L0 by file count against `level0_file_trigger`, L1+ by bytes against
+    the level target - and the highest score above 1.0 is compacted one step at a time. Each step
+    publishes its result through a single MANIFEST edit, so `save` and `search` never wait for a
+    merge and never see half of one.
+    """
+
+    def __init__(self, compactor: lsm_c.LSMTreeCompator, poll_interval: float = 1.0):
+        self._compactor = compactor
+        self._poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        # held for the duration of a job - exclusive() takes it to keep jobs out entirely
+        self._job_lock = threading.Lock()
+        self._paused = False
+        self._stopping = False
+        self._wakeup = False
+        self._queued: List[CompactionJob] = []
+        self._running: Optional[CompactionJob] = None
+        self._completed = 0
+        self._failed = 0
+        self._last_error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Public interface
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="lsm-compaction", daemon=True)
+        self._thread.start()
+
+    def notify(self) -> None:
+        # something changed (a flush landed) - re-score now rather than at the next poll
+        with self._cond:
+            self._wakeup = True
+            self._cond.notify_all()
+
+    def pause(self) -> None:
+        # no new jobs start; a job already running finishes
+        with self._cond:
+            self._paused = True
+
+    def resume(self) -> None:
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if wait and self._thread is not None:
+            # the worker exits after its in-flight job
+            self._thread.join()
+        self._thread = None
+
+    @contextmanager
+    def exclusive(self):
+        # waits for a running job, then keeps the worker out - for manual compaction and truncate
+        with self._job_lock:
+            yield
+
+    def status(self) -> dict:
+        with self._cond:
+            if self._stopping or self._thread is None:
+                state = "stopped"
+            else:
+                state = "paused" if self._paused else "running"
+            return {
+                "state": state,
+                "running": self._running.as_dict() if self._running is not None else None,
+                "queued": [job.as_dict() for job in self._queued],
+                "completed": self._completed,
+                "failed": self._failed,
+                "last_error": self._last_error,
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._paused and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+
+            job = self._plan()
+            if job is None:
+                with self._cond:
+                    if not self._wakeup and not self._stopping:
+                        self._cond.wait(self._poll_interval)
+                    self._wakeup = False
+                continue
+
+            with self._job_lock:
+                with self._cond:
+                    if self._paused or self._stopping:
+                        continue
+                    self._running = job
+                    self._queued.remove(job)
+                self._execute(job)
+
+    def _plan(self) -> Optional[CompactionJob]:
+        # every level over its target, fullest first; the deepest level has nowhere to go
+        try:
+            scores = self._compactor.level_scores()
+        except Exception:
+            self._record_failure()
+            return None
+        last_level = max(scores)
+        jobs = [
+            CompactionJob(level=level, score=score)
+            for level, score in scores.items()
+            if score > 1.0 and level < last_level
+        ]
+        jobs.sort(key=lambda job: job.score, reverse=True)
+        with self._cond:
+            self._queued = jobs
+        return jobs[0] if jobs else None
+
+    def _execute(self, job: CompactionJob) -> None:
+        job.started_at = time.monotonic()
+        try:
+            step = self._compactor.compact_level(job.level)
+            job.file_id = step[1] if step is not None else None
+            with self._cond:
+                self._completed += 1
+        except Exception:
+            self._record_failure()
+            # back off instead of retrying a failing job in a tight loop
+            with self._cond:
+                self._cond.wait(self._poll_interval)
+        finally:
+            with self._cond:
+                self._running = None
+
+    def _record_failure(self) -> None:
+        with self._cond:
+            self._failed += 1
+            self._last_error = traceback.format_exc(limit=3)
@@ -1,18 +1,39 @@
+import heapq
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
 import src.dsa.sst.read as sst_read
 import src.dsa.sst.utility as sst_u
-from src.dsa.memtable.skip_list import SkipList
+import src.dsa.memtable.backends as mt_backends
+from src.dsa.memtable.skip_list import SkipListNode
 import src.dsa.sst.search as sst_search
+import src.lsm.snapshot as lsm_snap
+
+
+# memtable entries a scan reads per consistent read (see LSMTreeMemtable.read_consistent)
+_SCAN_CHUNK = 256
 
 
 class LSMTreeSearch:
-    def __init__(self, memtable: SkipList, data_root_path: str, max_sst_levels: int, last_file_ids: dict[int, str]):
-        self._reader = sst_read.SortedTableReader(data_root_path)
+    def __init__(
+        self,
+        memtable: mt_backends.Memtable,
+        data_root_path: str,
+        max_sst_levels: int,
+        last_file_ids: dict[int, str] = None,
+        reader: sst_read.SortedTableReader = None,
+        memtables=None,
+    ):
+        self._reader = reader or sst_read.SortedTableReader(data_root_path)
 
         self._sst = sst_search.SortedTableSearch(self._reader)
         self._memtable = memtable
+        # optional LSMTreeMemtable: when set, the active memtable and its frozen queue are read from it
+        self._memtables = memtables
 
         self._max_sst_levels = max_sst_levels
-        self._last_file_ids = last_file_ids
+        # optional upper bound per level; levels without one see every live file
+        self._last_file_ids = last_file_ids if last_file_ids is not None else {}
         if 0 not in self._last_file_ids:
             self._last_file_ids[0] = sst_u.ulid_max()
 
@@ -25,34 +46,254 @@ class LSMTreeSearch:
     def update_last_id(self, level: int, last_id: str):
         self._last_file_ids[level] = last_id
 
-    def update_memtable(self, memtable: SkipList):
+    def update_memtable(self, memtable: mt_backends.Memtable):
         self._memtable = memtable
 
-    def search(self, key: str):
-        result = self._memtable.search(key)
-        if result is not None:
-            if result.is_tombstoned():
-                none_value = self._memtable.build_value({"data": None, "lsn": result.lsn})
-                return none_value, f"MT{sst_u.tombstone_source()}"
+    def get_snapshot(self) -> lsm_snap.Snapshot:
+        """A consistent view as of the newest LSN applied, until release_snapshot.
 
-            # need to make a copy to break reference to in memory
-            return self._memtable.build_value(result.__dict__), "MT"
+        Pass it to search, multi_get or scan: they see every write up to its sequence and none
+        after, while writes, flushes and compactions carry on. Always taken at "now": SSTables are
+        read from the pinned version without LSN filtering, and memtables only retain overwritten
+        values from the moment a snapshot exists, so an older sequence could not be honored.
+        """
+        if self._memtables is None:
+            raise ValueError("snapshots need the LSMTreeMemtable passed as memtables=")
+        sequence, view = self._memtables.acquire_snapshot()
+        return lsm_snap.Snapshot(sequence, view)
 
-        for i in range(0, self._max_sst_levels + 1):
-            last_id = self._last_file_ids[i] if i in self._last_file_ids else sst_u.ulid_min()
+    def release_snapshot(self, snapshot: lsm_snap.Snapshot) -> None:
+        if snapshot.released:
+            return
+        snapshot.released = True
+        self._memtables.release_snapshot((snapshot.sequence, snapshot.view))
 
-            sst_raw = self._sst.search(key, i, last_id)
-            if sst_raw is not None:
-                result = self._memtable.build_value(sst_raw)
+    def search(self, key: str, snapshot: lsm_snap.Snapshot = None):
+        with self._read_view(snapshot) as (memtables, version):
 
+            def first_found():
+                for memtable, source in memtables:
+                    result = memtable.search(key) if snapshot is None else memtable.value_at(key, snapshot.sequence)
+                    if result is not None:
+                        return memtable, result, source
+                return None
+
+            # a consistent read: a WriteBatch is either fully applied or not at all
+            found = self._consistent(first_found)
+            if found is not None:
+                memtable, result, source = found
                 if result.is_tombstoned():
-                    none_value = self._memtable.build_value({"data": None, "lsn": result.lsn})
-                    return none_value, f"L{i}{sst_u.tombstone_source()}"
+                    none_value = memtable.build_value({"data": None, "lsn": result.lsn})
+                    return none_value, f"{source}{sst_u.tombstone_source()}"
+
+                # need to make a copy to break reference to in memory
+                return memtable.build_value(result.__dict__), source
 
-                none_value = self._memtable.build_value({"data": None, "lsn": ""})
-                return result, f"L{i}"
+            for i in range(0, self._max_sst_levels + 1):
+                last_id = self._last_file_ids[i] if i in self._last_file_ids else sst_u.ulid_max()
+
+                sst_raw = self._sst.search(key, i, last_id, version)
+                if sst_raw is not None:
+                    result = self._memtable.build_value(sst_raw)
+
+                    if result.is_tombstoned():
+                        none_value = self._memtable.build_value({"data": None, "lsn": result.lsn})
+                        return none_value, f"L{i}{sst_u.tombstone_source()}"
+
+                    return result, f"L{i}"
 
         return None, f"L{self._max_sst_levels}"
 
+    def multi_get(
+        self, keys: List[str], snapshot: lsm_snap.Snapshot = None
+    ) -> List[Tuple[Optional[SkipListNode.SkipListValue], str]]:
+        """search() for every key, returned in input order with the same (value, source) semantics.
+
+        The keys are sorted once: the memtables resolve them in one ordered walk each, and every
+        SSTable level groups the rest by file and block so each block is opened once per call.
+        """
+        pending = sorted(set(keys))
+        resolved = {}
+
+        def resolve(key, raw_value: dict, source: str):
+            if raw_value["data"] == sst_u.tombstone():
+                none_value = self._memtable.build_value({"data": None, "lsn": raw_value["lsn"]})
+                resolved[key] = (none_value, f"{source}{sst_u.tombstone_source()}")
+            else:
+                resolved[key] = (self._memtable.build_value(raw_value), source)
+
+        with self._read_view(snapshot) as (memtables, version):
+
+            def memtable_values():
+                # (key, value dict, source) of every key a memtable holds, newest memtable first
+                found, keys = [], pending
+                for memtable, source in memtables:
+                    if snapshot is None:
+                        results = memtable.search_sorted(keys)
+                    else:
+                        results = [memtable.value_at(key, snapshot.sequence) for key in keys]
+                    missing = []
+                    for key, result in zip(keys, results):
+                        if result is None:
+                            missing.append(key)
+                        else:
+                            # a copy, so later writes to the memtable do not show through
+                            found.append((key, dict(result.__dict__), source))
+                    keys = missing
+                return found
+
+            for key, value, source in self._consistent(memtable_values):
+                resolve(key, value, source)
+            pending = [key for key in pending if key not in resolved]
+
+            for i in range(0, self._max_sst_levels + 1):
+                if not pending:
+                    break
+                last_id = self._last_file_ids[i] if i in self._last_file_ids else sst_u.ulid_max()
+                for key, sst_raw in self._sst.multi_search(pending, i, last_id, version).items():
+                    resolve(key, sst_raw, f"L{i}")
+                pending = [key for key in pending if key not in resolved]
+
+        missing = (None, f"L{self._max_sst_levels}")
+        return [resolved.get(key, missing) for key in keys]
+
+    def scan(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+        snapshot: lsm_snap.Snapshot = None,
+    ) -> Iterator[Tuple[str, SkipListNode.SkipListValue]]:
+        """Yield (key, value) for live keys with start <= key < end, in key order (descending if reverse).
+
+        Memtable, every overlapping L0 file and each lower level are merged lazily, block by block;
+        for a key present in several sources the newest one wins and tombstones hide the key.
+        """
+        if limit is not None and limit <= 0:
+            return
+
+        sequence = snapshot.sequence if snapshot is not None else None
+        with self._read_view(snapshot) as (memtables, version):
+            # priority 0 is the newest source: memtable, frozen memtables, L0 files newest first, lower levels
+            sources = [
+                _memtable_records(memtable, start, end, reverse, sequence, self._consistent)
+                for memtable, _ in memtables
+            ]
+            for i in range(0, self._max_sst_levels + 1):
+                last_id = self._last_file_ids[i] if i in self._last_file_ids else sst_u.ulid_max()
+                for records in self._sst.scan_sources(i, start, end, reverse, last_id, version):
+                    sources.append((record["key"], record["value"]) for record in records)
+
+            tagged = [_tag_source(source, priority) for priority, source in enumerate(sources)]
+            # newest source first among equal keys, in either direction
+            order = (lambda entry: (entry[0], -entry[1])) if reverse else None
+            merged = heapq.merge(*tagged, key=order, reverse=reverse)
+
+            last_key = None
+            produced = 0
+            for key, _, value in merged:
+                if key == last_key:
+                    continue  # shadowed by a newer source
+                last_key = key
+                if value["data"] == sst_u.tombstone():
+                    continue
+                yield key, self._memtable.build_value(value)
+                produced += 1
+                if limit is not None and produced >= limit:
+                    return
+
+    def prefix_scan(
+        self, prefix: str, limit: Optional[int] = None, reverse: bool = False, snapshot: lsm_snap.Snapshot = None
+    ) -> Iterator[Tuple[str, SkipListNode.SkipListValue]]:
+        return self.scan(prefix or None, sst_u.prefix_end(prefix), limit, reverse, snapshot)
+
+    def filter_stats(self) -> dict:
+        return self._sst.filter_stats.as_dict()
+
+    def block_cache_stats(self) -> dict:
+        return self._reader.block_cache_usage()
+
+    def table_cache_stats(self) -> dict:
+        return self._reader.table_cache_usage()
+
     def level_counts(self):
         return self._reader.get_level_counts(self._last_file_ids, self._max_sst_levels)
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _memtable_sources(self) -> List[Tuple[mt_backends.Memtable, str]]:
+        if self._memtables is None:
+            return [(self._memtable, "MT")]
+        self._memtable = self._memtables.get_current()
+        return [(self._memtable, "MT")] + [(imm, "IMM") for imm in self._memtables.get_immutables()]
+
+    def _consistent(self, read: Callable[[], Any]) -> Any:
+        # without an LSMTreeMemtable there is one memtable and no concurrent writer
+        return self._memtables.read_consistent(read) if self._memtables is not None else read()
+
+    @contextmanager
+    def _read_view(self, snapshot: lsm_snap.Snapshot = None):
+        # memtables and version are taken together: a flush installs its L0 file and drops the frozen
+        # memtable under the same lock, so every key is visible in exactly one of the two.
+        # Background compaction may retire files mid-search; a pinned version keeps them on disk
+        if snapshot is not None:
+            if snapshot.released:
+                raise ValueError(f"snapshot {snapshot.sequence} was released")
+            # the snapshot already holds both, pinned when it was taken
+            yield snapshot.memtables, snapshot.version
+            return
+        if self._memtables is not None:
+            # the published view: a reference count instead of the memtable lock
+            with self._memtables.views.reading() as view:
+                yield view.memtables, view.version
+            return
+        manifest = self._reader.manifest
+        memtables = self._memtable_sources()
+        version = manifest.pin() if manifest is not None else None
+        try:
+            yield memtables, version
+        finally:
+            if version is not None:
+                manifest.unpin(version)
+
+
+def _memtable_records(memtable, start, end, reverse: bool, sequence: Optional[str], consistent):
+    # (key, value dict) of one memtable; at a snapshot sequence, the value each key had then.
+    # Read in chunks, each a consistent read - a write is never seen half applied - that resumes
+    # past the last key of the chunk before, so a retried chunk is read again from the same place
+    last_key = None
+
+    def read_chunk():
+        lo, hi = start, end
+        if last_key is not None:
+            if reverse:
+                hi = last_key
+            else:
+                lo = last_key
+        seen, chunk = 0, []
+        for node in memtable.scan(lo, hi, reverse):
+            if node.key == last_key:
+                continue  # the forward resume point is inclusive
+            seen += 1
+            value = node.current_value()
+            if sequence is not None and value.lsn > sequence:
+                value = memtable.value_at(node.key, sequence)
+            if value is not None:  # None: written after the snapshot
+                chunk.append((node.key, value.__dict__))
+            if seen == _SCAN_CHUNK:
+                return node.key, chunk
+        return None, chunk
+
+    while True:
+        last_key, chunk = consistent(read_chunk)
+        yield from chunk
+        if last_key is None:
+            return
+
+
+def _tag_source(source, priority: int):
+    for key, value in source:
+        yield key, priority, value
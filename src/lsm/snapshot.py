@@ -0,0 +1,65 @@
+import bisect
+import threading
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+import src.dsa.sst.manifest as sst_manifest
+import src.lsm.read_view as lsm_view
+
+
+@dataclass
+class Snapshot:
+    """A point-in-time read view: every write with an LSN up to `sequence` and none after it.
+
+    Holds a reference to the read view it was taken on: the memtables that were live then - their
+    overwritten values are kept while a snapshot needs them - and a pinned MANIFEST version, so
+    the SSTables it reads stay on disk even after compaction has merged them away.
+    """
+
+    sequence: str
+    # the read view it was taken on - referenced, so its memtables and version stay readable
+    view: lsm_view.ReadView
+    released: bool = False
+
+    @property
+    def memtables(self) -> Tuple[Tuple[Any, str], ...]:
+        # (memtable, source label), newest first - as LSMTreeSearch consults them
+        return self.view.memtables
+
+    @property
+    def version(self) -> Optional[sst_manifest.SortedTableVersion]:
+        return self.view.version
+
+
+class SnapshotList:
+    """Sequence numbers of the live snapshots, oldest first; a sequence may be held more than once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequences: List[str] = []
+
+    def acquire(self, sequence: str) -> None:
+        with self._lock:
+            bisect.insort(self._sequences, sequence)
+
+    def release(self, sequence: str) -> None:
+        with self._lock:
+            i = bisect.bisect_left(self._sequences, sequence)
+            if i < len(self._sequences) and self._sequences[i] == sequence:
+                self._sequences.pop(i)
+
+    def needs(self, older_lsn: str, newer_lsn: str) -> bool:
+        # a value written at older_lsn and overwritten at newer_lsn is still the one some snapshot
+        # reads: a live sequence falls in [older_lsn, newer_lsn)
+        if not self._sequences:
+            return False
+        with self._lock:
+            i = bisect.bisect_left(self._sequences, older_lsn)
+            return i < len(self._sequences) and self._sequences[i] < newer_lsn
+
+    def oldest(self) -> Optional[str]:
+        with self._lock:
+            return self._sequences[0] if self._sequences else None
+
+    def __len__(self) -> int:
+        return len(self._sequences)
@@ -1,24 +1,423 @@
+import glob
 import json
 import os
-from typing import Any
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import src.dsa.sst.utility as sst_u
 
+# sync policies: leave flushing to the OS, fsync every group commit, or fsync at most every interval
+SYNC_NONE = "none"
+SYNC_BATCH = "batch"
+SYNC_INTERVAL = "interval"
+SYNC_MODES = (SYNC_NONE, SYNC_BATCH, SYNC_INTERVAL)
+
+# every record is framed as <payload length, crc32(payload)> + payload, so a torn tail is detectable
+_FRAME = struct.Struct("<II")
+_SEGMENT_NAME = re.compile(r"^wal-(\d{6,})\.log$")
+# logs of releases before segments: one JSON object per line, `wal.jsonl` plus `wal.<ulid>.jsonl`
+# for each frozen memtable - converted into a segment on the first start after an upgrade
+_LEGACY_LOG = "wal.jsonl"
+_LEGACY_FROZEN_LOGS = "wal.*.jsonl"
+
+# recovery reads segments in chunks this large and decodes each chunk's payloads in one json.loads
+READ_CHUNK_BYTES = 1 << 20
+
+
+def encode_record(key: str, value: Any, lsn: str) -> bytes:
+    payload = json.dumps([key, value, lsn], separators=(",", ":")).encode("utf-8")
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_batch(entries: List[Tuple[str, Any, str]]) -> bytes:
+    # a whole WriteBatch in one frame: one CRC, so recovery applies all of it or none of it
+    payload = json.dumps({"batch": entries}, separators=(",", ":")).encode("utf-8")
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def segment_name(number: int) -> str:
+    return f"wal-{number:06d}.log"
+
+
+def read_segment(path: str, chunk_size: int = READ_CHUNK_BYTES) -> Iterator[List[Tuple[str, Any, str]]]:
+    """Stream the records of one WAL segment as lists of (key, data, lsn), one list per chunk read.
+
+    Decoding stops at the first frame that is short or fails its CRC - a write torn by a crash.
+    """
+    for payloads, _ in _read_frames(path, chunk_size):
+        if payloads:
+            # one parse per chunk instead of one per record
+            records = json.loads(b"[" + b",".join(payloads) + b"]")
+            if any(isinstance(record, dict) for record in records):
+                records = _expand_batches(records)
+            yield records
+
+
+def read_legacy_log(path: str) -> Iterator[Tuple[str, Any, str]]:
+    # (key, data, lsn) per {"key", "value": {"data", "lsn"}} line; a torn last line ends the log
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return
+            yield record["key"], record["value"]["data"], record["value"]["lsn"]
+
+
+def valid_length(path: str) -> int:
+    # bytes up to the end of the last intact record
+    end = 0
+    for _, end in _read_frames(path, READ_CHUNK_BYTES):
+        pass
+    return end
+
+
+def _expand_batches(records: List[Any]) -> List[Tuple[str, Any, str]]:
+    expanded = []
+    for record in records:
+        if isinstance(record, dict):
+            expanded.extend(record["batch"])
+        else:
+            expanded.append(record)
+    return expanded
+
+
+def _read_frames(path: str, chunk_size: int) -> Iterator[Tuple[List[bytes], int]]:
+    # yields (payloads, end offset of the last one) per chunk; a record may straddle chunks
+    with open(path, "rb") as f:
+        buffer = b""
+        consumed = 0
+        while True:
+            chunk = f.read(chunk_size)
+            buffer = buffer + chunk if buffer else chunk
+            view = memoryview(buffer)
+            payloads = []
+            offset = 0
+            while offset + _FRAME.size <= len(buffer):
+                length, crc = _FRAME.unpack_from(buffer, offset)
+                start = offset + _FRAME.size
+                if start + length > len(buffer):
+                    break  # the rest of this frame is in the next chunk
+                payload = view[start : start + length]
+                if zlib.crc32(payload) != crc:
+                    yield payloads, consumed + offset
+                    return
+                payloads.append(payload)
+                offset = start + length
+
+            yield payloads, consumed + offset
+            if not chunk:
+                return  # any bytes left in the buffer are a torn tail
+            consumed += offset
+            buffer = buffer[offset:]
+
 
 class WriteAheadLog:
-    def __init__(self, data_root_path: str):
+    """Segmented write-ahead log in L0: `wal-000001.log`, `wal-000002.log`, ...
+
+    Each memtable writes one segment; freezing the memtable rotates to the next number. Once a
+    memtable's L0 file is installed, the MANIFEST edit records the first segment still needed
+    (`log_number`) and the older segments are retired - recovery replays only segments from
+    `min_log_number` on, even if a crash left older ones behind.
+    """
+
+    def __init__(
+        self,
+        data_root_path: str,
+        sync_mode: str = SYNC_INTERVAL,
+        sync_interval: float = 0.1,
+        min_log_number: int = 0,
+    ):
+        if sync_mode not in SYNC_MODES:
+            raise ValueError(f"unknown WAL sync mode {sync_mode!r}, expected one of {SYNC_MODES}")
+
         l0_dir = sst_u.level_dir(data_root_path, 0)
         os.makedirs(l0_dir, exist_ok=True)
-        self._path = os.path.join(l0_dir, "wal.jsonl")
+        self._dir = l0_dir
+        self._sync_mode = sync_mode
+        self._sync_interval = sync_interval
+
+        # segments below min_log_number were flushed before a crash could retire them
+        existing = self.segment_numbers()
+        self.retire([number for number in existing if number < min_log_number])
+        # segments left by a previous run: their writes are replayed into the active memtable,
+        # so they are retired together with it
+        self._unassigned = [number for number in existing if number >= min_log_number]
+        # numbers only grow, also past segments already retired, so none is mistaken for flushed
+        self._number = max(existing + [min_log_number - 1, 0]) + 1
+        if self._upgrade_legacy_logs(self._number):
+            self._unassigned.append(self._number)
+            self._number += 1
+
+        # group commit: appenders queue frames; whoever finds no write in progress becomes the leader
+        # and writes (and syncs) everything queued so far in one call while the others wait
+        self._cond = threading.Condition()
+        self._file = None
+        self._offset = 0  # end of the last frame written whole; a failed write is cut back to it
+        self._pending: List[bytes] = []
+        self._queued = 0
+        self._written = 0
+        self._leader = False
+        # ticket -> error of the failed group it was in; each appender takes its own entry
+        self._failed: Dict[int, BaseException] = {}
+        self._dirty = False
+        self._syncing = False
+        self._syncer: Optional[threading.Thread] = None
+        self._closed = False
+        self.stats = {"records": 0, "commits": 0, "syncs": 0}
 
     def append(self, key: str, value: Any, lsn: str) -> None:
-        with open(self._path, "a", encoding="utf-8") as f:
-            f.write(json.dumps({"key": key, "value": {"data": value, "lsn": lsn}}) + "\n")
+        # returns once the record is written (and synced, per the sync mode) - possibly by another thread
+        self._commit([encode_record(key, value, lsn)])
+
+    def append_batch(self, entries: List[Tuple[str, Any, str]]) -> None:
+        # (key, data, lsn) entries of one WriteBatch, committed as a single record
+        self._commit([encode_batch(entries)])
+
+    def append_group(self, batches: List[List[Tuple[str, Any, str]]]) -> None:
+        # a write queue group: one record per batch (a plain record for a single write), one write() call
+        self._commit(
+            [encode_record(*entries[0]) if len(entries) == 1 else encode_batch(entries) for entries in batches]
+        )
+
+    def rotate(self) -> List[int]:
+        # the active memtable was frozen: close its segment and start the next number. Returns every
+        # segment the frozen memtable's writes live in
+        with self._cond:
+            self._wait_idle()
+            self._close_file(sync=True)
+            numbers, self._unassigned = self._unassigned, []
+            if os.path.exists(self.path):
+                numbers.append(self._number)
+            self._number += 1
+            return numbers
+
+    def retire(self, numbers: List[int]) -> None:
+        # the memtable these segments cover is durable in an L0 file
+        for number in numbers:
+            path = self.segment_path(number)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def segment_numbers(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self._dir):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self._dir, segment_name(number))
+
+    def records(self, chunk_size: int = READ_CHUNK_BYTES) -> Iterator[List[Tuple[str, Any, str]]]:
+        # everything a restart must replay, oldest segment first, as (key, data, lsn) runs of one
+        # chunk each; a torn tail ends its segment's records
+        for number in self.segment_numbers():
+            yield from read_segment(self.segment_path(number), chunk_size)
+
+    def sync(self) -> None:
+        with self._cond:
+            self._wait_idle()
+            self._sync_file()
+
+    def close(self) -> None:
+        with self._cond:
+            self._wait_idle()
+            self._close_file(sync=True)
+            self._closed = True
+            self._cond.notify_all()
+        if self._syncer is not None:
+            self._syncer.join()
+            self._syncer = None
 
     def delete(self) -> None:
-        if os.path.exists(self._path):
-            os.remove(self._path)
+        with self._cond:
+            self._wait_idle()
+            self._close_file(sync=False)
+            self.retire(self.segment_numbers())
+            self._unassigned = []
 
     @property
     def path(self) -> str:
-        return self._path
+        # the active segment; created by the first append after a rotate
+        return self.segment_path(self._number)
+
+    @property
+    def log_number(self) -> int:
+        return self._number
+
+    @property
+    def sync_mode(self) -> str:
+        return self._sync_mode
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _commit(self, frames: List[bytes]) -> None:
+        with self._cond:
+            self._pending.extend(frames)
+            self._queued += 1
+            ticket = self._queued
+            while self._written < ticket:
+                if self._leader:
+                    self._cond.wait()
+                    continue
+
+                self._leader = True
+                batch, self._pending = self._pending, []
+                first, upto = self._written + 1, self._queued
+                self._cond.release()
+                error = None
+                try:
+                    self._write_batch(batch)
+                except BaseException as exc:
+                    error = exc
+                finally:
+                    self._cond.acquire()
+                    try:
+                        if error is not None:
+                            self._failed.update(dict.fromkeys(range(first, upto + 1), error))
+                            self._discard_batch()
+                        elif self._sync_mode == SYNC_INTERVAL:
+                            self._dirty = True
+                    finally:
+                        self._leader = False
+                        self._written = upto
+                        self._cond.notify_all()
+                if error is not None and not isinstance(error, Exception):
+                    self._failed.pop(ticket, None)
+                    raise error
+
+            # every appender whose frame was in a failed group sees that group's failure - and only it
+            error = self._failed.pop(ticket, None)
+            if error is not None:
+                raise OSError(f"WAL write failed: {error}") from error
+
+    def _write_batch(self, batch: List[bytes]) -> None:
+        # runs outside the lock; only the leader touches the file
+        f = self._open_file()
+        data = memoryview(b"".join(batch))
+        while data:
+            # a raw write may take only part of the buffer
+            written = f.write(data)
+            if not written:
+                raise OSError(f"WAL write to {self.path} made no progress")
+            data = data[written:]
+        self.stats["records"] += len(batch)
+        self.stats["commits"] += 1
+        if self._sync_mode == SYNC_BATCH:
+            os.fsync(f.fileno())
+            self.stats["syncs"] += 1
+        self._offset = f.tell()
+
+    def _open_file(self):
+        if self._file is None:
+            path = self.path
+            if os.path.exists(path):
+                # a crash may have torn the last record; appending after it would hide every later one
+                length = valid_length(path)
+                if length < os.path.getsize(path):
+                    os.truncate(path, length)
+            # unbuffered: each group commit is a single write() straight to the OS
+            self._file = open(path, "ab", buffering=0)
+            self._offset = self._file.tell()
+            if self._sync_mode == SYNC_INTERVAL and self._syncer is None:
+                self._closed = False
+                self._syncer = threading.Thread(target=self._sync_loop, name="lsm-wal-sync", daemon=True)
+                self._syncer.start()
+        return self._file
+
+    def _upgrade_legacy_logs(self, number: int) -> bool:
+        # rewrite the JSONL logs of an older release - frozen ones oldest first, then the active
+        # one - as segment `number`, made durable before the JSONL files are deleted. A crash in
+        # between converts them again on the next start; replaying a record twice is harmless
+        paths = sorted(glob.glob(os.path.join(self._dir, _LEGACY_FROZEN_LOGS)))
+        if os.path.exists(os.path.join(self._dir, _LEGACY_LOG)):
+            paths.append(os.path.join(self._dir, _LEGACY_LOG))
+        if not paths:
+            return False
+
+        frames = [encode_record(*record) for path in paths for record in read_legacy_log(path)]
+        if frames:
+            path = self.segment_path(number)
+            with open(path + ".tmp", "wb") as f:
+                f.write(b"".join(frames))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            sst_u.fsync_dir(self._dir)
+        for path in paths:
+            os.remove(path)
+        return bool(frames)
+
+    def _discard_batch(self) -> None:
+        # called with the lock held, still as leader: a failed group may have left whole frames
+        # its appenders are told were not written - cut the segment back to the last good frame
+        # and reopen it on the next append, through the torn-tail check
+        while self._syncing:
+            self._cond.wait()
+        if self._file is None:
+            return
+        try:
+            self._file.truncate(self._offset)
+        except OSError:
+            pass  # a torn frame is still cut off on reopen; whole ones stay
+        finally:
+            self._file.close()
+            self._file = None
+
+    def _sync_file(self) -> None:
+        if self._file is not None and self._dirty:
+            os.fsync(self._file.fileno())
+            self.stats["syncs"] += 1
+        self._dirty = False
+
+    def _sync_loop(self) -> None:
+        # interval mode: writers never wait for an fsync; this thread syncs whatever was written in
+        # the last interval, outside the lock so appends keep flowing meanwhile
+        with self._cond:
+            next_sync = time.monotonic() + self._sync_interval
+            while not self._closed:
+                # commits notify the condition too - sleep out the rest of the interval
+                remaining = next_sync - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                next_sync = time.monotonic() + self._sync_interval
+                if self._file is None or not self._dirty or self._syncing:
+                    continue
+                self._syncing = True
+                self._dirty = False
+                fileno = self._file.fileno()
+                self._cond.release()
+                try:
+                    os.fsync(fileno)
+                except OSError:
+                    self._dirty = True
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self.stats["syncs"] += 1
+                    self._cond.notify_all()
+
+    def _wait_idle(self) -> None:
+        # called with the lock held: let an in-flight group commit or interval sync finish,
+        # so the file can be synced, closed or renamed
+        while self._leader or self._syncing:
+            self._cond.wait()
+
+    def _close_file(self, sync: bool) -> None:
+        if self._file is None:
+            return
+        if sync:
+            self._sync_file()
+        self._file.close()
+        self._file = None
@@ -0,0 +1,74 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+
+class _Write:
+    __slots__ = ("request", "result", "error", "done")
+
+    def __init__(self, request: Any):
+        self.request = request
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class WriteQueue:
+    """Serializes writers: every write joins one queue and exactly one group is applied at a time.
+
+    Whoever finds no group in progress becomes the leader and hands everything queued so far to
+    `apply_group(requests) -> results` in one call - one LSN range, one WAL write, one memtable
+    pass - while the other writers wait for their result. A failed group fails each of its writes.
+    """
+
+    def __init__(self, apply_group: Callable[[List[Any]], List[Any]]):
+        self._apply_group = apply_group
+        self._cond = threading.Condition()
+        self._pending: List[_Write] = []
+        self._leader = False
+        self.stats = {"writes": 0, "groups": 0}
+
+    def submit(self, request: Any) -> Any:
+        write = _Write(request)
+        with self._cond:
+            self._pending.append(write)
+            while not write.done:
+                if self._leader:
+                    self._cond.wait()
+                    continue
+
+                self._leader = True
+                group, self._pending = self._pending, []
+                self._cond.release()
+                results, error = [None] * len(group), None
+                try:
+                    results = self._apply_group([w.request for w in group])
+                except BaseException as exc:
+                    # KeyboardInterrupt and the like too: each write of the group must end
+                    error = exc
+                finally:
+                    self._cond.acquire()
+                    for w, result in zip(group, results):
+                        w.result, w.error, w.done = result, error, True
+                    self._leader = False
+                    self.stats["writes"] += len(group)
+                    self.stats["groups"] += 1
+                    self._cond.notify_all()
+
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    @contextmanager
+    def exclusive(self):
+        # no group runs until the block exits, e.g. while the data directory is wiped
+        with self._cond:
+            while self._leader:
+                self._cond.wait()
+            self._leader = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._leader = False
+                self._cond.notify_all()
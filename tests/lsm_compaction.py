@@ -0,0 +1,200 @@
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.demo.versions import LogSequenceIssuer
+from src.demo.controller import LSMController
+import src.dsa.sst.utility as sst_u
+import src.lsm.batch as lsm_b
+
+KEYS = 3000
+ROUNDS = 60
+PADDING = "x" * 200  # ~250 bytes a record: enough rounds to push data past L1 and L2 targets
+SETTLE_TIMEOUT_S = 60.0
+
+
+def _key(n: int) -> str:
+    return f"customer-{n % 7}#device-{n:05d}"
+
+
+def _fill(ctrl: LSMController) -> dict:
+    # one memtable's worth per round - overwrites and deletes included - so every round is an L0 file
+    rng = random.Random(7)
+    model = {}
+    for r in range(ROUNDS):
+        batch = lsm_b.WriteBatch()
+        for n in rng.sample(range(KEYS), 100):
+            if rng.random() < 0.1:
+                batch.delete(_key(n))
+                model[_key(n)] = None
+            else:
+                data = {"temperature": f"{r}F", "humidity": str(n % 100), "note": PADDING}
+                batch.put(_key(n), data)
+                model[_key(n)] = data
+        ctrl.write(batch)
+    ctrl.wait_for_flushes()
+    return model
+
+
+def _assert_leveled(ctrl: LSMController, model: dict):
+    version = ctrl._manifest.current()
+    config = ctrl._sst_config
+
+    # below L0 each level is one sorted run: file key ranges never overlap
+    for level in range(1, config.max_level + 1):
+        files = sorted(version.files(level), key=lambda meta: meta.first_key)
+        for left, right in zip(files, files[1:]):
+            assert left.last_key < right.first_key, (
+                f"L{level}: {left.file_id} [{left.first_key}, {left.last_key}] overlaps "
+                f"{right.file_id} [{right.first_key}, {right.last_key}]"
+            )
+
+    # data moved past L1, and no level above the last is left over its target
+    assert version.file_ids(2) or version.file_ids(3), "Expected compaction to reach L2 or deeper"
+    scores = ctrl._compactor.level_scores()
+    assert scores[0] <= 1.0, f"L0 still over its trigger: {scores}"
+    for level in range(1, config.max_level):
+        assert scores[level] <= 1.0, f"L{level} still over its target: {scores}"
+
+    # every key reads back as its last write, deleted keys as None
+    keys = sorted(model)
+    assert ctrl.lookup(keys) == [model[key] for key in keys], "Expected every key to survive compaction"
+    assert ctrl.range_scan() == [(key, model[key]) for key in keys if model[key] is not None]
+
+
+def test_lsm_compaction_levels():
+    # manual compaction: drain L0 one file at a time, then push every level over its target down
+    test_data_path = tempfile.mkdtemp(prefix="lsm-compaction-")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+            )
+            model = _fill(ctrl)
+            l0_files = len(ctrl._manifest.current().file_ids(0))
+            assert l0_files > ctrl._sst_config.level0_file_trigger, f"only {l0_files} L0 files"
+
+            while ctrl._manifest.current().file_ids(0):
+                ctrl._compactor.compact_level(0)
+            steps = ctrl._compactor.compact_levels()
+            assert steps and {level for level, _ in steps} >= {1}, f"unexpected steps {steps}"
+            _assert_leveled(ctrl, model)
+            ctrl.close()
+
+            # a reopen sees the same levels through the MANIFEST, the last round through the WAL
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+            )
+            ctrl.restore_memtable_wal()
+            _assert_leveled(ctrl, model)
+            ctrl.close()
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_compaction_scheduler():
+    # background compaction: the scheduler alone drains L0 and the levels, then stops on close
+    test_data_path = tempfile.mkdtemp(prefix="lsm-compaction-scheduler-")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(LogSequenceIssuer(), data_path=test_data_path, wal_sync_mode="none")
+            assert ctrl._scheduler.status()["state"] == "running"
+            model = _fill(ctrl)
+
+            deadline = time.monotonic() + SETTLE_TIMEOUT_S
+            while True:
+                status = ctrl._scheduler.status()
+                scores = ctrl._compactor.level_scores()
+                settled = all(score <= 1.0 for level, score in scores.items() if level < ctrl._sst_config.max_level)
+                if settled and status["running"] is None and not status["queued"]:
+                    break
+                assert time.monotonic() < deadline, f"compaction did not settle: {scores} {status}"
+                ctrl._scheduler.notify()
+                time.sleep(0.05)
+
+            status = ctrl._scheduler.status()
+            assert status["completed"] > 0 and status["failed"] == 0, f"unexpected status {status}"
+            _assert_leveled(ctrl, model)
+
+            thread = ctrl._scheduler._thread
+            assert thread is not None and thread.is_alive()
+            ctrl.close()
+            assert not thread.is_alive(), "Expected the compaction thread to exit on close"
+            assert ctrl._scheduler.status()["state"] == "stopped"
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_compaction_level_fences():
+    # a level's fences are built once and reused until compaction or a removed file changes the level
+    test_data_path = tempfile.mkdtemp(prefix="lsm-compaction-fences-")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+            )
+            reader = ctrl._reader
+            folder = sst_u.level_dir(test_data_path, 1)
+            model = {}
+
+            def write_rounds(rounds):
+                for r in rounds:
+                    batch = lsm_b.WriteBatch()
+                    for n in range(100):
+                        key = _key((r * 100 + n) % 400)
+                        model[key] = {"round": str(r), "note": PADDING}
+                        batch.put(key, model[key])
+                    ctrl.write(batch)
+                ctrl.wait_for_flushes()
+                ctrl._compactor.compact_level(0)
+
+            def assert_found(file_ids):
+                # every key maps to the rightmost live file starting at or below it
+                keys = sorted(model)
+                for key in keys:
+                    file_id = reader.find_level_file(folder, file_ids, key)
+                    assert file_id in file_ids and reader.read_metadata(folder, file_id).first_key <= key, key
+                assert ctrl.lookup(keys) == [model[key] for key in keys]
+
+            write_rounds(range(6))
+            file_ids = ctrl._manifest.current().file_ids(1)
+            assert len(file_ids) > 1, f"expected several L1 files: {file_ids}"
+            assert_found(file_ids)
+            fences = reader._metadata.get_fences(folder)
+            assert fences is not None and fences.source_ids == tuple(file_ids)
+            assert_found(file_ids)
+            assert reader._metadata.get_fences(folder) is fences, "Expected the fences reused across lookups"
+
+            # compaction into L1 adds files - and removes the ones it merged - so the fences are rebuilt
+            write_rounds(range(6, 9))
+            assert reader._metadata.get_fences(folder) is None, "Expected compaction to drop the fences"
+            compacted = ctrl._manifest.current().file_ids(1)
+            assert_found(compacted)
+            rebuilt = reader._metadata.get_fences(folder)
+            assert rebuilt is not fences and rebuilt.file_ids == sorted(
+                compacted, key=lambda file_id: reader.read_metadata(folder, file_id).first_key
+            )
+
+            # a removed file drops them too; the next build no longer sees it
+            removed = compacted[-1]
+            ctrl._compactor._writer.remove_file(1, removed)
+            assert reader._metadata.get_fences(folder) is None, "Expected remove_file to drop the fences"
+            remaining = [file_id for file_id in compacted if file_id != removed]
+            assert removed not in reader.read_level_fences(folder, remaining).file_ids
+            ctrl.close()
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_compaction_levels()
+    test_lsm_compaction_scheduler()
+    test_lsm_compaction_level_fences()
+    print("ALL ASSERTIONS PASSED")
@@ -0,0 +1,455 @@
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.demo.versions import LogSequenceIssuer
+from src.demo.controller import LSMController
+import src.dsa.sst.read as sst_read
+import src.dsa.sst.search as sst_search
+import src.dsa.sst.utility as sst_u
+import src.dsa.sst.write as sst_write
+import src.lsm.batch as lsm_b
+import src.lsm.memtable as lsm_t
+import src.lsm.write_queue as lsm_wq
+
+WRITERS = 4
+READERS = 4
+DEVICES = 100
+DURATION_S = 2.0
+
+
+def test_lsm_concurrency():
+    # writers keep raising a per-key counter while readers search, multi_get and scan; flushes and
+    # compactions run in the background the whole time
+    test_data_path = tempfile.mkdtemp(prefix="lsm-concurrency-")
+    lsns = LogSequenceIssuer()
+    errors = []
+    stop = threading.Event()
+    written = [dict() for _ in range(WRITERS)]  # per writer: key -> last counter written
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ctrl = LSMController(data_path=test_data_path, lsn_issuer=lsns, wal_sync_mode="none")
+
+        def customer(w):
+            return f"customer-{w}"
+
+        def key(w, device):
+            return f"{customer(w)}#device-{device}"
+
+        def writer(w):
+            rng = random.Random(w)
+            counter = 0
+            try:
+                while not stop.is_set():
+                    counter += 1
+                    if counter % 10 == 0:
+                        # a whole customer's devices at once, through the same write queue
+                        devices = rng.sample(range(DEVICES), 5)
+                        ctrl.save_batch(customer(w), [f"device-{d},{counter}F,50" for d in devices])
+                        written[w].update({key(w, d): counter for d in devices})
+                    else:
+                        device = rng.randrange(DEVICES)
+                        ctrl.save(customer(w), f"device-{device},{counter}F,50")
+                        written[w][key(w, device)] = counter
+            except Exception as exc:
+                errors.append(exc)
+
+        def reader(r):
+            rng = random.Random(100 + r)
+            seen = {}  # a key's counter never goes backwards for one reader
+            try:
+                while not stop.is_set():
+                    w = rng.randrange(WRITERS)
+                    k = key(w, rng.randrange(DEVICES))
+                    data, _ = ctrl.search(k)
+                    if data is not None:
+                        counter = int(data["temperature"])
+                        assert counter >= seen.get(k, 0), f"{k} went back from {seen[k]} to {counter}"
+                        seen[k] = counter
+
+                    keys = [key(w, d) for d in rng.sample(range(DEVICES), 5)]
+                    assert len(ctrl.multi_get(keys)) == len(keys)
+
+                    # two scans of one snapshot agree while writes, flushes and compactions go on
+                    snapshot = ctrl.get_snapshot()
+                    first = ctrl.scan(f"{customer(w)}#", snapshot=snapshot)
+                    second = ctrl.scan(f"{customer(w)}#", snapshot=snapshot)
+                    ctrl.release_snapshot(snapshot)
+                    assert first == second, "Expected a snapshot to read the same data twice"
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=writer, args=(w,)) for w in range(WRITERS)]
+        threads += [threading.Thread(target=reader, args=(r,)) for r in range(READERS)]
+        for t in threads:
+            t.start()
+        time.sleep(DURATION_S)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        assert not errors, f"{len(errors)} thread(s) failed, first: {errors[0]!r}"
+
+        # every key holds the last counter its writer wrote
+        ctrl.wait_for_flushes()
+        for w in range(WRITERS):
+            for k, counter in written[w].items():
+                data, _ = ctrl.search(k)
+                assert data is not None and int(data["temperature"]) == counter, f"{k}: {data} != {counter}"
+            assert len(ctrl.scan(f"{customer(w)}#")) == len(written[w])
+        ctrl.close()
+
+        # and survives a restart
+        ctrl2 = LSMController(data_path=test_data_path, lsn_issuer=lsns, wal_sync_mode="none")
+        ctrl2.restore_memtable_wal()
+        for w in range(WRITERS):
+            for k, counter in written[w].items():
+                data, _ = ctrl2.search(k)
+                assert data is not None and int(data["temperature"]) == counter, f"{k} after restart"
+        ctrl2.close()
+
+    shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_concurrent_saves_flush_cleanly():
+    # concurrent saves freeze memtables only from the write queue: every L0 file on disk is a
+    # non-empty flush listed in the MANIFEST, and no write is lost
+    test_data_path = tempfile.mkdtemp(prefix="lsm-concurrent-saves-")
+    threads_count, saves = 8, 400
+    errors = []
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ctrl = LSMController(
+            data_path=test_data_path,
+            lsn_issuer=LogSequenceIssuer(),
+            wal_sync_mode="none",
+            background_compaction=False,
+        )
+
+        def saver(t):
+            try:
+                for n in range(saves):
+                    ctrl.save(f"customer-{t}", f"device-{n},{n}F,50")
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=saver, args=(t,)) for t in range(threads_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        ctrl.wait_for_flushes()
+
+        assert not errors, f"{len(errors)} thread(s) failed, first: {errors[0]!r}"
+        l0_dir = sst_u.level_dir(test_data_path, 0)
+        on_disk = set(ctrl._reader.scan_file_ids(l0_dir))
+        in_manifest = set(ctrl._manifest.current().file_ids(0))
+        assert on_disk == in_manifest, f"{len(on_disk - in_manifest)} L0 file(s) missing from the MANIFEST"
+        assert len(on_disk) > 1, "Expected the saves to flush several memtables"
+        for file_id in on_disk:
+            assert ctrl._reader.get_key_range(l0_dir, file_id) is not None, f"{file_id} is an empty flush"
+
+        for t in range(threads_count):
+            assert len(ctrl.scan(f"customer-{t}#")) == saves
+        ctrl.close()
+
+    shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_concurrency_reads_without_the_lock():
+    # memtable reads never take the writers' lock, yet see every batch whole: while one thread
+    # rewrites all keys in one batch per round, lookups, scans and snapshots find a single round
+    test_data_path = tempfile.mkdtemp(prefix="lsm-concurrency-lock-free-")
+    keys = [f"customer-0#device-{d:02d}" for d in range(20)]
+    errors = []
+    stop = threading.Event()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ctrl = LSMController(
+            data_path=test_data_path,
+            lsn_issuer=LogSequenceIssuer(),
+            wal_sync_mode="none",
+            background_compaction=False,
+            memtable_backend="sorted_array",
+        )
+
+        def write_round(n):
+            batch = lsm_b.WriteBatch()
+            for k in reversed(keys):  # below the last key: the sorted array buffers and splices them
+                batch.put(k, {"round": n})
+            ctrl.write(batch)
+
+        write_round(0)
+
+        # a writer holding the lock - as a flush install did across the MANIFEST fsync - holds
+        # up other writers, never readers
+        done = threading.Event()
+
+        def read_all():
+            ctrl.lookup(keys)
+            ctrl.range_scan()
+            ctrl.release_snapshot(ctrl.get_snapshot())
+            done.set()
+
+        with ctrl._mt.lock:
+            thread = threading.Thread(target=read_all)
+            thread.start()
+            assert done.wait(5.0), "Expected reads to finish while the memtable lock is held"
+        thread.join()
+
+        def writer():
+            try:
+                n = 0
+                while not stop.is_set():
+                    n += 1
+                    write_round(n)
+            except Exception as exc:
+                errors.append(exc)
+
+        def reader():
+            try:
+                while not stop.is_set():
+                    rounds = {data["round"] for data in ctrl.lookup(keys)}
+                    assert len(rounds) == 1, f"lookup saw part of a batch: {rounds}"
+                    rounds = {data["round"] for _, data in ctrl.range_scan()}
+                    assert len(rounds) == 1, f"scan saw part of a batch: {rounds}"
+                    snapshot = ctrl.get_snapshot()
+                    rounds = {data["round"] for data in ctrl.lookup(keys, snapshot)}
+                    ctrl.release_snapshot(snapshot)
+                    assert len(rounds) == 1, f"snapshot saw part of a batch: {rounds}"
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(READERS)]
+        for t in threads:
+            t.start()
+        time.sleep(DURATION_S)
+        stop.set()
+        for t in threads:
+            t.join()
+        ctrl.close()
+
+    shutil.rmtree(test_data_path, ignore_errors=True)
+    assert not errors, f"{len(errors)} thread(s) failed, first: {errors[0]!r}"
+
+
+def test_lsm_concurrent_filter_stats():
+    # bloom filter counters add up exactly when many threads search at once
+    test_data_path = tempfile.mkdtemp(prefix="lsm-concurrency-filter-")
+    threads_count, lookups = 8, 2000
+    switch_interval = sys.getswitchinterval()
+    try:
+        records = [(f"0001234#device-{n:05d}", {"data": {"n": n}, "lsn": f"{n:026d}"}) for n in range(0, 1000, 2)]
+        sst_write.SortedTableWriter(test_data_path).write(1, 10, records)
+        search = sst_search.SortedTableSearch(sst_read.SortedTableReader(test_data_path))
+
+        def searcher(t):
+            for n in range(lookups):
+                # every other key exists; absent keys are mostly ruled out by the filter
+                search.search(f"0001234#device-{(t * 7 + n) % 1000:05d}", 1, sst_u.ulid_max())
+            search.multi_search([f"0001234#device-{n:05d}" for n in range(t, 1000, 50)], 1, sst_u.ulid_max())
+
+        sys.setswitchinterval(1e-6)  # switch threads often, so unguarded counters would lose updates
+        threads = [threading.Thread(target=searcher, args=(t,)) for t in range(threads_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        sys.setswitchinterval(switch_interval)
+
+        stats = search.filter_stats
+        assert stats.checks == threads_count * (lookups + 20), f"lost checks: {stats}"
+        # half the lookups are absent keys: each either skipped by the filter or a false positive
+        absent = threads_count * (lookups + 20) // 2
+        assert stats.useful + stats.false_positives == absent, f"lost counts: {stats}"
+    finally:
+        sys.setswitchinterval(switch_interval)
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+class _Abort(BaseException):
+    pass
+
+
+def test_lsm_write_queue_base_exception():
+    # a group failing with a BaseException still ends every write in it - the leader's and the
+    # followers' - and hands leadership on, so later writes go through
+    followers = 3
+    calls = []
+
+    def apply_group(requests):
+        calls.append(list(requests))
+        if len(calls) == 1:
+            # hold the first group until the followers queue up behind it, as one group
+            deadline = time.monotonic() + 5.0
+            while len(queue._pending) < followers and time.monotonic() < deadline:
+                time.sleep(0.001)
+        elif len(calls) == 2:
+            raise _Abort()
+        return requests
+
+    queue = lsm_wq.WriteQueue(apply_group)
+    outcomes = {}
+
+    def submit(n):
+        try:
+            outcomes[n] = queue.submit(n)
+        except _Abort as exc:
+            outcomes[n] = exc
+
+    # daemon threads: a write left waiting must fail the test, not hang it
+    first = threading.Thread(target=submit, args=(0,), daemon=True)
+    first.start()
+    while not calls:
+        time.sleep(0.001)
+    threads = [threading.Thread(target=submit, args=(n,), daemon=True) for n in range(1, followers + 1)]
+    for t in threads:
+        t.start()
+    for t in [first] + threads:
+        t.join(5.0)
+        assert not t.is_alive(), "Expected every write of the failed group to end"
+
+    assert calls[:2] == [[0], [1, 2, 3]], f"groups {calls}"
+    assert outcomes[0] == 0 and all(isinstance(outcomes[n], _Abort) for n in (1, 2, 3)), outcomes
+    assert queue.submit(4) == 4 and queue.stats == {"writes": 5, "groups": 3}
+
+
+def _write_round(ctrl: LSMController, r: int) -> dict:
+    # 100 new keys: exactly one memtable's worth, so the next write freezes it
+    batch, written = lsm_b.WriteBatch(), {}
+    for n in range(100):
+        key, data = f"customer-{r}#device-{n:03d}", {"temperature": f"{r}F", "humidity": str(n)}
+        batch.put(key, data)
+        written[key] = data
+    ctrl.write(batch)
+    return written
+
+
+def test_lsm_frozen_memtable_queue():
+    # writes past the memtable budget queue frozen memtables; reads find their keys until the L0
+    # file is installed, their WAL segments are retired only after it, and a full queue stalls writes
+    test_data_path = tempfile.mkdtemp(prefix="lsm-frozen-queue-")
+    gate = threading.Event()
+    events = []
+    model = {}
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+            )
+            install, retire = ctrl._mt._install_level_zero, ctrl._wal.retire
+
+            def gated_install(file_id, log_number=None):
+                gate.wait(10.0)
+                install(file_id, log_number)
+                events.append(("installed", file_id, ctrl._wal.segment_numbers()))
+
+            def recording_retire(numbers):
+                events.append(("retired", numbers))
+                retire(numbers)
+
+            ctrl._mt._install_level_zero = gated_install
+            ctrl._wal.retire = recording_retire
+
+            # the first frozen memtable is held mid-flush; three more fill the queue behind it
+            limit = ctrl._mt._max_immutable_memtables
+            for r in range(limit + 1):
+                model.update(_write_round(ctrl, r))
+            status = ctrl._mt.flush_status()
+            assert status["immutable_memtables"] == limit and status["flushing"], status
+            assert not ctrl._manifest.current().file_ids(0) and not events, "Expected no L0 file installed yet"
+            assert len(ctrl._wal.segment_numbers()) == limit + 1, "Expected every frozen memtable's WAL kept"
+            keys = sorted(model)
+            assert ctrl.lookup(keys) == [model[key] for key in keys], "Expected reads to find the frozen keys"
+
+            # one more freeze waits for the flush thread
+            stalled = threading.Thread(target=lambda: model.update(_write_round(ctrl, limit + 1)), daemon=True)
+            stalled.start()
+            stalled.join(0.5)
+            assert stalled.is_alive(), "Expected the write to stall on a full queue"
+
+            gate.set()
+            stalled.join(10.0)
+            assert not stalled.is_alive(), "Expected the stall released once a flush finished"
+            ctrl.wait_for_flushes()
+
+            installed = [event[1] for event in events if event[0] == "installed"]
+            assert installed == ctrl._manifest.current().file_ids(0) and len(installed) == limit + 1
+            for before, after in zip(events[::2], events[1::2]):
+                # each memtable's segments were still on disk when its file went in, retired after
+                assert before[0] == "installed" and after[0] == "retired", events
+                assert set(after[1]) <= set(before[2]), f"{after[1]} retired before {before[1]} was installed"
+            assert ctrl._wal.segment_numbers() == [ctrl._manifest.current().log_number]
+            keys = sorted(model)
+            assert ctrl.lookup(keys) == [model[key] for key in keys]
+            ctrl.close()
+    finally:
+        gate.set()
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_flush_failures_stop():
+    # close gives up on a memtable whose flush keeps failing instead of waiting forever; its writes
+    # stay in the WAL and come back on the next open
+    test_data_path = tempfile.mkdtemp(prefix="lsm-flush-failures-")
+    retry_delay = lsm_t.FLUSH_RETRY_DELAY_S
+    lsm_t.FLUSH_RETRY_DELAY_S = 0.01
+    outcome = []
+
+    def failing_install(file_id, log_number=None):
+        raise OSError("disk full")
+
+    def close():
+        try:
+            ctrl.close()
+            outcome.append(None)
+        except RuntimeError as exc:
+            outcome.append(exc)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+            )
+            ctrl._mt._install_level_zero = failing_install
+            model = _write_round(ctrl, 0)
+            model.update(_write_round(ctrl, 1))
+
+            closing = threading.Thread(target=close, daemon=True)
+            closing.start()
+            closing.join(10.0)
+            assert not closing.is_alive(), "Expected close to give up on the failing flush"
+            assert len(outcome) == 1 and isinstance(outcome[0], RuntimeError), outcome
+            assert "disk full" in str(outcome[0]) and ctrl._mt._flush_thread is None
+            assert ctrl._mt.flush_status()["immutable_memtables"] == 1
+
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+            )
+            ctrl.restore_memtable_wal()
+            keys = sorted(model)
+            assert ctrl.lookup(keys) == [model[key] for key in keys], "Expected the WAL to replay the writes"
+            ctrl.close()
+    finally:
+        lsm_t.FLUSH_RETRY_DELAY_S = retry_delay
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_concurrency()
+    test_lsm_concurrent_saves_flush_cleanly()
+    test_lsm_concurrency_reads_without_the_lock()
+    test_lsm_concurrent_filter_stats()
+    test_lsm_write_queue_base_exception()
+    test_lsm_frozen_memtable_queue()
+    test_lsm_flush_failures_stop()
+    print("ALL ASSERTIONS PASSED")
@@ -58,6 +58,12 @@ def test_lsm_controller():
     assert result is not None, f"Key {target_key!r} not found after L0 flush"
     assert source == "L0", f"Expected source L0, got {source!r}"
 
+    # repeating the lookup is served from the block cache
+    ctrl.search(target_key)
+    hits_before = ctrl.stats()["block_cache"]["hits"]
+    ctrl.search(target_key)
+    assert ctrl.stats()["block_cache"]["hits"] > hits_before, "Expected repeated lookup to hit the block cache"
+
     # 5a. delete and confirm key is gone; undelete and confirm it comes back
     saved_result = result
     ctrl.delete_input(["", target_key])
@@ -67,6 +73,12 @@ def test_lsm_controller():
     restored_result, _ = ctrl.search(target_key)
     assert restored_result is not None, f"Key {target_key!r} should be present after undelete (L0)"
 
+    # 5b. a key that was never written is ruled out by the L0 bloom filters
+    useful_before = ctrl.stats()["filter"]["useful"]
+    missing_result, _ = ctrl.search(f"{custid}#never-written-device")
+    assert missing_result is None, "Expected absent key to miss"
+    assert ctrl.stats()["filter"]["useful"] > useful_before, "Expected bloom filter to skip at least one L0 file"
+
     # 6. compact
     ctrl.compact()
 
@@ -88,6 +100,28 @@ def test_lsm_controller():
     restored_result, _ = ctrl.search(target_key)
     assert restored_result is not None, f"Key {target_key!r} should be present after undelete (L1)"
 
+    # 8b. a prefix scan merges MT, L0 and L1 into one ordered, de-duplicated key list
+    scanned = [key for key, _ in ctrl.scan(f"{custid}#")]
+    assert target_key in scanned, f"Key {target_key!r} missing from prefix scan"
+    assert all(key.startswith(f"{custid}#") for key in scanned), "Expected only keys with the scanned prefix"
+    assert scanned == sorted(set(scanned)), "Expected scan keys in order without duplicates"
+
+    # 8c. multi_get answers like one search per key, in input order
+    missing_key = f"{custid}#never-written-device"
+    batch_keys = [l1_key, missing_key, target_key]
+    assert ctrl.multi_get(batch_keys) == [ctrl.search(key) for key in batch_keys], "Expected multi_get to match search"
+
+    # 8d. a snapshot keeps reading the value it saw while the key is deleted and written again
+    snapshot = ctrl.get_snapshot()
+    assert snapshot.sequence == ctrl._mt.last_sequence, "Expected a snapshot at the newest applied LSN"
+    before, _ = ctrl.search(target_key, snapshot)
+    ctrl.delete(target_key)
+    assert ctrl.search(target_key)[0] is None, f"Key {target_key!r} should be absent after delete"
+    assert ctrl.search(target_key, snapshot)[0] == before, "Expected the snapshot to ignore the newer delete"
+    assert target_key in [key for key, _ in ctrl.scan(f"{custid}#", snapshot=snapshot)], "Expected the snapshot scan"
+    ctrl.release_snapshot(snapshot)
+    ctrl.save(custid, raw_result_input)
+
     # 9. confirm exactly 2 L1 data files in the data directory
     l1_dir = os.path.join(test_data_path, "L1")
     l1_files = [f for f in os.listdir(l1_dir) if f.endswith(".jsonl") and not f.endswith(".index.jsonl")]
@@ -101,6 +135,8 @@ def test_lsm_controller():
     assert len(l0_files) > 0, "Expected at least one L0 file to remain after compact"
 
     # 11. new controller instance restores the same MT count via WAL
+    # (a memtable frozen by the last save is flushed first, so only the active WAL remains)
+    ctrl.wait_for_flushes()
     original_mt_count = next(
         (c["key_count"] for c in ctrl.level_counts(memtable_only=True) if c["lsm_level"] == "MT"), 0
     )
@@ -0,0 +1,221 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.demo.versions import LogSequenceIssuer
+from src.demo.controller import LSMController
+import src.dsa.sst.manifest as sst_manifest
+import src.dsa.sst.utility as sst_u
+import src.lsm.batch as lsm_b
+
+
+def _open(test_data_path: str) -> LSMController:
+    ctrl = LSMController(
+        LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+    )
+    ctrl.restore_memtable_wal()
+    return ctrl
+
+
+def _write_rounds(ctrl: LSMController, model: dict, rounds: range) -> None:
+    # 100 puts a round fill one memtable; the round after it freezes and flushes it to L0
+    for r in rounds:
+        batch = lsm_b.WriteBatch()
+        for n in range(100):
+            key = f"customer-{n % 3}#device-{(r * 37 + n) % 250:04d}"
+            data = {"temperature": f"{r}F", "humidity": str(n)}
+            batch.put(key, data)
+            model[key] = data
+        ctrl.write(batch)
+    ctrl.wait_for_flushes()
+
+
+def _levels(version: sst_manifest.SortedTableVersion) -> dict:
+    return {level: version.file_ids(level) for level in version.levels()}
+
+
+def _assert_readable(ctrl: LSMController, model: dict) -> None:
+    keys = sorted(model)
+    assert ctrl.lookup(keys) == [model[key] for key in keys], "Expected every key to read back"
+
+
+def test_lsm_manifest_reopen():
+    # live files, levels and the WAL log number all come back from the MANIFEST alone
+    test_data_path = tempfile.mkdtemp(prefix="lsm-manifest-")
+    model = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = _open(test_data_path)
+            _write_rounds(ctrl, model, range(8))
+            ctrl.compact()
+            _write_rounds(ctrl, model, range(8, 12))
+            version = ctrl._manifest.current()
+            assert version.file_ids(0) and version.file_ids(1), f"expected L0 and L1 files: {_levels(version)}"
+            ctrl.close()
+
+            ctrl = _open(test_data_path)
+            reopened = ctrl._manifest.current()
+            assert _levels(reopened) == _levels(version), f"{_levels(reopened)} != {_levels(version)}"
+            assert reopened.log_number == version.log_number
+            for level in reopened.levels():
+                assert reopened.files(level) == version.files(level), f"L{level} metadata differs"
+            _assert_readable(ctrl, model)
+            ctrl.close()
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_manifest_snapshot_rewrite():
+    # past max_edits the log is rewritten as one snapshot edit; recovery sees the same version
+    test_data_path = tempfile.mkdtemp(prefix="lsm-manifest-snapshot-")
+    try:
+        manifest = sst_manifest.SortedTableManifest(test_data_path, max_edits=3)
+        for n in range(7):
+            edit = sst_manifest.SortedTableVersionEdit(log_number=n + 1)
+            edit.add_file(sst_manifest.SortedFileMeta(0, f"{n:026d}", f"key-{n}", f"key-{n}z", 10, 100))
+            if n % 2:
+                edit.remove_file(0, f"{n - 1:026d}")
+            manifest.log_and_apply(edit)
+
+        with open(manifest.path, encoding="utf-8") as f:
+            assert len(f.readlines()) <= 3, "Expected the log to be rewritten as a snapshot"
+        recovered = sst_manifest.SortedTableManifest(test_data_path).recover(reader=None)
+        assert _levels(recovered) == _levels(manifest.current())
+        assert recovered.files(0) == manifest.current().files(0)
+        assert recovered.log_number == 7
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_manifest_torn_last_edit():
+    # a crash mid-append leaves half an edit: recovery drops it, truncates it away and logs cleanly after it
+    test_data_path = tempfile.mkdtemp(prefix="lsm-manifest-torn-")
+    model = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = _open(test_data_path)
+            _write_rounds(ctrl, model, range(6))
+            version = ctrl._manifest.current()
+            path = ctrl._manifest.path
+            ctrl.close()
+
+            # the torn edit would have retired every L0 file and the WAL behind them
+            edit = sst_manifest.SortedTableVersionEdit(log_number=version.log_number + 100)
+            for file_id in version.file_ids(0):
+                edit.remove_file(0, file_id)
+            intact = os.path.getsize(path)
+            line = json.dumps(edit.to_dict(99)) + "\n"
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line[: len(line) // 2])
+
+            ctrl = _open(test_data_path)
+            recovered = ctrl._manifest.current()
+            assert _levels(recovered) == _levels(version), "Expected the torn edit to be ignored"
+            assert recovered.log_number == version.log_number
+            assert os.path.getsize(path) == intact, "Expected the torn tail to be truncated"
+            _assert_readable(ctrl, model)
+
+            # the next edit starts on a line of its own, so a further reopen still sees it
+            _write_rounds(ctrl, model, range(6, 9))
+            flushed = _levels(ctrl._manifest.current())
+            assert flushed != _levels(version)
+            ctrl.close()
+
+            ctrl = _open(test_data_path)
+            assert _levels(ctrl._manifest.current()) == flushed
+            _assert_readable(ctrl, model)
+            ctrl.close()
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_manifest_inline_flush_log_number():
+    # without the flush thread a flush records the same log number and retires the same segments
+    test_data_path = tempfile.mkdtemp(prefix="lsm-manifest-inline-")
+    model = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for background_flush in (True, False):
+                ctrl = LSMController(
+                    LogSequenceIssuer(),
+                    data_path=test_data_path,
+                    background_compaction=False,
+                    background_flush=background_flush,
+                    wal_sync_mode="none",
+                )
+                ctrl.restore_memtable_wal()
+                before = ctrl._manifest.current().log_number
+                _write_rounds(ctrl, model, range(4))
+                version = ctrl._manifest.current()
+                assert version.log_number > before, f"background_flush={background_flush}: log number not advanced"
+                assert ctrl._wal.segment_numbers() == [version.log_number], "Expected flushed segments retired"
+                ctrl.close()
+
+            ctrl = _open(test_data_path)
+            assert ctrl._manifest.current().log_number == version.log_number
+            _assert_readable(ctrl, model)
+            ctrl.close()
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+def test_lsm_manifest_synced_before_edit():
+    # an L0 file's data, index and filter files and its directory entry are fsynced before the
+    # MANIFEST edit that installs it - which in turn comes before its WAL segments are retired;
+    # compaction outputs likewise before the edit that swaps them in
+    if not os.path.isdir("/proc/self/fd"):
+        return  # fsync'd paths are read back through /proc
+    test_data_path = tempfile.mkdtemp(prefix="lsm-manifest-sync-")
+    synced = []
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        synced.append(os.path.realpath(os.readlink(f"/proc/self/fd/{fd}")))
+        fsync(fd)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="batch"
+            )
+            os.fsync = recording_fsync
+            try:
+                _write_rounds(ctrl, {}, range(2))
+                flushed = len(synced)
+                ctrl._compactor.compact_level(0)
+            finally:
+                os.fsync = fsync
+            outputs = {0: 1, 1: len(ctrl._manifest.current().file_ids(1))}
+            manifest_path = os.path.realpath(ctrl._manifest.path)
+            ctrl.close()
+
+        # the flush, then the compaction into L1
+        for level, calls in ((0, synced[:flushed]), (1, synced[flushed:])):
+            level_dir = os.path.realpath(sst_u.level_dir(test_data_path, level))
+            installed = calls.index(manifest_path)
+            file_paths = [
+                path
+                for path in calls[:installed]
+                if os.path.dirname(path) == level_dir and not os.path.basename(path).startswith("wal-")
+            ]
+            assert len(file_paths) == 3 * outputs[level], f"L{level}: expected every new file synced first: {calls}"
+            assert level_dir in calls[:installed], f"L{level}: expected the directory synced before the edit: {calls}"
+            assert calls.index(level_dir) > max(calls.index(path) for path in file_paths)
+    finally:
+        os.fsync = fsync
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_manifest_reopen()
+    test_lsm_manifest_snapshot_rewrite()
+    test_lsm_manifest_torn_last_edit()
+    test_lsm_manifest_inline_flush_log_number()
+    test_lsm_manifest_synced_before_edit()
+    print("ALL ASSERTIONS PASSED")
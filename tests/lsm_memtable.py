@@ -0,0 +1,322 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.memtable.backends as mt_backends
+import src.dsa.memtable.skip_list as skip_list
+import src.dsa.memtable.sorted_array as sorted_array
+import src.dsa.sst.utility as sst_u
+import src.lsm.memtable as lsm_t
+import src.lsm.snapshot as lsm_snap
+
+KEYS = 400
+OPERATIONS = 3000
+CHECK_EVERY = 250
+
+
+def _lsn(n: int) -> str:
+    return f"{n:026d}"
+
+
+def _key(n: int) -> str:
+    return f"0001234#device-{n:04d}"
+
+
+def _new(backend: str, retain=None) -> mt_backends.Memtable:
+    # a small append buffer so the sorted array splices it in many times over a run
+    if backend == sorted_array.SortedArrayMemtable.name:
+        return sorted_array.SortedArrayMemtable(buffer_limit=16, retain=retain)
+    return mt_backends.for_name(backend, retain=retain)
+
+
+class _Model:
+    # what a memtable must hold: every key's newest (data, lsn), and all of its writes for value_at
+
+    def __init__(self):
+        self.current = {}
+        self.history = {}
+
+    def apply(self, key: str, data, lsn: str) -> None:
+        if key in self.current and self.current[key][1] > lsn:
+            return  # stale write
+        self.current[key] = (data, lsn)
+        self.history.setdefault(key, []).append((data, lsn))
+
+    def value_at(self, key: str, sequence: str):
+        written = [(data, lsn) for data, lsn in self.history.get(key, ()) if lsn <= sequence]
+        return written[-1] if written else None
+
+    def live(self):
+        return sorted(key for key, (data, _) in self.current.items() if data != sst_u.tombstone())
+
+
+def _as_pair(value):
+    return None if value is None else (value.data, value.lsn)
+
+
+def _check(memtable: mt_backends.Memtable, model: _Model, rng: random.Random) -> None:
+    name = memtable.name
+    keys = sorted(model.current)
+    assert memtable.count() == len(model.live()), f"{name}: count {memtable.count()}"
+    assert memtable.entry_count() == len(keys), f"{name}: entry_count {memtable.entry_count()}"
+    assert list(memtable.ordered_keys()) == model.live(), f"{name}: ordered_keys differ"
+
+    probes = [_key(n) for n in range(-1, KEYS + 1)]
+    expected = [model.current.get(key) for key in probes]
+    assert [_as_pair(memtable.search(key)) for key in probes] == expected, f"{name}: search differs"
+    assert [_as_pair(value) for value in memtable.search_sorted(probes)] == expected, f"{name}: search_sorted differs"
+
+    # scans - tombstones included - over the whole table and random ranges, both directions
+    for _ in range(10):
+        start, end = sorted(rng.sample(probes, 2))
+        for bounds in ((None, None), (start, None), (None, end), (start, end)):
+            wanted = [(key, model.current[key]) for key in keys if _in_range(key, *bounds)]
+            forward = [(entry.key, _as_pair(entry.current_value())) for entry in memtable.scan(*bounds)]
+            assert forward == wanted, f"{name}: scan {bounds} differs"
+            backward = [(entry.key, _as_pair(entry.current_value())) for entry in memtable.scan(*bounds, reverse=True)]
+            assert backward == wanted[::-1], f"{name}: reverse scan {bounds} differs"
+
+    # a flush writes every entry in key order
+    flushed = []
+
+    def write_records(level, block_size, records):
+        flushed.extend((key, (value["data"], value["lsn"])) for key, value in records)
+        return keys[0] if keys else None, keys[-1] if keys else None
+
+    memtable.flush_to_level_zero(write_records)
+    assert flushed == [(key, model.current[key]) for key in keys], f"{name}: flushed records differ"
+
+
+def _in_range(key: str, start, end) -> bool:
+    return (start is None or key >= start) and (end is None or key < end)
+
+
+def test_lsm_memtable_model():
+    # random inserts, overwrites, deletes (of live and absent keys) and stale writes against a dict
+    for backend in mt_backends.MEMTABLE_BACKENDS:
+        rng = random.Random(backend)
+        memtable = _new(backend)
+        model = _Model()
+        buffered_scans = 0
+        for n in range(1, OPERATIONS + 1):
+            key = _key(rng.randrange(KEYS))
+            # now and then a write that lost a race: an lsn older than the stored one
+            lsn = _lsn(n - rng.randrange(1, 50) if rng.random() < 0.05 else n)
+            if rng.random() < 0.25:
+                memtable.delete(key, lsn)
+                model.apply(key, sst_u.tombstone(), lsn)
+            else:
+                data = {"temperature": f"{n % 90}F", "humidity": "4" * rng.randrange(1, 20)}
+                memtable.insert(key, data, lsn)
+                model.apply(key, data, lsn)
+
+            if n % CHECK_EVERY == 0:
+                if getattr(memtable, "_buffer", None):
+                    buffered_scans += 1
+                _check(memtable, model, rng)
+        if backend == sorted_array.SortedArrayMemtable.name:
+            assert buffered_scans, "Expected some checks to mix buffered and array keys"
+
+
+def test_lsm_memtable_sorted_array_buffer():
+    # keys below the last one wait in the buffer; a full buffer is spliced in, reads see both sides
+    memtable = sorted_array.SortedArrayMemtable(buffer_limit=4)
+    model = _Model()
+    for n, k in enumerate([10, 20, 30, 40, 15, 5, 35, 25, 50, 45, 1, 41, 2, 42], start=1):
+        memtable.insert(_key(k), {"n": n}, _lsn(n))
+        model.apply(_key(k), {"n": n}, _lsn(n))
+
+    assert memtable._keys == [_key(k) for k in (1, 2, 5, 10, 15, 20, 25, 30, 35, 40, 41, 45, 50)]
+    assert set(memtable._buffer) == {_key(42)}, "Expected one key left in the buffer"
+    _check(memtable, model, random.Random(1))
+
+    # overwriting and deleting a buffered key updates it in place - it never lands in the arrays twice
+    memtable.insert(_key(42), {"n": 100}, _lsn(100))
+    memtable.delete(_key(42), _lsn(101))
+    model.apply(_key(42), {"n": 100}, _lsn(100))
+    model.apply(_key(42), sst_u.tombstone(), _lsn(101))
+    assert set(memtable._buffer) == {_key(42)}
+    _check(memtable, model, random.Random(2))
+
+
+def test_lsm_memtable_skip_list_growth():
+    # ascending writes take the finger shortcut; the list grows a level per doubling past its height
+    memtable = skip_list.SkipList(max_level=3)
+    model = _Model()
+    for n in range(1, 2001):
+        memtable.insert(_key(n), {"n": n}, _lsn(n))
+        model.apply(_key(n), {"n": n}, _lsn(n))
+        # the finger rests on the key just written - the next ascending key starts there
+        assert memtable._finger[0].key == _key(n)
+
+    # one level per doubling: 2^(max_level + 1) entries would have added the next
+    assert memtable.max_level == (2000).bit_length() - 1, f"height {memtable.max_level}"
+    assert len(memtable._head.forward) == memtable.max_level + 1
+    # every level is a sorted subsequence of the one below it
+    below = None
+    for level in range(memtable.max_level + 1):
+        chain, node = [], memtable._head.forward[level]
+        while node is not None:
+            chain.append(node.key)
+            node = node.forward[level]
+        assert chain == sorted(chain), f"level {level} out of order"
+        assert below is None or set(chain) <= set(below), f"level {level} holds keys level {level - 1} lacks"
+        below = chain
+    _check(memtable, model, random.Random(3))
+
+    # sorted batches from below, inside and above the stored range, then a bulk load of sorted input
+    batch = [(_key(n), {"n": -n}, _lsn(5000 + n)) for n in range(0, 2500, 3)]
+    memtable.apply_sorted(batch)
+    for key, data, lsn in batch:
+        model.apply(key, data, lsn)
+    _check(memtable, model, random.Random(4))
+
+    loaded = skip_list.SkipList(max_level=3)
+    loaded.bulk_load((key, data, lsn) for key, (data, lsn) in sorted(model.current.items()))
+    assert loaded.max_level == memtable.max_level
+    _check(loaded, model, random.Random(5))
+
+
+def test_lsm_memtable_value_at():
+    # overwritten values a live snapshot still reads are kept; value_at answers at that sequence
+    for backend in mt_backends.MEMTABLE_BACKENDS:
+        rng = random.Random(backend)
+        snapshots = lsm_snap.SnapshotList()
+        memtable = _new(backend, retain=snapshots.needs)
+        model = _Model()
+        sequences = []
+        for n in range(1, 1501):
+            if n % 100 == 0:
+                sequences.append(_lsn(n - 1))
+                snapshots.acquire(sequences[-1])
+            key = _key(rng.randrange(40))
+            if rng.random() < 0.2:
+                memtable.delete(key, _lsn(n))
+                model.apply(key, sst_u.tombstone(), _lsn(n))
+            else:
+                memtable.insert(key, {"n": n}, _lsn(n))
+                model.apply(key, {"n": n}, _lsn(n))
+
+        for sequence in sequences:
+            for k in range(41):
+                key = _key(k)
+                got = _as_pair(memtable.value_at(key, sequence))
+                assert got == model.value_at(key, sequence), f"{backend}: {key} at {sequence}: {got}"
+        # without a snapshot in between, an overwrite keeps nothing
+        latest = _lsn(10_000)
+        assert all(_as_pair(memtable.value_at(_key(k), latest)) == model.current.get(_key(k)) for k in range(41))
+        assert len(memtable._history) <= 40
+
+
+def test_lsm_memtable_byte_budget():
+    # the flush trigger follows approximate memory: overwrites in place, tombstones for absent keys
+    for backend in mt_backends.MEMTABLE_BACKENDS:
+        root = tempfile.mkdtemp(prefix="lsm-memtable-")
+        try:
+            mt = lsm_t.LSMTreeMemtable(
+                max_memtable_count=1_000_000,
+                data_root_path=root,
+                max_memtable_bytes=64 * 1024,
+                memtable_backend=backend,
+            )
+            current = mt.get_current()
+            for n in range(50):
+                current.insert(_key(n), {"humidity": "4" * 100}, _lsn(n + 1))
+            base = current.approximate_bytes()
+
+            # same-size overwrites and stale writes do not move the budget
+            for n in range(50):
+                current.insert(_key(n), {"humidity": "5" * 100}, _lsn(100 + n))
+                current.insert(_key(n), {"humidity": "6" * 100}, _lsn(1))
+            assert current.approximate_bytes() == base, f"{backend}: overwrites moved the budget"
+
+            # deleting live keys frees their data but leaves the tombstoned entries
+            for n in range(25):
+                current.delete(_key(n), _lsn(200 + n))
+            freed = current.approximate_bytes()
+            assert freed < base and current.entry_count() == 50 and current.count() == 25, backend
+
+            # growing overwrites, then tombstones for absent keys, fill the budget without a live entry added
+            for n in range(25, 50):
+                current.insert(_key(n), {"humidity": "7" * 1000}, _lsn(300 + n))
+            assert current.approximate_bytes() > freed and not mt.is_full(), backend
+            n = 0
+            while not mt.is_full():
+                current.delete(_key(1000 + n), _lsn(1000 + n))
+                n += 1
+                assert n < 10_000, f"{backend}: tombstones never filled the budget"
+            assert current.count() == 25 and current.entry_count() == 50 + n, backend
+            assert current.approximate_bytes() >= 64 * 1024 > current.approximate_bytes() - 1024, backend
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_memtable_history_pruned():
+    # after a snapshot is released, the next write group drops the overwritten values only it read -
+    # in the active and frozen memtables - and gives their memory back; a live snapshot keeps its own
+    for backend in mt_backends.MEMTABLE_BACKENDS:
+        root = tempfile.mkdtemp(prefix="lsm-memtable-history-")
+        try:
+            mt = lsm_t.LSMTreeMemtable(max_memtable_count=1_000_000, data_root_path=root, memtable_backend=backend)
+            lsns = iter(range(1, 10_000))
+
+            def write_round(r):
+                with mt.applying() as current:
+                    for k in range(20):
+                        lsn = _lsn(next(lsns))
+                        current.insert(_key(k), {"round": r}, lsn)
+                    mt.set_last_sequence(lsn)
+
+            def next_group():
+                # a release only marks the history; the next write group prunes it
+                with mt.applying():
+                    pass
+
+            write_round(0)
+            unretained = mt.get_current().approximate_bytes()
+            older = mt.acquire_snapshot()
+            write_round(1)
+            newer = mt.acquire_snapshot()
+            write_round(2)
+            # the two snapshots' values sit in a frozen memtable, a third one's in the active one
+            mt.freeze([])
+            write_round(3)
+            latest = mt.acquire_snapshot()
+            write_round(4)
+            frozen, current = mt.get_immutables()[0], mt.get_current()
+            assert len(frozen._history) == 20 and all(len(h) == 2 for h in frozen._history.values()), backend
+            assert len(current._history) == 20 and frozen.approximate_bytes() > unretained, backend
+
+            mt.release_snapshot(older)
+            next_group()
+            assert all(len(h) == 1 for h in frozen._history.values()), f"{backend}: expected round 0 pruned"
+            assert all(len(h) == 1 for h in current._history.values()), f"{backend}: expected round 3 kept"
+            for k in range(20):
+                assert frozen.value_at(_key(k), newer[0]).data == {"round": 1}, backend
+                assert frozen.value_at(_key(k), older[0]) is None, backend
+                assert current.value_at(_key(k), latest[0]).data == {"round": 3}, backend
+
+            mt.release_snapshot(latest)
+            next_group()
+            assert not current._history and len(frozen._history) == 20, backend
+            mt.release_snapshot(newer)
+            assert len(frozen._history) == 20, f"{backend}: expected no pruning before the next write"
+            next_group()
+            assert not frozen._history, f"{backend}: expected every retained value pruned"
+            assert frozen.approximate_bytes() == unretained, f"{backend}: expected the memory given back"
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_memtable_model()
+    test_lsm_memtable_sorted_array_buffer()
+    test_lsm_memtable_skip_list_growth()
+    test_lsm_memtable_value_at()
+    test_lsm_memtable_byte_budget()
+    test_lsm_memtable_history_pruned()
+    print("ALL ASSERTIONS PASSED")
@@ -0,0 +1,91 @@
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.demo.versions import LogSequenceIssuer
+from src.demo.controller import LSMController
+import src.dsa.sst.utility as sst_u
+import src.lsm.batch as lsm_b
+
+KEYS = 400
+PADDING = "x" * 200  # big enough records that L1 takes several files of several blocks
+
+
+def _key(n: int) -> str:
+    return f"customer-{n % 3}#device-{n:04d}"
+
+
+def _write(ctrl: LSMController, ops) -> None:
+    # (n, data or None to delete), 100 to a batch - one memtable's worth
+    ops = list(ops)
+    for i in range(0, len(ops), 100):
+        batch = lsm_b.WriteBatch()
+        for n, data in ops[i : i + 100]:
+            if data is None:
+                batch.delete(_key(n))
+            else:
+                batch.put(_key(n), data)
+        ctrl.write(batch)
+    ctrl.wait_for_flushes()
+
+
+def _as_tuples(results):
+    return [(None if value is None else (value.data, value.lsn), source) for value, source in results]
+
+
+def test_lsm_multi_get_matches_search():
+    # one multi_get call returns what a search per key would - value, LSN and source - for keys in
+    # the memtable, L0 and several L1 files and blocks, deleted at any of them, or absent
+    test_data_path = tempfile.mkdtemp(prefix="lsm-multi-get-")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(
+                LogSequenceIssuer(), data_path=test_data_path, background_compaction=False, wal_sync_mode="none"
+            )
+            search = ctrl._sst
+            _write(ctrl, ((n, {"round": "L1", "note": PADDING}) for n in range(0, KEYS, 2)))
+            while ctrl._manifest.current().file_ids(0):
+                ctrl._compactor.compact_level(0)
+            _write(ctrl, ((n, None if n % 4 == 0 else {"round": "L0"}) for n in range(0, KEYS, 3)))
+            _write(ctrl, ((n, {"round": "MT"} if n % 2 else None) for n in range(0, KEYS, 7)))
+
+            version = ctrl._manifest.current()
+            l1_dir = sst_u.level_dir(test_data_path, 1)
+            l1_ids = version.file_ids(1)
+            assert len(l1_ids) > 1 and version.file_ids(0), "Expected L0 and several L1 files"
+            assert all(len(ctrl._reader.read_index(l1_dir, file_id)) > 1 for file_id in l1_ids)
+
+            # every key, unsorted and some twice, with absent keys before, between and after them
+            keys = [_key(n) for n in range(KEYS)] + [_key(n) for n in range(0, KEYS, 11)]
+            keys += ["customer-0#", "customer-1#device-0001x", "customer-3#device-0000", ""]
+            random.Random(7).shuffle(keys)
+            expected = _as_tuples([search.search(key) for key in keys])
+            sources = {source for _, source in expected}
+            assert {"MT", "L0", "L1", f"MT{sst_u.tombstone_source()}", f"L0{sst_u.tombstone_source()}"} <= sources
+            assert _as_tuples(search.multi_get(keys)) == expected, "Expected multi_get to match search"
+
+            # the same at a snapshot, after later writes overwrite and delete some of the keys
+            snapshot = search.get_snapshot()
+            _write(ctrl, ((n, None if n % 2 else {"round": "after"}) for n in range(0, KEYS, 5)))
+            try:
+                assert _as_tuples(search.multi_get(keys, snapshot)) == expected, "Expected the snapshot's values"
+                at_snapshot = [search.search(key, snapshot) for key in keys]
+                assert _as_tuples(at_snapshot) == expected
+            finally:
+                search.release_snapshot(snapshot)
+            after = _as_tuples([search.search(key) for key in keys])
+            assert after != expected and _as_tuples(search.multi_get(keys)) == after
+            ctrl.close()
+    finally:
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_multi_get_matches_search()
+    print("ALL ASSERTIONS PASSED")
@@ -0,0 +1,67 @@
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.demo.versions import LogSequenceIssuer
+from src.demo.controller import LSMController
+from src.demo.client import LSMClient
+from src.demo.server import LSMServer
+import src.demo.protocol as proto
+
+
+def test_lsm_server():
+    test_data_path = tempfile.mkdtemp(prefix="lsm-server-")
+    with contextlib.redirect_stdout(io.StringIO()):
+        ctrl = LSMController(data_path=test_data_path, lsn_issuer=LogSequenceIssuer(), wal_sync_mode="none")
+    try:
+        asyncio.run(_exercise(ctrl))
+    finally:
+        ctrl.close()
+        shutil.rmtree(test_data_path, ignore_errors=True)
+
+
+async def _exercise(ctrl):
+    server = LSMServer(ctrl, port=0)
+    port = await server.start()
+    try:
+        async with LSMClient(port=port, pool_size=2) as client:
+            # 300 concurrent puts pipelined over two connections, coalesced into fewer write groups
+            keys = [f"0000001#device-{n:03}" for n in range(300)]
+            await asyncio.gather(
+                *(client.put(key, {"temperature": str(n), "humidity": "40"}) for n, key in enumerate(keys))
+            )
+            stats = await client.server_stats()
+            assert stats["writes"] == 300 and stats["write_groups"] < 300, f"Expected coalesced writes, got {stats}"
+            assert stats["connections"] == 2
+
+            assert await client.get(keys[7]) == {"temperature": "7", "humidity": "40"}
+            assert await client.get("0000001#missing") is None
+
+            await client.delete(keys[0])
+            found = await client.multi_get([keys[0], keys[1], "0000001#missing"])
+            assert found == [None, {"temperature": "1", "humidity": "40"}, None]
+
+            rows = await client.prefix_scan("0000001#")
+            assert len(rows) == 299 and rows[0][0] == keys[1] and rows[-1][0] == keys[-1]
+            assert [key for key, _ in await client.scan(keys[10], keys[13], reverse=True)] == keys[12:9:-1]
+
+            # a failed request is answered with an error; the connection keeps serving
+            try:
+                await client.put("0000001#device-x", None)
+                assert False, "Expected a put without a value to fail"
+            except proto.ServerError:
+                pass
+            assert await client.get(keys[7]) is not None
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    test_lsm_server()
+    print("ALL ASSERTIONS PASSED")
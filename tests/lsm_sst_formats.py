@@ -0,0 +1,165 @@
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.sst.format as sst_format
+import src.dsa.sst.read as sst_read
+import src.dsa.sst.search as sst_search
+import src.dsa.sst.utility as sst_u
+import src.dsa.sst.write as sst_write
+
+BLOCK_SIZE = 16
+RESTART_INTERVAL = 4
+
+# (record format, binary version, compression) - every layout a reader must still open
+CASES = [
+    ("jsonl", None, "none"),
+    ("binary", 1, "none"),
+    ("binary", 2, "none"),
+    ("binary", 3, "none"),
+    ("binary", 3, "zlib"),
+    ("binary", 3, "lzma"),
+    ("binary", 3, "bz2"),
+]
+
+
+def _records():
+    # long shared key prefixes exercise restart points; every 9th record is a tombstone
+    records = []
+    for n in range(300):
+        key = f"0001234#room-{n // 10:03d}-device-{n % 10}"
+        data = sst_u.tombstone() if n % 9 == 0 else {"temperature": f"{60 + n % 30}F", "humidity": str(n % 100)}
+        records.append((key, {"data": data, "lsn": f"{n:026d}"}))
+    return records
+
+
+def _write_file(root: str, record_format: str, version, compression: str) -> str:
+    level_cfg = sst_u.SortedLevelConfiguration(
+        block_size=BLOCK_SIZE, record_format=record_format, restart_interval=RESTART_INTERVAL, compression=compression
+    )
+    config = sst_u.SortedTableConfiguration(levels={1: level_cfg})
+    writer = sst_write.SortedTableWriter(root, config)
+
+    if version is None or version == sst_format.BinaryFormat.current_version:
+        _, file_id = writer.write(1, BLOCK_SIZE, _records())
+        return file_id
+
+    # older binary versions are only read now - write one the way earlier releases did
+    for_level = sst_format.for_level
+    sst_format.for_level = lambda cfg: sst_format.BinaryFormat(version)
+    try:
+        _, file_id = writer.write(1, BLOCK_SIZE, _records())
+    finally:
+        sst_format.for_level = for_level
+    return file_id
+
+
+def test_lsm_sst_formats_round_trip():
+    records = _records()
+    expected = dict(records)
+    for record_format, version, compression in CASES:
+        case = f"{record_format} v{version} {compression}"
+        root = tempfile.mkdtemp(prefix="lsm-sst-formats-")
+        try:
+            file_id = _write_file(root, record_format, version, compression)
+            folder = sst_u.level_dir(root, 1)
+
+            # a fresh reader detects the layout from the file itself
+            reader = sst_read.SortedTableReader(root)
+            detected = reader.read_metadata(folder, file_id).record_format
+            assert detected.name == record_format, f"{case}: detected {detected.name}"
+            if version is not None:
+                assert detected.version == version, f"{case}: detected version {detected.version}"
+                assert detected.codec.name == compression, f"{case}: detected codec {detected.codec.name}"
+            if compression == "zlib":
+                # the preset dictionary travels in the v3 footer
+                assert detected.codec.dictionary, f"{case}: expected a trained dictionary in the footer"
+
+            # point lookups: hits (tombstones included), keys between two records, keys past either end
+            search = sst_search.SortedTableSearch(reader)
+            for key, value in records[::7] + records[-1:]:
+                assert search.search(key, 1, sst_u.ulid_max()) == value, f"{case}: wrong value for {key}"
+            for missing in ("0001234#room-000-device-0a", "0001234#room-015-device-55", "0000000#", "9999999#"):
+                assert search.search(missing, 1, sst_u.ulid_max()) is None, f"{case}: found {missing}"
+
+            # scans: whole file, a bounded range, and reversed
+            scanned = [(r["key"], r["value"]) for r in reader.scan_file(folder, file_id)]
+            assert scanned == records, f"{case}: full scan differs"
+            start, end = records[45][0], records[123][0]
+            ranged = [r["key"] for r in reader.scan_file(folder, file_id, start, end)]
+            assert ranged == [key for key, _ in records[45:123]], f"{case}: range scan differs"
+            backwards = [r["key"] for r in reader.scan_file(folder, file_id, start, end, reverse=True)]
+            assert backwards == ranged[::-1], f"{case}: reverse scan differs"
+
+            # every block decodes to the records it was written with and finds each of them; a key
+            # between two records, or before the first, is a miss
+            for block in reader.read_index(folder, file_id):
+                for record in reader.read_block(folder, file_id, block):
+                    key = record["key"]
+                    assert expected[key] == record["value"], f"{case}: block record differs"
+                    assert reader.find_in_block(folder, file_id, block, key) == (True, expected[key]), case
+                    assert reader.find_in_block(folder, file_id, block, key + "a") == (False, None), case
+                assert reader.find_in_block(folder, file_id, block, block["first_key"][:-1]) == (False, None), case
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_sst_formats_checksum_mismatch():
+    # a flipped byte inside a v3 block fails its CRC instead of decoding garbage
+    for compression in ("none", "zlib", "lzma", "bz2"):
+        root = tempfile.mkdtemp(prefix="lsm-sst-crc-")
+        try:
+            file_id = _write_file(root, "binary", 3, compression)
+            folder = sst_u.level_dir(root, 1)
+            reader = sst_read.SortedTableReader(root)
+            block = reader.read_index(folder, file_id)[1]
+            record_format = reader.read_metadata(folder, file_id).record_format
+
+            with open(record_format.data_path(folder, file_id), "r+b") as f:
+                f.seek(block["offset"] + block["length"] // 2)
+                byte = f.read(1)
+                f.seek(-1, os.SEEK_CUR)
+                f.write(bytes([byte[0] ^ 0xFF]))
+
+            reader = sst_read.SortedTableReader(root)
+            try:
+                reader.read_block(folder, file_id, block)
+                assert False, f"{compression}: expected a checksum error"
+            except ValueError as exc:
+                assert "checksum mismatch" in str(exc), f"{compression}: unexpected error {exc}"
+            # the blocks around it are untouched
+            assert reader.read_block(folder, file_id, reader.read_index(folder, file_id)[0])
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_sst_formats_restart_interval():
+    # a restart interval below one record is refused up front, not met as a failure mid-write
+    for restart_interval in (0, -1):
+        try:
+            sst_u.SortedLevelConfiguration(record_format="binary", restart_interval=restart_interval)
+            assert False, f"expected restart_interval={restart_interval} to be refused"
+        except ValueError as exc:
+            assert "restart_interval" in str(exc), f"unexpected error {exc}"
+
+    # one record per restart point still round-trips
+    root = tempfile.mkdtemp(prefix="lsm-sst-restart-")
+    try:
+        level_cfg = sst_u.SortedLevelConfiguration(block_size=BLOCK_SIZE, record_format="binary", restart_interval=1)
+        writer = sst_write.SortedTableWriter(root, sst_u.SortedTableConfiguration(levels={1: level_cfg}))
+        _, file_id = writer.write(1, BLOCK_SIZE, _records())
+        reader = sst_read.SortedTableReader(root)
+        scanned = [(r["key"], r["value"]) for r in reader.scan_file(sst_u.level_dir(root, 1), file_id)]
+        assert scanned == _records()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_sst_formats_round_trip()
+    test_lsm_sst_formats_checksum_mismatch()
+    test_lsm_sst_formats_restart_interval()
+    print("ALL ASSERTIONS PASSED")
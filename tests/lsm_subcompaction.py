@@ -0,0 +1,169 @@
+import itertools
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.sst.compact as sst_compact
+import src.dsa.sst.format as sst_format
+import src.dsa.sst.read as sst_read
+import src.dsa.sst.utility as sst_u
+import src.dsa.sst.write as sst_write
+
+
+def _compact(max_subcompactions: int):
+    # L1 in non-overlapping files, one L0 file over all of them with some deletes; L1 is the
+    # last level, so the merge also drops tombstones
+    root = tempfile.mkdtemp(prefix="lsm-subcompaction-")
+    try:
+        levels = {1: sst_u.SortedLevelConfiguration(block_size=20, blocks_per_file=50)}
+        config = sst_u.SortedTableConfiguration(levels=levels, max_level=1)
+        writer = sst_write.SortedTableWriter(root, config)
+        rng = random.Random(7)
+        l1_keys = sorted({f"{rng.randrange(100000):06d}#device" for _ in range(6000)})
+        for i in range(0, len(l1_keys), 1500):
+            writer.write(1, 20, [(key, {"data": {"n": 1}, "lsn": "1"}) for key in l1_keys[i : i + 1500]])
+        l0_keys = sorted({f"{rng.randrange(100000):06d}#device" for _ in range(3000)})
+        l0 = [
+            (key, {"data": sst_u.tombstone() if n % 5 == 0 else {"n": 2}, "lsn": "2"}) for n, key in enumerate(l0_keys)
+        ]
+        writer.write(0, 20, l0)
+
+        reader = sst_read.SortedTableReader(root)
+        compactor = sst_compact.SortedTableCompactor(
+            root, config, reader, max_subcompactions=max_subcompactions, min_subcompaction_bytes=16 * 1024
+        )
+        removed, file_ids = compactor.compact_file(0, compactor.oldest_file_id(0))
+        compactor.close()
+
+        folder = sst_u.level_dir(root, 1)
+        ordered = sorted(file_ids, key=lambda fid: reader.get_key_range(folder, fid)[0])
+        records = [(r["key"], r["value"]["data"]) for fid in ordered for r in reader.scan_file(folder, fid)]
+        return records, compactor.stats
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_subcompaction():
+    serial, serial_stats = _compact(1)
+    parallel, parallel_stats = _compact(3)
+
+    assert serial_stats["parallel_compactions"] == 0
+    assert parallel_stats["parallel_compactions"] == 1 and parallel_stats["subcompactions"] == 3
+    # the ranges stitch back into exactly the serial output: sorted, unique, newest value, no tombstones
+    assert parallel == serial, "Expected subcompactions to write the same records as a serial merge"
+    assert all(a[0] < b[0] for a, b in zip(parallel, parallel[1:]))
+    assert all(data != sst_u.tombstone() for _, data in parallel)
+
+
+def test_lsm_subcompaction_failure_removes_output():
+    # a range that fails - in the merge after whole files were written, or inside a file - leaves no files behind
+    for fail_in in ("merge", "write"):
+        root = tempfile.mkdtemp(prefix="lsm-subcompaction-failure-")
+        merge_records = sst_compact.SortedTableCompactor._merge_records
+        for_level = sst_format.for_level
+        try:
+            # binary formats are built per file, so one can fail without touching any other writer
+            levels = {1: sst_u.SortedLevelConfiguration(block_size=20, blocks_per_file=5, record_format="binary")}
+            config = sst_u.SortedTableConfiguration(levels=levels, max_level=2)
+            writer = sst_write.SortedTableWriter(root, config)
+            _, l0_id = writer.write(0, 20, [(f"{n:06d}#device", {"data": {"n": n}, "lsn": "1"}) for n in range(500)])
+            folder = sst_u.level_dir(root, 1)
+            os.makedirs(folder, exist_ok=True)
+
+            if fail_in == "merge":
+
+                def failing_merge(self, *args):
+                    yield from itertools.islice(merge_records(self, *args), 350)
+                    raise RuntimeError("merge failed")
+
+                sst_compact.SortedTableCompactor._merge_records = failing_merge
+            else:
+                # the range's third file fails halfway through its blocks
+                blocks = itertools.count()
+
+                def failing_format(level_cfg):
+                    record_format = for_level(level_cfg)
+                    encode_block = record_format.encode_block
+
+                    def encode(block, restart_interval):
+                        if next(blocks) == 12:
+                            raise OSError("disk full")
+                        return encode_block(block, restart_interval)
+
+                    record_format.encode_block = encode
+                    return record_format
+
+                sst_format.for_level = failing_format
+
+            try:
+                sst_compact._subcompact(root, config, sst_u.level_dir(root, 0), l0_id, folder, [], None, None, [])
+                assert False, f"{fail_in}: expected the range to fail"
+            except (RuntimeError, OSError):
+                pass
+            assert os.listdir(folder) == [], f"{fail_in}: left {os.listdir(folder)}"
+        finally:
+            sst_compact.SortedTableCompactor._merge_records = merge_records
+            sst_format.for_level = for_level
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_merge_cursors_ties():
+    # a key in several sources comes out once, from the newest (lowest priority) source; tombstones
+    # survive the merge and are dropped only when writing the last level; the output stays sorted
+    root = tempfile.mkdtemp(prefix="lsm-merge-ties-")
+    try:
+        levels = {level: sst_u.SortedLevelConfiguration(block_size=4) for level in (0, 1, 2)}
+        config = sst_u.SortedTableConfiguration(levels=levels, max_level=2)
+        writer = sst_write.SortedTableWriter(root, config)
+        sources = []
+        for s in range(4):
+            # source s holds every (s + 1)th key - key 0 and many others are in several - and deletes some
+            records = [
+                (f"{k:04d}#device", {"data": sst_u.tombstone() if k % 7 == s else {"source": s}, "lsn": f"{4 - s}"})
+                for k in range(0, 120, s + 1)
+            ]
+            sources.append((writer.write(0, 4, records)[1], records))
+
+        expected = {}
+        for _, records in sources:
+            for key, value in records:
+                expected.setdefault(key, value)
+        expected = sorted(expected.items())
+        assert sum(value["data"] == sst_u.tombstone() for _, value in expected) > 1
+
+        reader = sst_read.SortedTableReader(root)
+        folder = sst_u.level_dir(root, 0)
+
+        def cursors():
+            # listed oldest first, so the priorities and not the list order decide the winner
+            return [reader.make_cursor(folder, file_id, s) for s, (file_id, _) in reversed(list(enumerate(sources)))]
+
+        merged = list(sst_compact.merge_cursors(reader, cursors()))
+        assert merged == expected, "Expected the newest source to win every tie"
+        assert all(a[0] < b[0] for a, b in zip(merged, merged[1:])), "Expected sorted, unique keys"
+
+        compactor = sst_compact.SortedTableCompactor(root, config, reader)
+        for level in (1, 2):
+            os.makedirs(sst_u.level_dir(root, level), exist_ok=True)
+            file_ids = compactor._write_merged(level, sst_compact.merge_cursors(reader, cursors()), [])
+            written = [
+                (r["key"], r["value"]) for fid in file_ids for r in reader.scan_file(sst_u.level_dir(root, level), fid)
+            ]
+            if level < config.max_level:
+                assert written == expected, f"L{level}: expected the tombstones kept above the last level"
+            else:
+                assert written == [(key, value) for key, value in expected if value["data"] != sst_u.tombstone()]
+        compactor.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_subcompaction()
+    test_lsm_subcompaction_failure_removes_output()
+    test_lsm_merge_cursors_ties()
+    print("ALL ASSERTIONS PASSED")
@@ -0,0 +1,181 @@
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.sst.cache as sst_cache
+import src.dsa.sst.format as sst_format
+import src.dsa.sst.read as sst_read
+import src.dsa.sst.search as sst_search
+import src.dsa.sst.utility as sst_u
+import src.dsa.sst.write as sst_write
+
+FILES = 4
+BLOCK_SIZE = 8
+
+
+def _records(f: int):
+    return [
+        (f"0001234#file-{f}-device-{n:03d}", {"data": {"temperature": f"{n % 90}F"}, "lsn": f"{f * 1000 + n:026d}"})
+        for n in range(40)
+    ]
+
+
+def _write_files(root: str, reader=None):
+    level_cfg = sst_u.SortedLevelConfiguration(block_size=BLOCK_SIZE)
+    config = sst_u.SortedTableConfiguration(levels={1: level_cfg}, sync_files=False)
+    writer = sst_write.SortedTableWriter(root, config, reader)
+    return writer, {writer.write(1, BLOCK_SIZE, _records(f))[1]: _records(f) for f in range(FILES)}
+
+
+def _data_path(folder: str, file_id: str) -> str:
+    return sst_format.detect(folder, file_id).data_path(folder, file_id)
+
+
+def test_lsm_table_cache_handle_lru():
+    # past max_open_files the least recently used handle is closed; a reused one moves to the back
+    root = tempfile.mkdtemp(prefix="lsm-handles-")
+    try:
+        _, files = _write_files(root)
+        folder = sst_u.level_dir(root, 1)
+        a, b, c, d = files
+        handles = sst_cache.TableHandleCache(2)
+        opened = {}
+        for file_id in (a, b, c):
+            with handles.open(folder, file_id, _data_path(folder, file_id)) as f:
+                opened[file_id] = f
+        assert opened[a].closed, "Expected the oldest handle evicted"
+        assert not opened[b].closed and not opened[c].closed
+
+        # b is now the most recent, so d evicts c
+        with handles.open(folder, b, _data_path(folder, b)) as f:
+            assert f is opened[b], "Expected the open handle reused"
+        with handles.open(folder, d, _data_path(folder, d)) as f:
+            opened[d] = f
+        assert opened[c].closed and not opened[b].closed and not opened[d].closed
+        assert handles.usage() == {"open_files": 2, "capacity": 2, "opens": 4}
+        handles.close_all()
+        assert all(f.closed for f in opened.values())
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_table_cache_pinned_handle():
+    # a handle in use is never closed by eviction; it closes when the reader releases it
+    root = tempfile.mkdtemp(prefix="lsm-handles-pinned-")
+    try:
+        _, files = _write_files(root)
+        folder = sst_u.level_dir(root, 1)
+        a, b, c, _ = files
+        handles = sst_cache.TableHandleCache(1)
+        with handles.open(folder, a, _data_path(folder, a)) as pinned:
+            head = pinned.read(16)
+            for file_id in (b, c):
+                with handles.open(folder, file_id, _data_path(folder, file_id)):
+                    pass
+            assert not pinned.closed, "Expected the pinned handle to survive eviction"
+            assert pinned.seek(0) == 0 and pinned.read(16) == head
+        # eviction passed over it, so it is still pooled and reused
+        with handles.open(folder, a, _data_path(folder, a)) as f:
+            assert f is pinned and not f.closed, "Expected the pinned handle kept in the pool"
+            # removed while in use: closed by the release, not under the reader
+            handles.close_file(folder, a)
+            assert not f.closed and f.seek(0) == 0 and f.read(16) == head
+        assert pinned.closed, "Expected the removed handle closed on release"
+        assert handles.usage()["open_files"] <= 1
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_table_cache_remove_file():
+    # remove_file closes the reader's handle before the data file is unlinked
+    root = tempfile.mkdtemp(prefix="lsm-handles-remove-")
+    remove = os.remove
+    try:
+        reader = sst_read.SortedTableReader(root, block_cache_bytes=1, max_open_files=FILES)
+        writer, files = _write_files(root, reader)
+        folder = sst_u.level_dir(root, 1)
+        search = sst_search.SortedTableSearch(reader)
+        file_id, records = next(iter(files.items()))
+        assert search.search(records[0][0], 1, sst_u.ulid_max()) == records[0][1]
+        handle = reader._handles._tables[(folder, file_id)].file
+        data_path = _data_path(folder, file_id)
+
+        removed = []
+
+        def recording_remove(path):
+            removed.append((path, handle.closed))
+            remove(path)
+
+        os.remove = recording_remove
+        try:
+            writer.remove_file(1, file_id)
+        finally:
+            os.remove = remove
+        assert (data_path, True) in removed, f"Expected the handle closed first: {removed}"
+        assert reader.table_cache_usage()["open_files"] == 0
+    finally:
+        os.remove = remove
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_table_cache_block_lru():
+    # hits and misses are counted; past the byte budget the least recently used block goes first
+    cache = sst_cache.LRUBlockCache(100)
+    cache.put("L1", "a", 0, "block a", 40)
+    cache.put("L1", "b", 0, "block b", 40)
+    assert cache.get("L1", "a", 0) == "block a"
+    cache.put("L1", "c", 0, "block c", 40)
+    assert cache.get("L1", "b", 0) is None, "Expected the least recently used block evicted"
+    assert cache.get("L1", "a", 0) == "block a" and cache.get("L1", "c", 0) == "block c"
+    cache.put("L1", "d", 0, "too big", 101)
+    assert cache.get("L1", "d", 0) is None, "Expected a block over the whole budget left out"
+    cache.evict_file("L1", "a")
+    usage = cache.usage()
+    assert (usage["hits"], usage["misses"], usage["evictions"], usage["invalidations"]) == (3, 2, 1, 1), usage
+    assert usage["blocks"] == 1 and usage["used_bytes"] == 40 and usage["hit_rate"] == 0.6, usage
+
+
+def test_lsm_table_cache_block_reads():
+    # searches fill the reader's block cache: a block read again is a hit until the budget evicts it
+    root = tempfile.mkdtemp(prefix="lsm-block-cache-")
+    try:
+        _, files = _write_files(root)
+        folder = sst_u.level_dir(root, 1)
+        # the first key of every block, in file order
+        probe = sst_read.SortedTableReader(root)
+        keys = [block["first_key"] for file_id in files for block in probe.read_index(folder, file_id)]
+        for key in keys:
+            sst_search.SortedTableSearch(probe).search(key, 1, sst_u.ulid_max())
+        total = probe.block_cache_usage()
+        assert total["blocks"] == len(keys) > FILES and total["misses"] == len(keys) and total["evictions"] == 0
+
+        # room for about half the blocks
+        reader = sst_read.SortedTableReader(root, block_cache_bytes=total["used_bytes"] // 2)
+        search = sst_search.SortedTableSearch(reader)
+        for key in keys:
+            assert search.search(key, 1, sst_u.ulid_max()) is not None
+        usage = reader.block_cache_usage()
+        assert usage["misses"] == len(keys) and usage["hits"] == 0, usage
+        assert 0 < usage["evictions"] < len(keys) and usage["used_bytes"] <= usage["capacity_bytes"], usage
+        assert usage["blocks"] + usage["evictions"] == len(keys), usage
+
+        # the newest block is still cached; the oldest was evicted and is read again
+        search.search(keys[-1], 1, sst_u.ulid_max())
+        assert reader.block_cache_usage()["hits"] == 1
+        search.search(keys[0], 1, sst_u.ulid_max())
+        usage = reader.block_cache_usage()
+        assert usage["hits"] == 1 and usage["misses"] == len(keys) + 1, usage
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_table_cache_handle_lru()
+    test_lsm_table_cache_pinned_handle()
+    test_lsm_table_cache_remove_file()
+    test_lsm_table_cache_block_lru()
+    test_lsm_table_cache_block_reads()
+    print("ALL ASSERTIONS PASSED")
@@ -0,0 +1,247 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.dsa.sst.utility as sst_u
+import src.dsa.sst.write as sst_write
+import src.lsm.wal as lsm_w
+from src.demo.controller import LSMController
+from src.demo.versions import LogSequenceIssuer
+
+
+def _record(n: int):
+    return f"0001234#device-{n}", {"temperature": f"{60 + n}F", "humidity": "40"}, f"{n:026d}"
+
+
+def _replayed(root: str, **kwargs):
+    # what a restart would replay, flattened
+    wal = lsm_w.WriteAheadLog(root, sync_mode="none", **kwargs)
+    records = [tuple(record) for run in wal.records() for record in run]
+    wal.close()
+    return wal, records
+
+
+def _write_segment(root: str, batch=None):
+    # records 0..2 as single frames, then optionally one batch frame; returns the segment path
+    wal = lsm_w.WriteAheadLog(root, sync_mode="none")
+    for n in range(3):
+        wal.append(*_record(n))
+    if batch is not None:
+        wal.append_batch([_record(n) for n in batch])
+    path = wal.path
+    wal.close()
+    return path
+
+
+def _flip_last_byte(path: str):
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+def test_lsm_wal_torn_tail():
+    singles = [_record(n) for n in range(3)]
+    for damage in ("truncate", "corrupt"):
+        root = tempfile.mkdtemp(prefix="lsm-wal-")
+        try:
+            path = _write_segment(root)
+            with open(path, "ab") as f:
+                f.write(lsm_w.encode_record(*_record(3)))
+            if damage == "truncate":
+                os.truncate(path, os.path.getsize(path) - 5)
+            else:
+                _flip_last_byte(path)
+
+            # the damaged last frame is dropped; every intact one before it comes back
+            _, records = _replayed(root)
+            assert records == singles, f"{damage}: replayed {records}"
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_wal_torn_batch():
+    # a batch is one frame: torn anywhere, none of its records replay
+    singles = [_record(n) for n in range(3)]
+    for damage in ("truncate", "corrupt"):
+        root = tempfile.mkdtemp(prefix="lsm-wal-batch-")
+        try:
+            path = _write_segment(root, batch=[10, 11, 12])
+            _, intact = _replayed(root)
+            assert intact == singles + [_record(n) for n in (10, 11, 12)], "Expected the intact batch to replay"
+
+            if damage == "truncate":
+                os.truncate(path, os.path.getsize(path) - 20)
+            else:
+                _flip_last_byte(path)
+            _, records = _replayed(root)
+            assert records == singles, f"{damage}: replayed {records}"
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_wal_truncates_torn_tail_before_appending():
+    # a torn write in the active segment is cut off before the next append, so later records stay readable
+    root = tempfile.mkdtemp(prefix="lsm-wal-append-")
+    try:
+        wal = lsm_w.WriteAheadLog(root, sync_mode="none")
+        wal.append(*_record(0))
+        wal.append(*_record(1))
+        wal.close()
+        intact = os.path.getsize(wal.path)
+        with open(wal.path, "ab") as f:
+            f.write(lsm_w.encode_record(*_record(2))[:-3])
+
+        wal.append(*_record(3))
+        wal.close()
+        assert os.path.getsize(wal.path) == intact + len(lsm_w.encode_record(*_record(3)))
+
+        _, records = _replayed(root)
+        assert records == [_record(0), _record(1), _record(3)], f"replayed {records}"
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_wal_skips_flushed_segments():
+    # segments below the MANIFEST's log_number were flushed before a crash retired them: deleted, never replayed
+    root = tempfile.mkdtemp(prefix="lsm-wal-segments-")
+    try:
+        wal = lsm_w.WriteAheadLog(root, sync_mode="none")
+        for n in range(6):
+            wal.append(*_record(n))
+            if n % 2 == 1:
+                wal.rotate()
+        wal.close()
+        assert wal.segment_numbers() == [1, 2, 3]
+
+        reopened, records = _replayed(root, min_log_number=3)
+        assert records == [_record(4), _record(5)], f"replayed {records}"
+        assert reopened.segment_numbers() == [3], "Expected segments below log_number to be deleted"
+        assert reopened.log_number == 4, "Expected numbering to continue above every segment"
+
+        # a log_number past every segment leaves nothing to replay and numbers above it
+        reopened, records = _replayed(root, min_log_number=7)
+        assert records == [] and reopened.segment_numbers() == []
+        assert reopened.log_number == 7
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+class _FlakyFile:
+    # the segment file, taking at most `chunk` bytes a write() and failing once `fail_after` writes are done
+    def __init__(self, f, chunk: int, fail_after=None):
+        self._f, self._chunk, self._fail_after = f, chunk, fail_after
+
+    def write(self, data):
+        if self._fail_after is not None:
+            if self._fail_after == 0:
+                raise OSError("disk full")
+            self._fail_after -= 1
+        return self._f.write(data[: self._chunk])
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+def test_lsm_wal_write_errors():
+    # short writes are retried to the end; a failed group is cut back out of the segment and reported
+    # to its appenders only, and the log keeps appending after it
+    root = tempfile.mkdtemp(prefix="lsm-wal-errors-")
+    try:
+        wal = lsm_w.WriteAheadLog(root, sync_mode="none")
+        wal.append(*_record(0))
+        wal._file = _FlakyFile(wal._file, chunk=7)
+        wal.append_group([[_record(1)], [_record(2), _record(3)]])
+
+        # the group's first frame goes out whole before the write fails inside its second
+        wal._file = _FlakyFile(wal._file._f, chunk=len(lsm_w.encode_record(*_record(4))) + 5, fail_after=2)
+        try:
+            wal.append_group([[_record(4)], [_record(5), _record(6)]])
+            raise AssertionError("Expected the failed write to raise")
+        except OSError as exc:
+            assert "disk full" in str(exc), exc
+        assert wal._file is None and not wal._failed, "Expected the segment closed and the error taken"
+
+        wal.append(*_record(7))
+        wal.close()
+        _, records = _replayed(root)
+        assert records == [_record(n) for n in (0, 1, 2, 3, 7)], f"replayed {records}"
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _write_legacy_log(path: str, records, torn: bool = False):
+    # the JSONL log of releases before segments: one {"key", "value": {"data", "lsn"}} object per line
+    with open(path, "w", encoding="utf-8") as f:
+        for key, data, lsn in records:
+            f.write(json.dumps({"key": key, "value": {"data": data, "lsn": lsn}}) + "\n")
+        if torn:
+            f.write('{"key": "0001234#device-99", "val')
+
+
+def test_lsm_wal_upgrades_legacy_logs():
+    # frozen wal.<ulid>.jsonl logs and the active wal.jsonl become one segment, oldest first
+    root = tempfile.mkdtemp(prefix="lsm-wal-legacy-")
+    try:
+        l0_dir = sst_u.level_dir(root, 0)
+        os.makedirs(l0_dir)
+        _write_legacy_log(os.path.join(l0_dir, "wal.01M56D40000000000000000000.jsonl"), [_record(0), _record(1)])
+        _write_legacy_log(os.path.join(l0_dir, "wal.01M56D50000000000000000000.jsonl"), [_record(2)])
+        _write_legacy_log(os.path.join(l0_dir, "wal.jsonl"), [_record(3), _record(4)], torn=True)
+
+        wal, records = _replayed(root, min_log_number=3)
+        assert records == [_record(n) for n in range(5)], f"replayed {records}"
+        assert wal.segment_numbers() == [3] and wal.log_number == 4
+        assert sorted(os.listdir(l0_dir)) == ["wal-000003.log"], "Expected the JSONL logs to be retired"
+
+        # the converted segment belongs to the memtable it is replayed into
+        wal = lsm_w.WriteAheadLog(root, sync_mode="none")
+        assert wal.rotate() == [3]
+        wal.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_lsm_wal_opens_baseline_directory():
+    # a data directory of the first release: L0 SSTables without a MANIFEST and unflushed writes in wal.jsonl
+    root = tempfile.mkdtemp(prefix="lsm-wal-baseline-")
+    try:
+        flushed = [(f"0001234#device-{n}", {"data": {"n": n}, "lsn": f"{n:026d}"}) for n in range(10, 20)]
+        sst_write.SortedTableWriter(root).write(0, 10, flushed)
+        unflushed = [_record(n) for n in range(5)] + [("0001234#device-10", sst_u.tombstone(), f"{30:026d}")]
+        _write_legacy_log(os.path.join(sst_u.level_dir(root, 0), "wal.jsonl"), unflushed)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctrl = LSMController(LogSequenceIssuer(), data_path=root, wal_sync_mode="none")
+            ctrl.restore_memtable_wal()
+            keys = [key for key, _, _ in unflushed] + [key for key, _ in flushed[1:]]
+            expected = [data for _, data, _ in unflushed[:-1]] + [None] + [value["data"] for _, value in flushed[1:]]
+            assert ctrl.lookup(keys) == expected, "Expected the old log and SSTables to read back"
+            ctrl.close()
+
+            # converted once: a second start replays the segment, not the (deleted) JSONL log
+            assert not os.path.exists(os.path.join(sst_u.level_dir(root, 0), "wal.jsonl"))
+            ctrl = LSMController(LogSequenceIssuer(), data_path=root, wal_sync_mode="none")
+            ctrl.restore_memtable_wal()
+            assert ctrl.lookup(keys) == expected
+            ctrl.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_lsm_wal_torn_tail()
+    test_lsm_wal_torn_batch()
+    test_lsm_wal_truncates_torn_tail_before_appending()
+    test_lsm_wal_skips_flushed_segments()
+    test_lsm_wal_write_errors()
+    test_lsm_wal_upgrades_legacy_logs()
+    test_lsm_wal_opens_baseline_directory()
+    print("ALL ASSERTIONS PASSED")